@@ -1,15 +1,53 @@
-from flask import Flask, jsonify, render_template
+from flask import Flask, g, jsonify, render_template
 from flask_restful import Api
 
 from resource.concept import ConceptResource, ConceptResourceByID
 from resource.tag import TagResource, TagResourceByID, TagResourceByValue
 from resource.object import ObjectResource, ObjectResourceByID
-from resource.blob import BlobResourceByURI
+from resource.blob import BlobResource, BlobResourceByDigest, \
+    BlobResourceByURI, BlobDataResource, BlobMissingResource
 from resource.meta import get_all_meta
 
+from objectcube.contexts import UnitOfWork
+from objectcube.factory import warm_up
+
 app = Flask(__name__)
 api = Api(app)
 
+
+# Resources are created per request and look up their services then, so
+# the shared service instances are created once, before the first request
+# is handled. Not on import, as importing the app, e.g. in tests or in a
+# master process that forks workers, should not open the blob store
+@app.before_first_request
+def warm_up_services():
+    warm_up()
+
+
+# Each HTTP request runs in one unit of work, so all service calls made
+# while handling it share one connection and commit once at the end.
+# Resources turn errors into responses, so only a successful response
+# commits, and error responses roll back whatever was written before
+@app.before_request
+def begin_unit_of_work():
+    g.unit_of_work = UnitOfWork().begin()
+
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def end_unit_of_work(exception):
+    unit_of_work = getattr(g, 'unit_of_work', None)
+    if unit_of_work is not None:
+        status = getattr(g, 'response_status', None)
+        unit_of_work.end(commit=exception is None and status is not None
+                         and status < 400)
+
+
 # Concept API
 api.add_resource(ConceptResource, '/api/concepts')
 api.add_resource(ConceptResourceByID, '/api/concepts/<int:id_>')
@@ -25,6 +63,10 @@ api.add_resource(ObjectResourceByID, '/api/objects/<int:id_>')
 
 # Blob API
 api.add_resource(BlobResourceByURI, '/api/blobs/uri/<string:digest>')
+api.add_resource(BlobDataResource, '/api/blobs/<string:digest>/data')
+api.add_resource(BlobResource, '/api/blobs')
+api.add_resource(BlobMissingResource, '/api/blobs/missing')
+api.add_resource(BlobResourceByDigest, '/api/blobs/<string:digest>')
 
 
 @app.route('/api/description')
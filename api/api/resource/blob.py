@@ -1,12 +1,20 @@
+import json
 from datetime import datetime
 
-from flask import request
+from flask import Response, request
 from flask_restful import Resource
+from werkzeug.datastructures import ContentRange
+from werkzeug.wsgi import wrap_file
 
 from meta import api_metable
 
+from objectcube.exceptions import ObjectCubeException
 from objectcube.factory import get_service
 
+# Blobs are named by their content, so a response for a digest can be
+# cached for good
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 
 @api_metable
 class BlobResourceByURI(Resource):
@@ -41,7 +49,14 @@ class BlobResourceByURI(Resource):
             return self.description
 
         a = datetime.now()
-        blob = self.blob_service.retrieve_uri(digest)
+        try:
+            blob = self.blob_service.retrieve_uri(digest)
+        except ObjectCubeException as ex:
+            # Compressed and packed blobs have no URI, their data is
+            # downloaded from BlobDataResource instead
+            if self.blob_service.has(digest):
+                return ex.message, 409
+            return 'No blob found by digest {}'.format(digest), 404
         b = datetime.now()
 
         response_object = {
@@ -52,3 +67,226 @@ class BlobResourceByURI(Resource):
         }
 
         return response_object, 200
+
+
+@api_metable
+class BlobDataResource(Resource):
+    ep_name = 'api/blobs/<digest>/data'
+    description = {
+        'endpoint': ep_name,
+        'title': 'Blob data',
+        'description': 'Endpoint for downloading the data of blobs. '
+                       'Supports a single byte range in the Range header, '
+                       'and If-None-Match with the digest as ETag',
+        'methods': {
+            'get': {
+                'params': [
+                    {
+                        'name': 'digest',
+                        'label': 'Digest',
+                        'type': 'string',
+                        'required': True,
+                        'description': 'Digest of the blob to download'
+                    }
+                ]
+            }
+        }
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(BlobDataResource, self).__init__(*args, **kwargs)
+        self.blob_service = get_service('BlobService')
+
+    def get(self, digest):
+        if 'description' in request.args:
+            return self.description
+
+        try:
+            size = self.blob_service.get_size(digest)
+        except ObjectCubeException:
+            return 'No blob found by digest {}'.format(digest), 404
+
+        if request.if_none_match.contains(digest):
+            return self._response(digest, None, 304)
+
+        # A Range with several parts is answered with the whole blob, and
+        # If-Range can only name this digest, as the data never changes
+        byte_range = request.range
+        if byte_range is not None and byte_range.units == 'bytes' \
+                and len(byte_range.ranges) == 1 \
+                and request.if_range.etag in (None, digest):
+            span = byte_range.range_for_length(size)
+            if span is None:
+                response = self._response(digest, None, 416)
+                response.content_range = ContentRange('bytes', None, None,
+                                                      size)
+                return response
+
+            start, stop = span
+            response = self._response(
+                digest, self.blob_service.iter_data(digest, start,
+                                                    stop - start), 206)
+            response.content_range = ContentRange('bytes', start, stop, size)
+            response.content_length = stop - start
+            return response
+
+        # The server may send a whole file without reading it in Python
+        try:
+            f = self.blob_service.open_data(digest)
+        except ObjectCubeException:
+            return 'No blob found by digest {}'.format(digest), 404
+        response = self._response(digest, wrap_file(request.environ, f),
+                                  200)
+        response.content_length = size
+        return response
+
+    def _response(self, digest, body, status):
+        # Streamed bodies are passed through to the server untouched
+        response = Response(body, status,
+                            mimetype='application/octet-stream',
+                            direct_passthrough=True)
+        response.set_etag(digest)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+
+@api_metable
+class BlobResource(Resource):
+    ep_name = 'api/blobs'
+    description = {
+        'endpoint': ep_name,
+        'title': 'Blob uploads',
+        'description': 'Endpoint for uploading blobs whose digest is not '
+                       'known. The request body is the data of the blob',
+        'methods': {
+            'post': {
+                'params': []
+            }
+        }
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(BlobResource, self).__init__(*args, **kwargs)
+        self.blob_service = get_service('BlobService')
+
+    def get(self):
+        if 'description' in request.args:
+            return self.description
+        return 'Blobs are fetched by digest', 405
+
+    def post(self):
+        # The body is read from the stream while it is hashed and written,
+        # and is never held in memory
+        digest = self.blob_service.add(request.stream)
+        return {'digest': digest}, 201
+
+
+@api_metable
+class BlobResourceByDigest(Resource):
+    ep_name = 'api/blobs/<digest>'
+    description = {
+        'endpoint': ep_name,
+        'title': 'Blobs by digest',
+        'description': 'Endpoint for checking and uploading single blobs. '
+                       'Check whether a blob exists with HEAD before '
+                       'uploading it with PUT; an existing blob is not '
+                       'uploaded again',
+        'methods': {
+            'get': {
+                'params': [
+                    {
+                        'name': 'digest',
+                        'label': 'Digest',
+                        'type': 'string',
+                        'required': True,
+                        'description': 'Digest of the blob'
+                    }
+                ]
+            },
+            'put': {
+                'params': [
+                    {
+                        'name': 'digest',
+                        'label': 'Digest',
+                        'type': 'string',
+                        'required': True,
+                        'description': 'Digest of the data in the request '
+                                       'body'
+                    }
+                ]
+            }
+        }
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(BlobResourceByDigest, self).__init__(*args, **kwargs)
+        self.blob_service = get_service('BlobService')
+
+    def get(self, digest):
+        if 'description' in request.args:
+            return self.description
+
+        try:
+            size = self.blob_service.get_size(digest)
+        except ObjectCubeException:
+            return 'No blob found by digest {}'.format(digest), 404
+        return {'digest': digest, 'size': size}, 200
+
+    def put(self, digest):
+        # Answer before reading the body, so a client that waits for
+        # "100 Continue" does not send it at all
+        if self.blob_service.has(digest):
+            return {'digest': digest}, 200
+
+        try:
+            self.blob_service.add(request.stream, digest=digest)
+        except ObjectCubeException as ex:
+            return ex.message, 400
+        return {'digest': digest}, 201
+
+
+@api_metable
+class BlobMissingResource(Resource):
+    ep_name = 'api/blobs/missing'
+    description = {
+        'endpoint': ep_name,
+        'title': 'Missing blobs',
+        'description': 'Endpoint for finding which of many blobs have not '
+                       'been uploaded',
+        'methods': {
+            'post': {
+                'params': [
+                    {
+                        'name': 'digests',
+                        'label': 'Digests',
+                        'type': 'array',
+                        'required': True,
+                        'description': 'Digests to check'
+                    }
+                ]
+            }
+        }
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(BlobMissingResource, self).__init__(*args, **kwargs)
+        self.blob_service = get_service('BlobService')
+
+    def get(self):
+        if 'description' in request.args:
+            return self.description
+        return 'Digests must be posted', 405
+
+    def post(self):
+        data = json.loads(request.data or 'null')
+        digests = data.get('digests') if isinstance(data, dict) else None
+        if not isinstance(digests, list) \
+                or not all(isinstance(d, basestring) for d in digests):
+            return 'Missing list of digests', 400
+
+        # Blobs that are not uploaded again must survive until the objects
+        # that refer to them are posted, so their grace period starts over
+        found = self.blob_service.touch_many(digests)
+        return {'missing': [digest for digest in digests
+                            if not found[digest]]}, 200
@@ -5,6 +5,7 @@ from flask import request
 from flask_restful import Resource
 
 from meta import api_metable
+from cursor import decode_cursor, next_link
 
 from objectcube.data_objects import Concept
 from objectcube.factory import get_service
@@ -38,6 +39,14 @@ class ConceptResource(Resource):
                         'min': 0,
                         'default': 0,
                         'description': 'Page number to retrieve'
+                    },
+                    {
+                        'name': 'cursor',
+                        'label': 'Cursor',
+                        'type': 'string',
+                        'required': False,
+                        'description': 'Cursor from meta.next of the '
+                                       'previous page'
                     }
                 ]
             },
@@ -74,20 +83,23 @@ class ConceptResource(Resource):
 
         page = long(request.args.get('page', 0))
         limit = long(request.args.get('limit', 20))
+        try:
+            after_id = decode_cursor(request.args.get('cursor'))
+        except ValueError as ex:
+            return ex.message, 400
 
         a = datetime.now()
         concept_count = self.concept_service.count()
         concepts = [t.to_dict() for
                     t in self.concept_service.retrieve(
-                    limit=limit, offset=page * limit)]
+                    limit=limit, offset=page * limit, after_id=after_id)]
         b = datetime.now()
 
         response_object = {
             'meta': {
                 'time': (b - a).microseconds / 1000.0,
                 'count': concept_count,
-                'next': self.ep_name + '?page={}&limit={}'
-                .format(page + 1, limit)
+                'next': next_link(self.ep_name, concepts, limit)
             },
             'concepts': concepts
         }
@@ -0,0 +1,41 @@
+import base64
+import urllib
+
+
+def encode_cursor(id_):
+    """
+    Encodes the id of the last item on a page as an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(str(id_)).rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor made by encode_cursor to the id to continue after.
+    A missing cursor starts from the beginning.
+    :raises ValueError: if the cursor is not valid
+    """
+    if not cursor:
+        return 0L
+    try:
+        padded = str(cursor) + '=' * (-len(cursor) % 4)
+        id_ = long(base64.urlsafe_b64decode(padded))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor {0}'.format(cursor))
+    if id_ < 0:
+        raise ValueError('Invalid cursor {0}'.format(cursor))
+    return id_
+
+
+def next_link(ep_name, items, limit, **args):
+    """
+    Builds the link to the page after the given items, or None if the
+    items are the last page.
+    """
+    if not items or len(items) < limit:
+        return None
+    args['cursor'] = encode_cursor(items[-1]['id'])
+    args['limit'] = limit
+    query = [(k, v.encode('utf-8') if isinstance(v, unicode) else v)
+             for (k, v) in sorted(args.items())]
+    return '/' + ep_name + '?' + urllib.urlencode(query)
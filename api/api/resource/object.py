@@ -5,9 +5,10 @@ from flask import request
 from flask_restful import Resource
 
 from meta import api_metable
+from cursor import decode_cursor, next_link
 
 from objectcube.data_objects import Object
-from objectcube.utils import md5_from_value
+from objectcube.exceptions import ObjectCubeException
 from objectcube.factory import get_service
 
 
@@ -39,6 +40,23 @@ class ObjectResource(Resource):
                         'min': 0,
                         'default': 0,
                         'description': 'Page number to retrieve'
+                    },
+                    {
+                        'name': 'cursor',
+                        'label': 'Cursor',
+                        'type': 'string',
+                        'required': False,
+                        'description': 'Cursor from meta.next of the '
+                                       'previous page'
+                    },
+                    {
+                        'name': 'filter',
+                        'label': 'Filter',
+                        'type': 'string',
+                        'required': False,
+                        'description': 'Only objects with matching tags, '
+                                       'e.g. beach AND "2014" AND NOT '
+                                       '(people OR id:42)'
                     }
                 ]
             },
@@ -55,8 +73,8 @@ class ObjectResource(Resource):
                         'name': 'digest',
                         'label': 'Digest',
                         'type': 'string',
-                        'required': False,
-                        'description': 'Digest for the object'
+                        'required': True,
+                        'description': 'Digest of the blob of the object'
                     }
                 ]
             }
@@ -66,6 +84,7 @@ class ObjectResource(Resource):
     def __init__(self, *args, **kwargs):
         super(ObjectResource, self).__init__(*args, **kwargs)
         self.object_service = get_service('ObjectService')
+        self.blob_service = get_service('BlobService')
 
     def get(self):
         if 'description' in request.args:
@@ -73,19 +92,36 @@ class ObjectResource(Resource):
 
         page = long(request.args.get('page', 0))
         limit = long(request.args.get('limit', 20))
+        try:
+            after_id = decode_cursor(request.args.get('cursor'))
+        except ValueError as ex:
+            return ex.message, 400
 
+        expression = request.args.get('filter')
         a = datetime.now()
-        object_count = self.object_service.count()
-        objects = [o.to_dict() for o in self.object_service.retrieve(
-            limit=limit, offset=page * limit)]
+        if expression:
+            try:
+                object_count = self.object_service.count_by_filter(
+                    expression)
+                objects = self.object_service.retrieve_by_filter(
+                    expression, limit=limit, offset=page * limit,
+                    after_id=after_id)
+            except ObjectCubeException as ex:
+                return ex.message, 400
+            link_args = {'filter': expression}
+        else:
+            object_count = self.object_service.count()
+            objects = self.object_service.retrieve(
+                limit=limit, offset=page * limit, after_id=after_id)
+            link_args = {}
+        objects = [o.to_dict() for o in objects]
         b = datetime.now()
 
         response_object = {
             'meta': {
                 'time': (b - a).microseconds / 1000.0,
                 'count': object_count,
-                'next': self.ep_name + '?page={}&limit={}'
-                .format(page + 1, limit)
+                'next': next_link(self.ep_name, objects, limit, **link_args)
             },
             'objects': objects
         }
@@ -104,8 +140,14 @@ class ObjectResource(Resource):
         else:
             name = unicode(name)
 
+        # The blob is uploaded first, see BlobResourceByDigest
         if digest is None:
-            digest = unicode(md5_from_value(name))
+            return 'Object must have a digest', 400
+        else:
+            digest = unicode(digest)
+        # Renewed, so the blob is not collected before the object is added
+        if not self.blob_service.touch(digest):
+            return 'No blob found by digest {}'.format(digest), 400
         try:
             object_ = self.object_service.add(Object(name=name, digest=digest))
         except Exception as ex:
@@ -5,6 +5,7 @@ from flask import request
 from flask_restful import Resource
 
 from meta import api_metable
+from cursor import decode_cursor, next_link
 
 from objectcube.data_objects import Tag
 from objectcube.factory import get_service
@@ -38,7 +39,15 @@ class TagResource(Resource):
                         'default': 0,
                         'description': 'Page number to view'
                     },
-                    ]
+                    {
+                        'name': 'cursor',
+                        'label': 'Cursor',
+                        'type': 'string',
+                        'required': False,
+                        'description': 'Cursor from meta.next of the '
+                                       'previous page'
+                    }
+                ]
             },
             'post': {
                 'params': [
@@ -81,20 +90,23 @@ class TagResource(Resource):
 
         page = long(request.args.get('page', 0))
         limit = long(request.args.get('limit', 20))
+        try:
+            after_id = decode_cursor(request.args.get('cursor'))
+        except ValueError as ex:
+            return ex.message, 400
 
         a = datetime.now()
         tag_count = self.tag_service.count()
         tags = [t.to_dict() for
                 t in self.tag_service.retrieve(
-                limit=limit, offset=page * limit)]
+                limit=limit, offset=page * limit, after_id=after_id)]
         b = datetime.now()
 
         response_object = {
             'meta': {
                 'time': (b - a).microseconds / 1000.0,
                 'count': tag_count,
-                'next': self.ep_name + '?page={}&limit={}'
-                .format(page + 1, limit)
+                'next': next_link(self.ep_name, tags, limit)
             },
             'tags': tags
         }
@@ -287,6 +299,14 @@ class TagResourceByValue(Resource):
                         'min': 0,
                         'default': 0,
                         'description': 'Page number to view'
+                    },
+                    {
+                        'name': 'cursor',
+                        'label': 'Cursor',
+                        'type': 'string',
+                        'required': False,
+                        'description': 'Cursor from meta.next of the '
+                                       'previous page'
                     }
                 ]
             }
@@ -306,11 +326,16 @@ class TagResourceByValue(Resource):
             return 'Missing tag value', 400
         page = long(request.args.get('page', 0))
         limit = long(request.args.get('limit', 20))
+        try:
+            after_id = decode_cursor(request.args.get('cursor'))
+        except ValueError as ex:
+            return ex.message, 400
 
         a = datetime.now()
         tags = [t.to_dict() for
                 t in self.tag_service.retrieve_by_value(
-                value=value, limit=limit, offset=page * limit)]
+                value=value, limit=limit, offset=page * limit,
+                after_id=after_id)]
         b = datetime.now()
 
         if not tags:
@@ -319,8 +344,7 @@ class TagResourceByValue(Resource):
         response_object = {
             'meta': {
                 'time': (b - a).microseconds / 1000.0,
-                'next': self.ep_name + '?page={}&limit={}'
-                .format(page + 1, limit)
+                'next': next_link(self.ep_name, tags, limit, value=value)
             },
             'tags': tags
         }
@@ -14,3 +14,7 @@ class TestAPIBlobResourceByURI(APITest):
         res = self.get(self.base_url + '1?description')
         data = json.loads(res.data)
         self.assertTrue(data.get('endpoint') == 'api/blobs/uri/<digest>')
+
+    def test_get_unknown_digest_returns_404(self):
+        res = self.get(self.base_url + 'nothing')
+        self.assertEqual(res.status_code, 404)
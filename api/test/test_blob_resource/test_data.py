@@ -0,0 +1,68 @@
+import cStringIO
+
+from api import app
+from api.test import APITest
+
+from objectcube.factory import get_service
+
+
+class TestAPIBlobDataResource(APITest):
+    def __init__(self, *args, **kwargs):
+        super(TestAPIBlobDataResource, self).__init__(*args, **kwargs)
+        self.app = app.test_client()
+        self.blob_service = get_service('BlobService')
+
+    def setUp(self):
+        super(TestAPIBlobDataResource, self).setUp()
+        self.blob_service.flush()
+        self.data = '0123456789' * 10
+        self.digest = self.blob_service.add(cStringIO.StringIO(self.data))
+        self.url = '/api/blobs/{0}/data'.format(self.digest)
+
+    def test_get_returns_blob_data(self):
+        res = self.app.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data, self.data)
+        self.assertEqual(res.content_length, len(self.data))
+        self.assertEqual(res.headers['ETag'], '"{0}"'.format(self.digest))
+        self.assertIn('immutable', res.headers['Cache-Control'])
+
+    def test_get_returns_404_if_blob_is_not_found(self):
+        res = self.app.get('/api/blobs/nothing/data')
+        self.assertEqual(res.status_code, 404)
+
+    def test_get_returns_304_if_etag_matches(self):
+        res = self.app.get(self.url, headers=[
+            ('If-None-Match', '"{0}"'.format(self.digest))])
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, '')
+
+        res = self.app.get(self.url, headers=[('If-None-Match', '"other"')])
+        self.assertEqual(res.status_code, 200)
+
+    def test_get_returns_byte_range(self):
+        res = self.app.get(self.url, headers=[('Range', 'bytes=10-19')])
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(res.data, self.data[10:20])
+        self.assertEqual(res.headers['Content-Range'],
+                         'bytes 10-19/{0}'.format(len(self.data)))
+
+        res = self.app.get(self.url, headers=[('Range', 'bytes=-5')])
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(res.data, self.data[-5:])
+
+    def test_get_returns_416_if_range_is_not_satisfiable(self):
+        res = self.app.get(self.url, headers=[('Range', 'bytes=500-')])
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res.headers['Content-Range'],
+                         'bytes */{0}'.format(len(self.data)))
+
+    def test_get_ignores_range_if_etag_does_not_match_if_range(self):
+        res = self.app.get(self.url, headers=[('Range', 'bytes=10-19'),
+                                              ('If-Range', '"other"')])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data, self.data)
+
+    def test_get_description_query_parameter_returns_description(self):
+        res = self.app.get(self.url + '?description')
+        self.assertIn('api/blobs/<digest>/data', res.data)
@@ -0,0 +1,86 @@
+import cStringIO
+import json
+import os
+
+from api import app
+from api.test import APITest
+
+from objectcube.factory import get_service
+from objectcube.utils import md5_from_value
+
+
+class TestAPIBlobUpload(APITest):
+    def __init__(self, *args, **kwargs):
+        super(TestAPIBlobUpload, self).__init__(*args, **kwargs)
+        self.app = app.test_client()
+        self.blob_service = get_service('BlobService')
+
+    def setUp(self):
+        super(TestAPIBlobUpload, self).setUp()
+        self.blob_service.flush()
+
+    def test_post_stores_blob_and_returns_digest(self):
+        res = self.app.post('/api/blobs', data='some-data')
+        self.assertEqual(res.status_code, 201)
+        digest = json.loads(res.data)['digest']
+        self.assertEqual(digest, md5_from_value('some-data'))
+        self.assertEqual(self.blob_service.get_data(digest).read(),
+                         'some-data')
+
+    def test_head_returns_404_if_blob_is_not_found(self):
+        res = self.app.head('/api/blobs/' + md5_from_value('some-data'))
+        self.assertEqual(res.status_code, 404)
+
+    def test_get_returns_size_of_blob(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        res = self.app.head('/api/blobs/' + digest)
+        self.assertEqual(res.status_code, 200)
+        res = self.app.get('/api/blobs/' + digest)
+        self.assertEqual(json.loads(res.data),
+                         {'digest': digest, 'size': len('some-data')})
+
+    def test_put_stores_blob(self):
+        digest = md5_from_value('some-data')
+        res = self.app.put('/api/blobs/' + digest, data='some-data')
+        self.assertEqual(res.status_code, 201)
+        self.assertTrue(self.blob_service.has(digest))
+
+    def test_put_skips_existing_blob(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        res = self.app.put('/api/blobs/' + digest, data='other-data')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.blob_service.get_data(digest).read(),
+                         'some-data')
+
+    def test_put_returns_400_if_digest_does_not_match_data(self):
+        digest = md5_from_value('some-data')
+        res = self.app.put('/api/blobs/' + digest, data='other-data')
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(self.blob_service.has(digest))
+
+    def test_post_missing_returns_digests_not_stored(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        other = md5_from_value('other-data')
+        res = self.post('/api/blobs/missing',
+                        data={'digests': [digest, other]})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), {'missing': [other]})
+
+    def test_post_missing_renews_blobs_not_to_be_uploaded(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        path = self.blob_service._get_blob_path(digest)
+        os.utime(path, (0, 0))
+        res = self.post('/api/blobs/missing', data={'digests': [digest]})
+        self.assertEqual(json.loads(res.data), {'missing': []})
+
+        # The object referring to the blob is not posted yet
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [], dry_run=False, grace_period=60, pause=0)
+        self.assertEqual(report['removed'], 0)
+        self.assertTrue(self.blob_service.has(digest))
+
+    def test_post_missing_returns_400_without_digests(self):
+        res = self.post('/api/blobs/missing', data={'digests': 'x'})
+        self.assertEqual(res.status_code, 400)
+        res = self.post('/api/blobs/missing', data=None)
+        self.assertEqual(res.status_code, 400)
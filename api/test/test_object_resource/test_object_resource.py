@@ -1,7 +1,11 @@
+import cStringIO
 import json
+import urllib
 
 from api import app
 from api.test import APITest
+from objectcube.data_objects import Object, Tag, Tagging
+from objectcube.factory import get_service
 
 
 class TestAPIObjectResource(APITest):
@@ -10,9 +14,16 @@ class TestAPIObjectResource(APITest):
         self.base_url = '/api/objects'
         self.app = app.test_client()
 
-    def _post_test_object(self):
+    def setUp(self):
+        super(TestAPIObjectResource, self).setUp()
+        # Objects are created for blobs uploaded before
+        self.digest = get_service('BlobService').add(
+            cStringIO.StringIO('obj_data'))
+
+    def _post_test_object(self, name='obj_name'):
         data = {
-            'name': 'obj_name'
+            'name': name,
+            'digest': self.digest
         }
         res = self.post(self.base_url, data=data)
         self.assertEqual(res.status_code, 201)
@@ -48,25 +59,82 @@ class TestAPIObjectResource(APITest):
     def test_post_with_digest_uses_digest(self):
         data = {
             'name': 'obj_name',
-            'digest': 'testdig'
+            'digest': self.digest
         }
         res = self.post(self.base_url, data=data)
         self.assertEqual(res.status_code, 201)
         data = json.loads(res.data)
-        self.assertEqual(data.get('digest'), 'testdig')
+        self.assertEqual(data.get('digest'), self.digest)
+
+    def test_post_with_digest_of_missing_blob_returns_400(self):
+        data = {
+            'name': 'obj_name',
+            'digest': 'testdig'
+        }
+        res = self.post(self.base_url, data=data)
+        self.assertEqual(res.status_code, 400)
 
-    def test_post_with_no_digest_creates_digest(self):
+    def test_post_with_no_digest_returns_400(self):
         data = {
             'name': 'obj_name'
         }
         res = self.post(self.base_url, data=data)
-        self.assertEqual(res.status_code, 201)
-        data = json.loads(res.data)
-        self.assertTrue(data.get('digest'), False)
+        self.assertEqual(res.status_code, 400)
 
     def test_post_with_no_name_returns_400(self):
         data = {
-            'digest': 'testdig'
+            'digest': self.digest
         }
         res = self.post(self.base_url, data=data)
         self.assertEqual(res.status_code, 400)
+
+    def test_get_objects_next_cursor_continues_after_last_object(self):
+        # Objects are unique by name and digest
+        for i in range(3):
+            self._post_test_object('obj_name_{0}'.format(i))
+        data = json.loads(self.get(self.base_url + '?limit=2').data)
+        self.assertEqual(len(data.get('objects')), 2)
+        self.assertTrue(data['meta']['next'])
+
+        rest = json.loads(self.get(data['meta']['next']).data)
+        self.assertEqual(len(rest.get('objects')), 1)
+        self.assertGreater(rest['objects'][0]['id'],
+                           data['objects'][-1]['id'])
+        self.assertIsNone(rest['meta']['next'])
+
+    def test_get_objects_with_invalid_cursor_returns_400(self):
+        res = self.get(self.base_url + '?cursor=not-a-cursor')
+        self.assertEqual(res.status_code, 400)
+
+    def _create_tagged_objects(self):
+        object_service = get_service('ObjectService')
+        tag_service = get_service('TagService')
+        tagging_service = get_service('TaggingService')
+        beach, people = [tag_service.add(Tag(value=value, description=u'D',
+                                             mutable=False, type=1L))
+                         for value in [u'beach', u'people']]
+        objects = []
+        for i, tags in enumerate([[beach], [beach, people], [people],
+                                  [beach]]):
+            object_ = object_service.add(Object(name=u'O' + unicode(i),
+                                                digest=u'D' + unicode(i)))
+            for tag in tags:
+                tagging_service.add(Tagging(tag_id=tag.id,
+                                            object_id=object_.id))
+            objects.append(object_)
+        return objects
+
+    def test_get_objects_with_filter_returns_matching_objects(self):
+        objects = self._create_tagged_objects()
+        url = self.base_url + '?' + urllib.urlencode(
+            {'filter': 'beach AND NOT people', 'limit': 1})
+        data = json.loads(self.get(url).data)
+        self.assertEqual(data['meta']['count'], 2)
+        self.assertEqual([o['id'] for o in data['objects']], [objects[0].id])
+
+        rest = json.loads(self.get(data['meta']['next']).data)
+        self.assertEqual([o['id'] for o in rest['objects']], [objects[3].id])
+
+    def test_get_objects_with_invalid_filter_returns_400(self):
+        res = self.get(self.base_url + '?filter=' + urllib.quote('(beach'))
+        self.assertEqual(res.status_code, 400)
@@ -1,7 +1,9 @@
+import cStringIO
 import json
 
 from api import app
 from api.test import APITest
+from objectcube.factory import get_service
 
 
 class TestAPIObjectResourceByID(APITest):
@@ -10,10 +12,15 @@ class TestAPIObjectResourceByID(APITest):
         self.base_url = '/api/objects'
         self.app = app.test_client()
 
+    def setUp(self):
+        super(TestAPIObjectResourceByID, self).setUp()
+        self.digest = get_service('BlobService').add(
+            cStringIO.StringIO('obj_data'))
+
     def _create_test_object(self):
         data = {
             'name': u'obj_name',
-            'digest': u'testdig'
+            'digest': self.digest
         }
         res = self.post(self.base_url, data=data)
         self.assertEqual(res.status_code, 201)
@@ -0,0 +1,42 @@
+"""
+Benchmarks for ObjectCube. Each module can be run on its own, e.g.
+
+    python -m benchmark.tagging_add_many
+
+Benchmarks that use the database reset it with schema.sql first, so they
+must only be pointed at a test database.
+"""
+import time
+
+from objectcube.contexts import Connection
+
+
+def reset_schema():
+    with open('schema.sql') as fd:
+        data = ''.join(fd.readlines())
+
+    with Connection() as c:
+        with c.cursor() as cursor:
+            cursor.execute(data)
+
+
+def timed(function, *args, **kwargs):
+    """
+    Calls the function and returns a tuple of its result and the
+    wall clock time it took, in seconds.
+    """
+    start = time.time()
+    result = function(*args, **kwargs)
+    return result, time.time() - start
+
+
+def report(title, rows):
+    """
+    Prints a table of results, one (label, value, ...) tuple per row.
+    """
+    print(title)
+    print('-' * len(title))
+    for row in rows:
+        print('  {0:<40} {1}'.format(row[0], '  '.join(
+            str(value) for value in row[1:])))
+    print('')
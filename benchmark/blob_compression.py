@@ -0,0 +1,102 @@
+"""
+Measures the disk space saved and the CPU time spent by compressing blobs
+in FileBlobService, at several zlib levels, over a mixed corpus of XML
+sidecars, JSON exports, uncompressed TIFF previews and JPEG images. Does
+not use the database.
+"""
+import cStringIO
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from benchmark import timed, report
+from objectcube import settings
+from objectcube.services.impl.filesystem.blob_service import \
+    CATALOG_NAME, FileBlobService
+
+
+def xml_sidecar(i):
+    return ''.join('<rdf:li xmp:key="{0}-{1}">{2}</rdf:li>\n'.format(
+        i, n, random.random()) for n in range(200))
+
+
+def json_export(i):
+    return json.dumps([{'id': i * 1000 + n, 'name': 'object-{0}'.format(n),
+                        'tags': [random.randint(0, 100) for _ in range(5)]}
+                       for n in range(500)])
+
+
+def tiff_preview(i):
+    # A smooth gradient with some noise, like an uncompressed photo
+    row = ''.join(chr((x + i) % 256) for x in range(1024))
+    return 'II*\x00' + ''.join(row[y % 7:] + row[:y % 7] for y in range(512))
+
+
+def jpeg_image(i):
+    return '\xff\xd8\xff\xe0' + os.urandom(2**19)
+
+
+KINDS = [('XML sidecars', xml_sidecar, 200),
+         ('JSON exports', json_export, 50),
+         ('TIFF previews', tiff_preview, 20),
+         ('JPEG images', jpeg_image, 20)]
+
+
+def disk_usage(location):
+    size = 0
+    for path, _, names in os.walk(location):
+        size += sum(os.path.getsize(os.path.join(path, name))
+                    for name in names if not name.startswith(CATALOG_NAME))
+    return size
+
+
+def add_all(blob_service, blobs):
+    return [blob_service.add(cStringIO.StringIO(data)) for data in blobs]
+
+
+def read_all(blob_service, digests):
+    return sum(len(blob_service.get_data(digest).read())
+               for digest in digests)
+
+
+def main(*levels):
+    levels = levels or (0, 1, 6, 9)
+    random.seed(1)
+    corpus = [(label, [make(i) for i in range(count)])
+              for label, make, count in KINDS]
+    corpus.append(('All', [data for _, blobs in corpus for data in blobs]))
+
+    original_level = settings.BLOB_COMPRESSION_LEVEL
+    try:
+        for label, blobs in corpus:
+            size = sum(len(data) for data in blobs)
+            rows = []
+            for level in levels:
+                settings.BLOB_COMPRESSION_LEVEL = level
+                settings.FILESYSTEM_BLOB_DIR = tempfile.mkdtemp()
+                try:
+                    blob_service = FileBlobService()
+                    digests, add_seconds = timed(add_all, blob_service,
+                                                 blobs)
+                    _, read_seconds = timed(read_all, blob_service, digests)
+                    used = disk_usage(settings.FILESYSTEM_BLOB_DIR)
+                finally:
+                    shutil.rmtree(settings.FILESYSTEM_BLOB_DIR)
+                rows.append(('level {0}'.format(level),
+                             '{0:.1f} MiB on disk'.format(used / 2.0**20),
+                             'saves {0:.0f}%'.format(
+                                 100 - 100.0 * used / size),
+                             'add {0:.0f} MB/s'.format(
+                                 size / 2.0**20 / add_seconds),
+                             'read {0:.0f} MB/s'.format(
+                                 size / 2.0**20 / read_seconds)))
+            report('{0}, {1:.1f} MiB'.format(label, size / 2.0**20), rows)
+    finally:
+        settings.BLOB_COMPRESSION_LEVEL = original_level
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
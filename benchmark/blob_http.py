@@ -0,0 +1,154 @@
+"""
+Load test of downloading blobs through the API at /api/blobs/<digest>/data,
+against a static file server serving the blob directory as a baseline.
+Both servers are the threaded servers of the standard library, each in
+its own process, so the difference is the cost of the API itself. Run the
+API under gunicorn for production numbers. Does not use the database.
+"""
+import SimpleHTTPServer
+import SocketServer
+import httplib
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, \
+    make_server
+
+from benchmark import report
+from objectcube import settings
+from objectcube.factory import get_service
+
+API_PORT = 4100
+STATIC_PORT = 4101
+
+
+class ThreadingWSGIServer(SocketServer.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class QuietStaticRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                          SocketServer.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve_api():
+    from api import app
+    make_server('127.0.0.1', API_PORT, app, ThreadingWSGIServer,
+                QuietWSGIRequestHandler).serve_forever()
+
+
+def serve_static():
+    os.chdir(settings.FILESYSTEM_BLOB_DIR)
+    ThreadingHTTPServer(('127.0.0.1', STATIC_PORT),
+                        QuietStaticRequestHandler).serve_forever()
+
+
+def wait_for(port):
+    for _ in range(100):
+        try:
+            connection = httplib.HTTPConnection('127.0.0.1', port)
+            connection.request('HEAD', '/')
+            connection.getresponse().read()
+            return
+        except IOError:
+            time.sleep(0.1)
+    raise RuntimeError('Server on port {0} did not start'.format(port))
+
+
+def load(port, path, clients, requests, headers=None):
+    """
+    Fetches the path requests times from each of the client threads.
+    :return: (requests per second, MB per second, 99th percentile latency)
+    """
+    latencies = []
+    received = [0]
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests):
+            start = time.time()
+            connection = httplib.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', path, headers=headers or {})
+            response = connection.getresponse()
+            size = 0
+            for data in iter(lambda: response.read(2**16), ''):
+                size += len(data)
+            connection.close()
+            assert response.status in (200, 206), response.status
+            with lock:
+                latencies.append(time.time() - start)
+                received[0] += size
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.time() - start
+
+    latencies.sort()
+    return (len(latencies) / seconds, received[0] / seconds / 2**20,
+            latencies[int(len(latencies) * 0.99) - 1])
+
+
+def add_blob(size):
+    with tempfile.TemporaryFile() as f:
+        f.write(os.urandom(size))
+        f.seek(0)
+        return get_service('BlobService').add(f)
+
+
+def main(clients=8, requests=50):
+    settings.FILESYSTEM_BLOB_DIR = tempfile.mkdtemp()
+    servers = [multiprocessing.Process(target=serve_api),
+               multiprocessing.Process(target=serve_static)]
+    try:
+        blobs = [('64 KiB', add_blob(2**16)), ('16 MiB', add_blob(2**24))]
+        for server in servers:
+            server.daemon = True
+            server.start()
+        wait_for(API_PORT)
+        wait_for(STATIC_PORT)
+
+        rows = []
+        for label, digest in blobs:
+            static_path = '/{0}/{1}/{2}'.format(digest[0:2], digest[2:4],
+                                                digest)
+            api_path = '/api/blobs/{0}/data'.format(digest)
+            for name, port, path, headers in [
+                    ('static', STATIC_PORT, static_path, None),
+                    ('api', API_PORT, api_path, None),
+                    ('api, 64 KiB range', API_PORT, api_path,
+                     {'Range': 'bytes=0-65535'})]:
+                rate, throughput, p99 = load(port, path, clients, requests,
+                                             headers)
+                rows.append(('{0}, {1}'.format(label, name),
+                             '{0:.0f} req/s'.format(rate),
+                             '{0:.0f} MB/s'.format(throughput),
+                             'p99 {0:.1f} ms'.format(p99 * 1000)))
+        report('Downloading blobs with {0} clients'.format(clients), rows)
+    finally:
+        for server in servers:
+            if server.is_alive():
+                server.terminate()
+        shutil.rmtree(settings.FILESYSTEM_BLOB_DIR)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
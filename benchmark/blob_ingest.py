@@ -0,0 +1,66 @@
+"""
+Measures FileBlobService.add() throughput for a non-seekable stream,
+against the previous two-pass path that hashed the stream, seeked back
+and copied it in 512 byte chunks. Does not use the database.
+"""
+import cStringIO
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmark import timed, report
+from objectcube import settings
+from objectcube.factory import get_service
+from objectcube.utils import md5_from_stream
+
+
+class Pipe(object):
+    """
+    Non-seekable stream, like a socket or a request body.
+    """
+    def __init__(self, data):
+        self.data = cStringIO.StringIO(data)
+
+    def read(self, size=-1):
+        return self.data.read(size)
+
+
+def add_two_pass(location, stream):
+    # The previous implementation, which needs a seekable stream
+    digest = md5_from_stream(stream)
+    with open(os.path.join(location, digest), 'wb') as f:
+        data = stream.read(512)
+        while data:
+            f.write(data)
+            data = stream.read(512)
+    return digest
+
+
+def main(size_mb=100, count=5):
+    settings.FILESYSTEM_BLOB_DIR = tempfile.mkdtemp()
+    try:
+        blob_service = get_service('BlobService', shared=False)
+        blobs = [os.urandom(size_mb * 2**20) for _ in range(count)]
+        total = size_mb * count
+
+        _, two_pass = timed(lambda: [
+            add_two_pass(settings.FILESYSTEM_BLOB_DIR,
+                         cStringIO.StringIO(data)) for data in blobs])
+        blob_service.flush()
+        _, single_pass = timed(lambda: [
+            blob_service.add(Pipe(data)) for data in blobs])
+
+        report('Adding {0} blobs of {1} MiB'.format(count, size_mb), [
+            ('two pass, 512 byte writes (seekable)',
+             '{0:.0f} MB/s'.format(total / two_pass)),
+            ('add(), one pass, fsync (non-seekable)',
+             '{0:.0f} MB/s'.format(total / single_pass),
+             '{0:.1f}x'.format(two_pass / single_pass)),
+        ])
+    finally:
+        shutil.rmtree(settings.FILESYSTEM_BLOB_DIR)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
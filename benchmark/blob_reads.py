@@ -0,0 +1,99 @@
+"""
+Compares peak memory and throughput of reading a large blob with
+FileBlobService.get_data(), open_data(), iter_data() and map_data().
+Each read runs in its own process, so peak memory is measured per mode.
+Pages of a mapped blob count towards RSS, but they are shared page cache
+that the kernel can reclaim, unlike the copies made by get_data(). Does
+not use the database.
+"""
+import hashlib
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+
+from benchmark import timed, report
+from objectcube import settings
+from objectcube.factory import get_service
+
+
+def read_get_data(blob_service, digest):
+    return hashlib.md5(blob_service.get_data(digest).getvalue()).hexdigest()
+
+
+def read_open_data(blob_service, digest):
+    h = hashlib.md5()
+    with blob_service.open_data(digest) as f:
+        for data in iter(lambda: f.read(2**16), ''):
+            h.update(data)
+    return h.hexdigest()
+
+
+def read_iter_data(blob_service, digest):
+    h = hashlib.md5()
+    for data in blob_service.iter_data(digest):
+        h.update(data)
+    return h.hexdigest()
+
+
+def read_map_data(blob_service, digest):
+    data = blob_service.map_data(digest)
+    try:
+        return hashlib.md5(data).hexdigest()
+    finally:
+        data.close()
+
+
+MODES = [
+    ('get_data()', read_get_data),
+    ('open_data()', read_open_data),
+    ('iter_data()', read_iter_data),
+    ('map_data()', read_map_data),
+]
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(read, digest, queue):
+    blob_service = get_service('BlobService')
+    start = peak_rss()
+    result, seconds = timed(read, blob_service, digest)
+    queue.put((result, seconds, peak_rss() - start))
+
+
+def add_blob(size):
+    blob_service = get_service('BlobService')
+    with tempfile.TemporaryFile() as f:
+        chunk = os.urandom(2**20)
+        for _ in range(size / len(chunk)):
+            f.write(chunk)
+        f.seek(0)
+        return blob_service.add(f)
+
+
+def main(size_mb=200):
+    settings.FILESYSTEM_BLOB_DIR = tempfile.mkdtemp()
+    try:
+        digest = add_blob(size_mb * 2**20)
+        rows = []
+        for label, read in MODES:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run_mode,
+                                              args=(read, digest, queue))
+            process.start()
+            result, seconds, rss = queue.get()
+            process.join()
+            assert result == digest
+            rows.append((label, '{0:.0f} MB/s'.format(size_mb / seconds),
+                         '+{0} MiB peak'.format(rss)))
+        report('Reading a {0} MiB blob'.format(size_mb), rows)
+    finally:
+        shutil.rmtree(settings.FILESYSTEM_BLOB_DIR)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
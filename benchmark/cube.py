@@ -0,0 +1,91 @@
+"""
+Measures CubeService.retrieve_cells on a 20 x 30 grid of two concepts,
+and with a third axis of a dimension level, against the one query per
+cell the browser issued before.
+
+    python -m benchmark.cube [objects]
+
+The default is 1M objects, each tagged once on every axis. The targets at
+1M objects are 1 s for two axes and 2 s for three, on a warm cache.
+"""
+import sys
+
+from benchmark import reset_schema, timed, report
+from benchmark.query_plans import execute
+from objectcube.data_objects import CubeAxis
+from objectcube.factory import get_service
+from objectcube.services.impl.postgresql.utils import \
+    execute_sql_fetch_single
+
+TARGETS = {2: 1.0, 3: 2.0}
+
+
+def load(objects):
+    # Tags 1-20 are concept 1, tags 21-50 concept 2, and tags 51-62 a
+    # dimension with root 51, two nodes at level 1 and the leaves 54-62
+    # under them
+    execute([
+        "INSERT INTO CONCEPTS (TITLE) VALUES ('Rows'), ('Columns')",
+        "INSERT INTO TAGS (VALUE, TYPE, CONCEPT_ID) "
+        "  SELECT 'T' || i, 1, CASE WHEN i <= 20 THEN 1 "
+        "    WHEN i <= 50 THEN 2 END FROM generate_series(1, 62) i",
+        "INSERT INTO DIMENSIONS VALUES "
+        "  (51, 51, 1, 24), (51, 52, 2, 13), (51, 53, 14, 23)",
+        "INSERT INTO DIMENSIONS "
+        "  SELECT 51, 54 + i, 3 + 2 * i, 4 + 2 * i "
+        "  FROM generate_series(0, 4) i",
+        "INSERT INTO DIMENSIONS "
+        "  SELECT 51, 59 + i, 15 + 2 * i, 16 + 2 * i "
+        "  FROM generate_series(0, 3) i",
+        "INSERT INTO OBJECTS (NAME, DIGEST) "
+        "  SELECT 'O' || i, md5(i::text) FROM generate_series(1, {0}) i"
+        .format(objects),
+        "INSERT INTO TAGGINGS (OBJECT_ID, TAG_ID) "
+        "  SELECT i, 1 + (random() * 19)::bigint "
+        "  FROM generate_series(1, {0}) i".format(objects),
+        "INSERT INTO TAGGINGS (OBJECT_ID, TAG_ID) "
+        "  SELECT i, 21 + (random() * 29)::bigint "
+        "  FROM generate_series(1, {0}) i".format(objects),
+        "INSERT INTO TAGGINGS (OBJECT_ID, TAG_ID) "
+        "  SELECT i, 54 + (random() * 8)::bigint "
+        "  FROM generate_series(1, {0}) i".format(objects),
+        'ANALYZE',
+    ])
+
+
+def per_cell(rows, columns):
+    # What the browser did before: a count query per cell
+    sql = 'SELECT COUNT(1) AS count ' \
+          'FROM TAGGINGS A JOIN TAGGINGS B ON A.OBJECT_ID = B.OBJECT_ID ' \
+          'WHERE A.TAG_ID = %s AND B.TAG_ID = %s'
+    return [execute_sql_fetch_single(lambda count: count, sql, (row, column))
+            for row in rows for column in columns]
+
+
+def median(function, *args, **kwargs):
+    runs = sorted(timed(function, *args, **kwargs)[1] for _ in range(3))
+    return runs[1]
+
+
+def main(objects=1000000):
+    reset_schema()
+    load(objects)
+    cube_service = get_service('CubeService')
+    rows = [CubeAxis(concept_id=1L), CubeAxis(concept_id=2L)]
+    level = CubeAxis(root_tag_id=51L, level=1L)
+
+    two = median(cube_service.retrieve_cells, rows)
+    three = median(cube_service.retrieve_cells, rows + [level])
+    _, before = timed(per_cell, range(1, 21), range(21, 51))
+    report('Cube cells over {0} objects (median of 3)'.format(objects), [
+        ('600 count queries, one per cell', '{0:.3f} s'.format(before)),
+        ('retrieve_cells, 2 axes', '{0:.3f} s'.format(two),
+         'target {0:.1f} s'.format(TARGETS[2]),
+         '{0:.1f}x'.format(before / two)),
+        ('retrieve_cells, 3 axes', '{0:.3f} s'.format(three),
+         'target {0:.1f} s'.format(TARGETS[3])),
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,41 @@
+"""
+Measures the cost of building data objects and reading their fields,
+comparing the validating constructor with the trusted row builder used
+for database rows. Does not use the database.
+"""
+import sys
+
+from benchmark import timed, report
+from objectcube.data_objects import Tagging
+
+
+def make_rows(count):
+    return [(long(i), long(i % 100), long(i), None, None, None)
+            for i in range(count)]
+
+
+def main(count=100000):
+    columns = ['id', 'tag_id', 'object_id', 'meta', 'plugin_id',
+               'plugin_set_id']
+    rows = make_rows(count)
+
+    _, validated = timed(lambda: [Tagging(**dict(zip(columns, row)))
+                                  for row in rows])
+    build = Tagging.row_builder(columns)
+    taggings, trusted = timed(lambda: [build(row) for row in rows])
+    _, access = timed(lambda: [(t.id, t.tag_id, t.object_id)
+                               for t in taggings])
+
+    report('Data objects, {0} taggings'.format(count), [
+        ('Tagging(**row)', '{0:.0f} objects/s'.format(count / validated)),
+        ('Tagging.row_builder()', '{0:.0f} objects/s'.format(count / trusted),
+         '{0:.1f}x'.format(validated / trusted)),
+        ('attribute access, 3 fields',
+         '{0:.0f} objects/s'.format(count / access)),
+        ('size of one object', '{0} bytes'.format(
+            sys.getsizeof(taggings[0]))),
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
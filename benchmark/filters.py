@@ -0,0 +1,76 @@
+"""
+Measures ObjectService.retrieve_by_filter and count_by_filter on filters
+of two to five terms, against intersecting the objects of each tag on
+the client, as callers did before.
+
+    python -m benchmark.filters [objects] [taggings] [tags]
+
+The defaults are those of benchmark.query_plans: 1M objects, 50M taggings
+and 100k tags, with the indexes of migrations/ built.
+"""
+import sys
+
+from benchmark import reset_schema, timed, report
+from benchmark.query_plans import execute, load, migration_statements
+from objectcube.factory import get_service
+
+# Tag values are T<id>, and tags with small ids are as common as others
+FILTERS = [
+    u'T1 AND T2',
+    u'T1 AND T2 AND NOT T3',
+    u'T1 AND (T2 OR T3) AND NOT T4',
+    u'(T1 OR T2) AND (T3 OR T4) AND NOT T5',
+    u'NOT T1 AND NOT T2',
+]
+
+
+def client_side(object_service, expression):
+    # Only plain conjunctions of terms, like the filters above without
+    # OR, can be done this way; the others are left out
+    terms = expression.split(u' AND ')
+    if any(u'(' in term or u' OR ' in term for term in terms):
+        return None
+    result = None
+    for term in terms:
+        negated = term.startswith(u'NOT ')
+        tag_id = long(term.split(u'T')[-1])
+        ids = set(o.id for o in object_service.iter_by_tag_id(tag_id))
+        if result is None:
+            result = ids if not negated else \
+                set(o.id for o in object_service.iter_all()) - ids
+        elif negated:
+            result -= ids
+        else:
+            result &= ids
+    return len(result)
+
+
+def main(objects=1000000, taggings=50000000, tags=100000):
+    reset_schema()
+    load(objects, taggings, tags)
+    execute(migration_statements(), autocommit=True)
+    object_service = get_service('ObjectService')
+
+    rows = []
+    for expression in FILTERS:
+        count, count_seconds = timed(object_service.count_by_filter,
+                                     expression)
+        _, page_seconds = timed(object_service.retrieve_by_filter,
+                                expression, limit=20L)
+        client, client_seconds = timed(client_side, object_service,
+                                       expression)
+        if client is not None:
+            assert client == count
+        rows.append((expression,
+                     '{0} objects'.format(count),
+                     'count {0:.3f} s'.format(count_seconds),
+                     'first page {0:.3f} s'.format(page_seconds),
+                     'client side {0}'.format(
+                         '{0:.3f} s'.format(client_seconds)
+                         if client is not None else '-')))
+    report('Filters over {0} taggings of {1} objects'.format(
+        taggings, objects), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
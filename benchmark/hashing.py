@@ -0,0 +1,43 @@
+"""
+Measures hashing throughput of each digest algorithm, and of sha256tree
+with several thread counts, as FileBlobService.add() hashes a stream
+read in 1 MiB blocks. Does not use the database or the disk.
+"""
+import cStringIO
+import os
+import sys
+
+from benchmark import timed, report
+from objectcube import settings
+from objectcube import utils
+from objectcube.utils import digest_from_stream
+
+
+def main(size_mb=256, *thread_counts):
+    thread_counts = thread_counts or (1, 2, 4, 8)
+    data = os.urandom(2**20) * size_mb
+    rows = []
+    for algorithm in ['md5', 'sha1', 'sha256']:
+        _, seconds = timed(digest_from_stream, cStringIO.StringIO(data),
+                           algorithm)
+        rows.append((algorithm, '{0:.0f} MB/s'.format(size_mb / seconds)))
+
+    original_threads = settings.HASH_THREADS
+    try:
+        for threads in thread_counts:
+            # The pool is made with the number of threads in the settings
+            settings.HASH_THREADS = threads
+            utils._pool = None
+            _, seconds = timed(digest_from_stream,
+                               cStringIO.StringIO(data), 'sha256tree')
+            rows.append(('sha256tree, {0} threads'.format(threads),
+                         '{0:.0f} MB/s'.format(size_mb / seconds)))
+    finally:
+        settings.HASH_THREADS = original_threads
+        utils._pool = None
+
+    report('Hashing {0} MiB'.format(size_mb), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,59 @@
+"""
+Compares the peak memory of TaggingService.retrieve_by_tag_id() with a
+large limit against TaggingService.iter_by_tag_id().
+"""
+import resource
+import sys
+
+from benchmark import reset_schema, timed, report
+from objectcube.contexts import Connection
+from objectcube.factory import get_service
+
+
+def load_taggings(count):
+    with Connection() as c:
+        with c.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO OBJECTS (NAME, DIGEST) '
+                'SELECT \'O\' || i, \'D\' || i '
+                'FROM generate_series(1, %s) AS i', (count,))
+            cursor.execute(
+                'INSERT INTO TAGS (VALUE, DESCRIPTION, MUTABLE, TYPE) '
+                'VALUES (\'T\', \'\', FALSE, 1) RETURNING ID')
+            tag_id = cursor.fetchone()[0]
+            cursor.execute(
+                'INSERT INTO TAGGINGS (TAG_ID, OBJECT_ID) '
+                'SELECT %s, ID FROM OBJECTS', (tag_id,))
+    return tag_id
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(count=500000):
+    tagging_service = get_service('TaggingService')
+
+    reset_schema()
+    tag_id = load_taggings(count)
+
+    # Peak memory only grows, so the streaming variant is measured first
+    start = peak_rss()
+    rows, iterated = timed(
+        lambda: sum(1 for _ in tagging_service.iter_by_tag_id(tag_id)))
+    after_iter = peak_rss()
+    _, retrieved = timed(tagging_service.retrieve_by_tag_id, tag_id,
+                         limit=long(count))
+    after_retrieve = peak_rss()
+
+    report('Exporting {0} taggings of one tag'.format(rows), [
+        ('iter_by_tag_id()', '{0:.2f}s'.format(iterated),
+         '+{0} MiB peak'.format(after_iter - start)),
+        ('retrieve_by_tag_id(limit={0})'.format(count),
+         '{0:.2f}s'.format(retrieved),
+         '+{0} MiB peak'.format(after_retrieve - after_iter)),
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,73 @@
+"""
+Compares FileBlobService and PackBlobService on many small blobs, like
+thumbnails: the time to add and to read them in random order, the number
+of files they take, and the time to walk the blob directory, as a backup
+would. Does not use the database.
+"""
+import cStringIO
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from benchmark import timed, report
+from objectcube import settings
+from objectcube.services.impl.filesystem.blob_service import \
+    FileBlobService
+from objectcube.services.impl.filesystem.pack_blob_service import \
+    PackBlobService
+
+
+def add_all(blob_service, blobs):
+    return [blob_service.add(cStringIO.StringIO(data)) for data in blobs]
+
+
+def read_all(blob_service, digests):
+    return sum(len(blob_service.get_data(digest).read())
+               for digest in digests)
+
+
+def walk(location):
+    files = 0
+    for _, _, names in os.walk(location):
+        files += len(names)
+    return files
+
+
+def main(count=10000, min_kb=5, max_kb=50):
+    random.seed(1)
+    # Random data of random sizes, sliced from one buffer to save time
+    pool = os.urandom(max_kb * 2**10 * 2)
+    blobs = []
+    for i in range(count):
+        size = random.randint(min_kb * 2**10, max_kb * 2**10)
+        start = random.randint(0, len(pool) - size)
+        blobs.append(str(i) + pool[start:start + size])
+    total_mb = sum(len(data) for data in blobs) / float(2**20)
+
+    rows = []
+    for label, service_class in [('FileBlobService', FileBlobService),
+                                 ('PackBlobService', PackBlobService)]:
+        settings.FILESYSTEM_BLOB_DIR = tempfile.mkdtemp()
+        try:
+            blob_service = service_class()
+            digests, add_seconds = timed(add_all, blob_service, blobs)
+            random.shuffle(digests)
+            size, read_seconds = timed(read_all, blob_service, digests)
+            assert size == sum(len(data) for data in blobs)
+            files, walk_seconds = timed(walk, settings.FILESYSTEM_BLOB_DIR)
+            rows.append((label,
+                         'add {0:.0f} blobs/s'.format(count / add_seconds),
+                         'read {0:.0f} blobs/s'.format(count / read_seconds),
+                         '{0} files'.format(files),
+                         'walk {0:.3f} s'.format(walk_seconds)))
+        finally:
+            shutil.rmtree(settings.FILESYSTEM_BLOB_DIR)
+
+    report('{0} blobs of {1}-{2} KiB, {3:.0f} MiB in all'.format(
+        count, min_kb, max_kb, total_mb), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
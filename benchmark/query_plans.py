@@ -0,0 +1,146 @@
+"""
+Shows query plans and latencies of the service queries before and after
+the index migrations in migrations/ are applied.
+
+    python -m benchmark.query_plans [objects] [taggings] [tags]
+
+The defaults are 1M objects, 50M taggings and 100k tags; loading them
+takes a while, so pass smaller numbers for a quick run.
+"""
+import glob
+import re
+import sys
+
+from benchmark import reset_schema, timed, report
+from objectcube.db import create_connection, destroy_connection
+from objectcube.services.impl.postgresql.object import SUBTREE_OBJECT_IDS
+
+MIGRATIONS = 'migrations/[0-9]*.sql'
+
+QUERIES = [
+    ('TaggingService.retrieve_by_tag_id',
+     'SELECT * FROM TAGGINGS WHERE TAG_ID = %s OFFSET 0 LIMIT 10', (42,)),
+    ('TaggingService.retrieve_by_object_id',
+     'SELECT * FROM TAGGINGS WHERE OBJECT_ID = %s OFFSET 0 LIMIT 10', (42,)),
+    ('TaggingService.retrieve_by_set_id',
+     'SELECT * FROM TAGGINGS WHERE PLUGIN_SET_ID = %s OFFSET 0 LIMIT 10',
+     (42,)),
+    ('ObjectService.retrieve_by_tag_id',
+     'SELECT O.ID, O.NAME, O.DIGEST '
+     'FROM OBJECTS O JOIN TAGGINGS T ON O.ID = T.OBJECT_ID '
+     'WHERE T.TAG_ID = %s OFFSET 0 LIMIT 10', (42,)),
+    ('TagService.retrieve_by_value',
+     'SELECT * FROM TAGS WHERE VALUE = %s OFFSET 0 LIMIT 10', ('T42',)),
+    ('TagService.retrieve_by_concept_id',
+     'SELECT * FROM TAGS WHERE CONCEPT_ID = %s OFFSET 0 LIMIT 10', (42,)),
+    ('TagService.retrieve_by_plugin_id',
+     'SELECT * FROM TAGS WHERE PLUGIN_ID = %s OFFSET 0 LIMIT 10', (1,)),
+    ('TagService.retrieve_by_regex',
+     'SELECT * FROM TAGS WHERE VALUE ~ %s OFFSET 0 LIMIT 10', ('T4242',)),
+    ('ObjectService.retrieve_by_regex',
+     'SELECT ID, NAME, DIGEST FROM OBJECTS WHERE NAME ~ %s '
+     'OFFSET 0 LIMIT 10', ('O42424',)),
+    ('ObjectService.retrieve_by_dimension_node',
+     'SELECT O.ID, O.NAME, O.DIGEST FROM OBJECTS O '
+     'WHERE O.ID IN ({0} AND T.OBJECT_ID > 0) '
+     'ORDER BY O.ID OFFSET 0 LIMIT 10'.format(SUBTREE_OBJECT_IDS),
+     (101, 101)),
+    ('DimensionService._read_roots',
+     'SELECT D1.root_tag_id, D1.node_tag_id, T1.value '
+     'FROM Dimensions D1 '
+     '  JOIN Dimensions D2 ON D1.root_tag_id = D2.root_tag_id '
+     '  JOIN Tags T1 ON D1.node_tag_id = T1.id '
+     'WHERE D1.root_tag_id = D1.node_tag_id '
+     '  AND D2.node_tag_id = %s '
+     'ORDER BY D1.left_border ASC', (42,)),
+]
+
+
+def execute(statements, autocommit=False):
+    connection = create_connection()
+    try:
+        connection.autocommit = autocommit
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+        if not autocommit:
+            connection.commit()
+    finally:
+        connection.autocommit = False
+        destroy_connection(connection)
+
+
+def migration_statements():
+    statements = []
+    for migration in sorted(glob.glob(MIGRATIONS)):
+        with open(migration) as fd:
+            sql = re.sub(r'--[^\n]*', '', fd.read())
+        # Semicolons inside $$ quoted blocks do not end a statement
+        statements.extend(
+            s.strip() for s in re.findall(r'(?:\$\$.*?\$\$|[^;])+', sql,
+                                          re.DOTALL) if s.strip())
+    return statements
+
+
+def load(objects, taggings, tags):
+    index_names = re.findall(r'IF NOT EXISTS (\w+_IDX)',
+                             ';'.join(migration_statements()))
+    execute(['DROP INDEX IF EXISTS {0}'.format(name)
+             for name in index_names] + ['DELETE FROM SCHEMA_VERSION'])
+    execute([
+        "INSERT INTO PLUGINS (NAME, MODULE) VALUES ('P', 'M')",
+        "INSERT INTO CONCEPTS (TITLE) "
+        "  SELECT 'C' || i FROM generate_series(1, {0}) i"
+        .format(max(tags / 100, 1)),
+        "INSERT INTO TAGS (VALUE, TYPE, CONCEPT_ID, PLUGIN_ID) "
+        "  SELECT 'T' || i, 1, 1 + i % {0}, CASE WHEN i % 2 = 0 "
+        "    THEN 1 END FROM generate_series(1, {1}) i"
+        .format(max(tags / 100, 1), tags),
+        "INSERT INTO OBJECTS (NAME, DIGEST) "
+        "  SELECT 'O' || i, md5(i::text) FROM generate_series(1, {0}) i"
+        .format(objects),
+        "INSERT INTO TAGGINGS (OBJECT_ID, TAG_ID, PLUGIN_ID, PLUGIN_SET_ID) "
+        "  SELECT 1 + (random() * ({0} - 1))::bigint, "
+        "         1 + (random() * ({1} - 1))::bigint, "
+        "         1, i / 4 FROM generate_series(1, {2}) i"
+        .format(objects, tags, taggings),
+        "INSERT INTO DIMENSIONS "
+        "  SELECT 1 + (i / 100) * 100, i, 2 * (i % 100), 2 * (i % 100) + 1 "
+        "  FROM generate_series(1, {0}) i"
+        .format(tags - tags % 100),
+        'ANALYZE',
+    ])
+
+
+def measure(runs=5):
+    rows = []
+    connection = create_connection()
+    try:
+        with connection.cursor() as cursor:
+            for label, sql, params in QUERIES:
+                cursor.execute('EXPLAIN ' + sql, params)
+                plan = [row[0].strip() for row in cursor.fetchall()]
+                latencies = sorted(timed(cursor.execute, sql, params)[1]
+                                   for _ in range(runs))
+                rows.append((label,
+                             '{0:8.2f} ms'.format(
+                                 latencies[runs / 2] * 1000),
+                             plan[0][:70]))
+        connection.commit()
+    finally:
+        destroy_connection(connection)
+    return rows
+
+
+def main(objects=1000000, taggings=50000000, tags=100000):
+    reset_schema()
+    load(objects, taggings, tags)
+    report('Without secondary indexes (median of 5)', measure())
+
+    _, build = timed(execute, migration_statements(), autocommit=True)
+    report('With secondary indexes (median of 5, built in {0:.1f}s)'
+           .format(build), measure())
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,136 @@
+"""
+Measures the memory the bitmaps of TagIndexService take per tagging, and
+the latency of its filters, counts and cube cells, on taggings made up in
+memory, so it does not use the database. Tag popularity follows a Zipf
+distribution, as it does in real collections.
+
+    python -m benchmark.tag_index [objects] [tags per object]
+
+The defaults are 200k objects with 10 tags each, from 1000 tags.
+"""
+import marshal
+import os
+import random
+import sys
+import tempfile
+import time
+from bisect import bisect_left
+
+from benchmark import timed, report
+from objectcube import settings
+from objectcube.data_objects import CubeAxis
+from objectcube.services.impl.memory.bitmap import Bitmap
+from objectcube.services.impl.memory.tag_index import TagIndexService
+
+TAGS = 1000
+REPEATS = 20
+
+
+def make_taggings(objects, tags_per_object):
+    # Tag i is drawn with a weight of 1 / i
+    weights = [1.0 / i for i in range(1, TAGS + 1)]
+    total = sum(weights)
+    cumulative, running = [], 0
+    for weight in weights:
+        running += weight / total
+        cumulative.append(running)
+
+    tags = {}
+    for object_id in xrange(1, objects + 1):
+        drawn = set(min(bisect_left(cumulative, random.random()), TAGS - 1)
+                    + 1 for _ in range(tags_per_object))
+        for tag_id in drawn:
+            tags.setdefault(long(tag_id), []).append(long(object_id))
+    return tags
+
+
+def build(tags, objects):
+    service = TagIndexService()
+    service._tags = dict((tag_id, Bitmap.from_sorted(object_ids))
+                         for tag_id, object_ids in tags.items())
+    service._objects = Bitmap.from_sorted(xrange(1, objects + 1))
+    service._since = 0
+    service._refreshed = time.time()
+    service._loaded = True
+    return service
+
+
+def tag_ids(first, end):
+    return [long(tag_id) for tag_id in range(first, end)]
+
+
+def latency(function, *args):
+    _, seconds = timed(lambda: [function(*args) for _ in range(REPEATS)])
+    return '{0:.0f} us'.format(seconds / REPEATS * 10**6)
+
+
+def main(objects=200000, tags_per_object=10):
+    random.seed(1)
+    tags = make_taggings(objects, tags_per_object)
+    taggings = sum(len(object_ids) for object_ids in tags.values())
+
+    # Never refreshed from the database
+    original = (settings.TAG_INDEX_REFRESH_INTERVAL,
+                settings.TAG_INDEX_SNAPSHOT)
+    settings.TAG_INDEX_REFRESH_INTERVAL = float('inf')
+    settings.TAG_INDEX_SNAPSHOT = os.path.join(tempfile.mkdtemp(),
+                                               'tag_index.snapshot')
+    try:
+        service, build_seconds = timed(build, tags, objects)
+        bitmap_bytes = sum(bitmap.memory_size()
+                           for bitmap in service._tags.values())
+        list_bytes = sum(sys.getsizeof(object_ids) + 24 * len(object_ids)
+                         for object_ids in tags.values())
+        report('{0} objects, {1} taggings of {2} tags'.format(
+            objects, taggings, len(tags)), [
+            ('Bitmaps', '{0:.2f} bytes per tagging'.format(
+                float(bitmap_bytes) / taggings)),
+            ('Lists of longs, for comparison', '{0:.2f} bytes per tagging'
+             .format(float(list_bytes) / taggings)),
+            ('Build from sorted ids', '{0:.1f} s'.format(build_seconds)),
+        ])
+
+        size, save_seconds = timed(service.save_snapshot)
+        with open(settings.TAG_INDEX_SNAPSHOT, 'rb') as f:
+            state, load_seconds = timed(marshal.load, f)
+        _, rebuild_seconds = timed(
+            lambda: [Bitmap.load(chunks) for chunks in state[4].values()])
+        report('Snapshot', [
+            ('Size', '{0:.1f} MiB'.format(size / 2.0**20)),
+            ('Save', '{0:.2f} s'.format(save_seconds)),
+            ('Load', '{0:.2f} s'.format(load_seconds + rebuild_seconds)),
+        ])
+
+        # Tag 1 is the most common, tag 100 is in about 1 in 75 objects
+        report('Latency, mean of {0}'.format(REPEATS), [
+            ('Count of one common tag', latency(
+                service.count_by_filter, u'id:1')),
+            ('Count of two common tags', latency(
+                service.count_by_filter, u'id:1 AND id:2')),
+            ('Count of a common and a rare tag', latency(
+                service.count_by_filter, u'id:1 AND id:100')),
+            ('Count of two rare tags', latency(
+                service.count_by_filter, u'id:100 AND id:101')),
+            ('Count of (a OR b) AND NOT c', latency(
+                service.count_by_filter,
+                u'(id:3 OR id:4) AND NOT id:5')),
+            ('First 10 ids of two common tags', latency(
+                service.retrieve_ids_by_filter, u'id:1 AND id:2')),
+            ('Cells of 5 x 5 tags', latency(
+                service.retrieve_cells,
+                [CubeAxis(tag_ids=tag_ids(1, 6)),
+                 CubeAxis(tag_ids=tag_ids(6, 11))], None, 0L)),
+            ('Cells of 20 x 30 tags', latency(
+                service.retrieve_cells,
+                [CubeAxis(tag_ids=tag_ids(11, 31)),
+                 CubeAxis(tag_ids=tag_ids(31, 61))], None, 0L)),
+        ])
+    finally:
+        os.remove(settings.TAG_INDEX_SNAPSHOT)
+        os.rmdir(os.path.dirname(settings.TAG_INDEX_SNAPSHOT))
+        settings.TAG_INDEX_REFRESH_INTERVAL, settings.TAG_INDEX_SNAPSHOT = \
+            original
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
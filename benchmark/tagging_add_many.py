@@ -0,0 +1,53 @@
+"""
+Compares per-row TaggingService.add() with TaggingService.add_many().
+"""
+import sys
+
+from benchmark import reset_schema, timed, report
+from objectcube.data_objects import Object, Tag, Tagging
+from objectcube.factory import get_service
+
+
+def create_taggings(object_count, tag_count):
+    object_service = get_service('ObjectService')
+    tag_service = get_service('TagService')
+
+    objects = [object_service.add(Object(name=u'O' + unicode(i),
+                                         digest=u'D' + unicode(i)))
+               for i in range(object_count)]
+    tags = [tag_service.add(Tag(value=u'T' + unicode(i), description=u'',
+                                mutable=False, type=1L))
+            for i in range(tag_count)]
+    return [Tagging(tag_id=tag.id, object_id=object_.id)
+            for object_ in objects for tag in tags]
+
+
+def main(object_count=500, tag_count=20):
+    tagging_service = get_service('TaggingService')
+
+    reset_schema()
+    taggings = create_taggings(object_count, tag_count)
+    _, single = timed(lambda: [tagging_service.add(t) for t in taggings])
+
+    reset_schema()
+    taggings = create_taggings(object_count, tag_count)
+    _, many = timed(tagging_service.add_many, taggings)
+
+    reset_schema()
+    taggings = create_taggings(object_count, tag_count)
+    _, many_no_ids = timed(tagging_service.add_many, taggings,
+                           returning=False)
+
+    rows = len(taggings)
+    report('Tagging ingestion, {0} taggings'.format(rows), [
+        ('add() per row', '{0:.0f} rows/s'.format(rows / single)),
+        ('add_many()', '{0:.0f} rows/s'.format(rows / many),
+         '{0:.1f}x'.format(single / many)),
+        ('add_many(returning=False)',
+         '{0:.0f} rows/s'.format(rows / many_no_ids),
+         '{0:.1f}x'.format(single / many_no_ids)),
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
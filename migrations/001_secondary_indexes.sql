@@ -0,0 +1,64 @@
+-- Migration 1: Secondary indexes for the service access paths.
+--
+-- The indexes are built CONCURRENTLY so the tables stay writable while
+-- they are built. That cannot run inside a transaction block, so run this
+-- file with psql in autocommit mode (the default):
+--
+--     psql -v ON_ERROR_STOP=1 -f migrations/001_secondary_indexes.sql
+
+CREATE TABLE IF NOT EXISTS SCHEMA_VERSION (
+  VERSION BIGINT PRIMARY KEY NOT NULL,
+  APPLIED TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- TaggingService.retrieve_by_tag_id and ObjectService.retrieve_by_tag_id.
+-- OBJECT_ID is part of the key so the join can be answered from the index.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGGINGS_TAG_ID_OBJECT_ID_IDX
+  ON TAGGINGS (TAG_ID, OBJECT_ID);
+
+-- TaggingService.retrieve_by_object_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGGINGS_OBJECT_ID_TAG_ID_IDX
+  ON TAGGINGS (OBJECT_ID, TAG_ID);
+
+-- TaggingService.retrieve_by_set_id, resolve and delete_by_set_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGGINGS_PLUGIN_SET_ID_IDX
+  ON TAGGINGS (PLUGIN_SET_ID) WHERE PLUGIN_SET_ID IS NOT NULL;
+
+-- TagService.retrieve_by_value and retrieve_or_create
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGS_VALUE_IDX
+  ON TAGS (VALUE);
+
+-- TagService.retrieve_by_concept_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGS_CONCEPT_ID_IDX
+  ON TAGS (CONCEPT_ID) WHERE CONCEPT_ID IS NOT NULL;
+
+-- TagService.retrieve_by_plugin_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGS_PLUGIN_ID_IDX
+  ON TAGS (PLUGIN_ID) WHERE PLUGIN_ID IS NOT NULL;
+
+-- DimensionService._read_roots, which looks dimensions up by node tag.
+-- Lookups by root tag are served by the primary key.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS DIMENSIONS_NODE_TAG_ID_IDX
+  ON DIMENSIONS (NODE_TAG_ID, ROOT_TAG_ID);
+
+-- DimensionService._read_tree, which reads a tree in border order
+CREATE INDEX CONCURRENTLY IF NOT EXISTS DIMENSIONS_ROOT_TAG_ID_LEFT_IDX
+  ON DIMENSIONS (ROOT_TAG_ID, LEFT_BORDER);
+
+-- Regular expression searches (the ~ operator) in retrieve_by_regex
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGS_VALUE_TRGM_IDX
+  ON TAGS USING GIN (VALUE gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGS_DESCRIPTION_TRGM_IDX
+  ON TAGS USING GIN (DESCRIPTION gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS OBJECTS_NAME_TRGM_IDX
+  ON OBJECTS USING GIN (NAME gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS CONCEPTS_TITLE_TRGM_IDX
+  ON CONCEPTS USING GIN (TITLE gin_trgm_ops);
+
+ANALYZE TAGGINGS;
+ANALYZE TAGS;
+ANALYZE DIMENSIONS;
+
+INSERT INTO SCHEMA_VERSION (VERSION) VALUES (1);
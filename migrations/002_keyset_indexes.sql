@@ -0,0 +1,20 @@
+-- Migration 2: Indexes for keyset pagination.
+--
+-- The retrieve methods return rows ordered by ID and page with
+-- "ID > after_id", so the filtered columns are indexed together with ID.
+-- Run with psql in autocommit mode, see 001_secondary_indexes.sql.
+
+-- TaggingService.retrieve_by_tag_id; a tag can have millions of taggings
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGGINGS_TAG_ID_ID_IDX
+  ON TAGGINGS (TAG_ID, ID);
+
+-- TagService.retrieve_by_concept_id and retrieve_by_plugin_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGS_CONCEPT_ID_ID_IDX
+  ON TAGS (CONCEPT_ID, ID) WHERE CONCEPT_ID IS NOT NULL;
+DROP INDEX CONCURRENTLY IF EXISTS TAGS_CONCEPT_ID_IDX;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TAGS_PLUGIN_ID_ID_IDX
+  ON TAGS (PLUGIN_ID, ID) WHERE PLUGIN_ID IS NOT NULL;
+DROP INDEX CONCURRENTLY IF EXISTS TAGS_PLUGIN_ID_IDX;
+
+INSERT INTO SCHEMA_VERSION (VERSION) VALUES (2);
@@ -0,0 +1,27 @@
+-- Migration 3: Unique key for plugin tags.
+--
+-- TagService.retrieve_or_create upserts with INSERT ... ON CONFLICT on
+-- (VALUE, TYPE, CONCEPT_ID, PLUGIN_ID), which requires a unique index on
+-- those columns. NULLs are distinct, so tags without a concept or plugin
+-- are not affected. Run with psql in autocommit mode, see
+-- 001_secondary_indexes.sql.
+
+-- A failed concurrent build leaves an invalid index behind, so refuse to
+-- start while duplicates exist. They can be listed with
+--   SELECT VALUE, TYPE, CONCEPT_ID, PLUGIN_ID, array_agg(ID)
+--   FROM TAGS GROUP BY 1, 2, 3, 4 HAVING COUNT(1) > 1;
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1
+             FROM TAGS
+             WHERE CONCEPT_ID IS NOT NULL AND PLUGIN_ID IS NOT NULL
+             GROUP BY VALUE, TYPE, CONCEPT_ID, PLUGIN_ID
+             HAVING COUNT(1) > 1) THEN
+    RAISE EXCEPTION 'Duplicate plugin tags must be merged first';
+  END IF;
+END $$;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS TAGS_PLUGIN_KEY_IDX
+  ON TAGS (VALUE, TYPE, CONCEPT_ID, PLUGIN_ID);
+
+INSERT INTO SCHEMA_VERSION (VERSION) VALUES (3);
@@ -0,0 +1,11 @@
+-- Migration 4: Index on object digests.
+--
+-- The blob garbage collector reads the digests referenced by objects in
+-- ranges, in the same byte order as the blob catalog, with
+-- ObjectService.retrieve_digests. Run with psql in autocommit mode, see
+-- 001_secondary_indexes.sql.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS OBJECTS_DIGEST_IDX
+  ON OBJECTS (DIGEST COLLATE "C");
+
+INSERT INTO SCHEMA_VERSION (VERSION) VALUES (4);
@@ -0,0 +1,36 @@
+-- Migration 5: Object counts per dimension node.
+--
+-- DIMENSION_COUNTS holds, for every node of every dimension, the number
+-- of objects tagged with the node (DIRECT_COUNT) and with the node or any
+-- node below it (SUBTREE_COUNT), each object counted once.
+-- DimensionService counts a dimension from scratch when it is written,
+-- and TaggingService updates the counts of the objects it tags or
+-- untags. The existing dimensions are counted here, which reads the
+-- taggings of every dimension tag. Run with psql in autocommit mode, see
+-- 001_secondary_indexes.sql.
+
+CREATE TABLE IF NOT EXISTS DIMENSION_COUNTS (
+  ROOT_TAG_ID BIGINT NOT NULL,
+  NODE_TAG_ID BIGINT NOT NULL,
+  DIRECT_COUNT BIGINT NOT NULL DEFAULT 0,
+  SUBTREE_COUNT BIGINT NOT NULL DEFAULT 0,
+  CONSTRAINT DIMENSION_COUNTS_PK PRIMARY KEY(ROOT_TAG_ID, NODE_TAG_ID),
+  FOREIGN KEY(ROOT_TAG_ID, NODE_TAG_ID)
+    REFERENCES DIMENSIONS(ROOT_TAG_ID, NODE_TAG_ID) ON DELETE CASCADE
+);
+
+INSERT INTO DIMENSION_COUNTS (
+  ROOT_TAG_ID, NODE_TAG_ID, DIRECT_COUNT, SUBTREE_COUNT)
+SELECT N.ROOT_TAG_ID, N.NODE_TAG_ID,
+  (SELECT COUNT(DISTINCT T.OBJECT_ID)
+   FROM TAGGINGS T
+   WHERE T.TAG_ID = N.NODE_TAG_ID),
+  (SELECT COUNT(DISTINCT T.OBJECT_ID)
+   FROM DIMENSIONS D
+     JOIN TAGGINGS T ON T.TAG_ID = D.NODE_TAG_ID
+   WHERE D.ROOT_TAG_ID = N.ROOT_TAG_ID
+     AND D.LEFT_BORDER BETWEEN N.LEFT_BORDER AND N.RIGHT_BORDER)
+FROM DIMENSIONS N
+ON CONFLICT DO NOTHING;
+
+INSERT INTO SCHEMA_VERSION (VERSION) VALUES (5);
@@ -0,0 +1,22 @@
+-- Migration 6: Change feed of the taggings.
+--
+-- When settings.TAGGING_CHANGE_FEED is on, TaggingService appends a row
+-- to TAGGING_CHANGES for every (object, tag) pair it tags or untags, in
+-- the same transaction, saying whether the object still has the tag.
+-- TagIndexService reads the rows to keep its in-memory index current,
+-- and deletes those older than settings.TAG_INDEX_CHANGE_RETENTION.
+-- CREATED is the time of the insert rather than of the commit, so rows
+-- are re-read for a while after they were first seen.
+
+CREATE TABLE IF NOT EXISTS TAGGING_CHANGES (
+  ID BIGSERIAL PRIMARY KEY NOT NULL,
+  OBJECT_ID BIGINT NOT NULL,
+  TAG_ID BIGINT NOT NULL,
+  PRESENT BOOLEAN NOT NULL,
+  CREATED TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CLOCK_TIMESTAMP()
+);
+
+CREATE INDEX IF NOT EXISTS TAGGING_CHANGES_CREATED_IDX
+  ON TAGGING_CHANGES (CREATED);
+
+INSERT INTO SCHEMA_VERSION (VERSION) VALUES (6);
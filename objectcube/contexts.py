@@ -1,17 +1,46 @@
+import itertools
+import threading
+from logging import getLogger
+
 from db import create_connection, destroy_connection
 
+logger = getLogger('DataLayer: Contexts')
+local = threading.local()
+savepoint_names = itertools.count()
+
+
+def get_unit_of_work():
+    """
+    Returns the unit of work active in the current thread, or None.
+    """
+    return getattr(local, 'unit_of_work', None)
+
 
 class Connection:
     def __init__(self):
         self.connection = None
+        self.unit_of_work = None
 
     def __enter__(self):
-        self.connection = create_connection()
+        # Inside a unit of work, the statement joins its transaction and
+        # the connection is committed and returned when the unit ends
+        self.unit_of_work = get_unit_of_work()
+        if self.unit_of_work:
+            self.connection = self.unit_of_work.get_connection()
+        else:
+            self.connection = create_connection()
         return self.connection
 
-    def __exit__(self, *args, **kwargs):
+    def __exit__(self, exc_type, *args, **kwargs):
+        if self.unit_of_work:
+            if exc_type is not None:
+                self.unit_of_work.set_rollback_only()
+            return
         try:
-            self.connection.commit()
+            if exc_type is None:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
         except Exception:
             raise
         finally:
@@ -19,3 +48,92 @@ class Connection:
 
     def cursor(self, *args, **kwargs):
         return self.connection.cursor(*args, **kwargs)
+
+
+class UnitOfWork(object):
+    """
+    Runs every statement issued in the current thread on one connection
+    and in one transaction, which is committed when the outermost unit of
+    work ends without an exception, and rolled back otherwise.
+
+    Units of work can be nested. A nested unit joins the transaction of
+    the outer one inside a savepoint, so when it fails only its own
+    statements are rolled back, and the outer unit can carry on. The
+    connection is only checked out when the first statement runs.
+
+        with UnitOfWork():
+            tag = tag_service.retrieve_by_id(id_)
+            tag_service.update(tag)
+    """
+    def __init__(self):
+        self.connection = None
+        self.outer = None
+        self.savepoint = None
+        self.rollback_only = False
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, *args, **kwargs):
+        self.end(commit=exc_type is None)
+
+    def get_connection(self):
+        if self.outer is not None:
+            connection = self.outer.get_connection()
+            if self.savepoint is None:
+                self.savepoint = 'objectcube_{0}'.format(
+                    next(savepoint_names))
+                self._execute(connection, 'SAVEPOINT ' + self.savepoint)
+            return connection
+        if self.connection is None:
+            self.connection = create_connection()
+        return self.connection
+
+    def set_rollback_only(self):
+        self.rollback_only = True
+
+    def begin(self):
+        self.outer = get_unit_of_work()
+        local.unit_of_work = self
+        return self
+
+    def end(self, commit=True):
+        local.unit_of_work = self.outer
+        if self.outer is not None:
+            self._end_savepoint(commit and not self.rollback_only)
+            return
+
+        if self.connection is None:
+            return
+
+        try:
+            if commit and not self.rollback_only:
+                self.connection.commit()
+            else:
+                if commit:
+                    logger.warning('Unit of work rolled back after a '
+                                   'failed statement')
+                self.connection.rollback()
+        finally:
+            destroy_connection(self.connection)
+            self.connection = None
+
+    def _end_savepoint(self, release):
+        # A nested unit that ran no statements has nothing to undo
+        if self.savepoint is None:
+            return
+        savepoint, self.savepoint = self.savepoint, None
+        connection = self.outer.get_connection()
+        try:
+            if not release:
+                self._execute(connection, 'ROLLBACK TO SAVEPOINT ' + savepoint)
+            self._execute(connection, 'RELEASE SAVEPOINT ' + savepoint)
+        except Exception:
+            # The transaction can not be trusted any more
+            logger.exception('Could not end savepoint %s', savepoint)
+            self.outer.set_rollback_only()
+
+    @staticmethod
+    def _execute(connection, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
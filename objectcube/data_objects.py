@@ -3,8 +3,12 @@ from types import LongType, UnicodeType, BooleanType, NoneType, ListType
 
 
 class ObjectCubeClass(object):
+    # Fields are stored in slots, declared by each class from its fields.
+    # Attributes that are not fields are kept in _extra, created on demand
+    __slots__ = ('_extra',)
+    fields = {}
+
     def __init__(self, **kwargs):
-        self.data = {}
         for key, type_ in self.fields.items():
             # Type checking is only done on the specified fields
             # of each class, allowing to set other fields to anything
@@ -16,27 +20,71 @@ class ObjectCubeClass(object):
                     'Desired Type {}; Given Type {}'
                     .format(self.__class__, key, kwargs.get(key),
                             type_, type(kwargs.get(key))))
-            self.data[key] = kwargs.get(key)
+            object.__setattr__(self, key, kwargs.get(key))
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds an object from a trusted mapping, such as a database row,
+        without type checking. Keys that are not fields are ignored and
+        missing fields are set to None.
+        """
+        object_ = cls.__new__(cls)
+        for key in cls.fields:
+            object.__setattr__(object_, key, row.get(key))
+        return object_
+
+    @classmethod
+    def row_builder(cls, columns):
+        """
+        Returns a function that builds objects from trusted row tuples
+        with the given column names, without type checking.
+        """
+        columns = list(columns)
+        setters = [(getattr(cls, key).__set__, columns.index(key))
+                   for key in cls.fields if key in columns]
+        defaults = [getattr(cls, key).__set__
+                    for key in cls.fields if key not in columns]
+        new = cls.__new__
+
+        def build(row):
+            object_ = new(cls)
+            for set_, index in setters:
+                set_(object_, row[index])
+            for set_ in defaults:
+                set_(object_, None)
+            return object_
+        return build
 
     def __getattr__(self, key):
-        if key not in self.data:
-            raise ObjectCubeException(
-                'Get invalid field: Class {}; Field {}'
-                .format(self.__class__, key))
-        return self.data.get(key)
+        # Only called when the slot of a field is unset, or key is
+        # neither a field nor any other attribute of the class
+        if key != '_extra':
+            try:
+                return self._extra[key]
+            except (ObjectCubeException, KeyError):
+                pass
+        raise ObjectCubeException(
+            'Get invalid field: Class {}; Field {}'
+            .format(self.__class__, key))
 
     def __setattr__(self, key, value):
-        super(ObjectCubeClass, self).__setattr__(key, value)
+        type_ = self.fields.get(key)
+        if type_ is None:
+            try:
+                self._extra[key] = value
+            except ObjectCubeException:
+                object.__setattr__(self, '_extra', {key: value})
+            return
+
         # Type checking is only done on the specified fields
-        # of each class to allow the statement self.data = {} in __init__
-        if key in self.fields \
-                and (not isinstance(value, self.fields[key]) or value == u''):
+        if not isinstance(value, type_) or value == u'':
             raise ObjectCubeException(
                 'Set invalid type: Class {}; Field {}; Value {};'
                 'Desired Type {}; Given Type {}'
                 .format(self.__class__, key, value,
-                        self.fields[key], type(value)))
-        self.data[key] = value
+                        type_, type(value)))
+        object.__setattr__(self, key, value)
 
     def __str__(self):
         return repr(self)
@@ -54,7 +102,7 @@ class ObjectCubeClass(object):
     def __dict__(self):
         out = {}
         for field in self.fields:
-            out[field] = self.data[field]
+            out[field] = getattr(self, field)
         return out
 
     def to_dict(self):
@@ -68,6 +116,7 @@ class Plugin(ObjectCubeClass):
     fields = {'id': (LongType, NoneType),
               'name': UnicodeType,
               'module': UnicodeType}
+    __slots__ = tuple(fields)
 
     def __init__(self, **kwargs):
         super(Plugin, self).__init__(**kwargs)
@@ -77,6 +126,7 @@ class Concept(ObjectCubeClass):
     fields = {'id': (LongType, NoneType),
               'title': UnicodeType,
               'description': UnicodeType}
+    __slots__ = tuple(fields)
 
     def __init__(self, **kwargs):
         super(Concept, self).__init__(**kwargs)
@@ -86,6 +136,7 @@ class Object(ObjectCubeClass):
     fields = {'id': (LongType, NoneType),
               'name': UnicodeType,
               'digest': UnicodeType}
+    __slots__ = tuple(fields)
 
     def __init__(self, **kwargs):
         super(Object, self).__init__(**kwargs)
@@ -99,6 +150,7 @@ class Tag(ObjectCubeClass):
               'type': LongType,
               'concept_id': (LongType, NoneType),
               'plugin_id': (LongType, NoneType)}
+    __slots__ = tuple(fields)
 
     def __init__(self, **kwargs):
         super(Tag, self).__init__(**kwargs)
@@ -111,6 +163,7 @@ class Tagging(ObjectCubeClass):
               'meta': (UnicodeType, NoneType),
               'plugin_id': (LongType, NoneType),
               'plugin_set_id': (LongType, NoneType)}
+    __slots__ = tuple(fields)
 
     def __init__(self, **kwargs):
         super(Tagging, self).__init__(**kwargs)
@@ -122,7 +175,33 @@ class DimensionNode(ObjectCubeClass):
               'node_tag_value': (UnicodeType, NoneType),
               'left_border': (LongType, NoneType),
               'right_border': (LongType, NoneType),
+              'direct_count': (LongType, NoneType),
+              'subtree_count': (LongType, NoneType),
               'child_nodes': (ListType, NoneType)}
+    __slots__ = tuple(fields)
 
     def __init__(self, **kwargs):
         super(DimensionNode, self).__init__(**kwargs)
+
+
+class CubeAxis(ObjectCubeClass):
+    # An axis is given by exactly one of: the tags of a concept, a list
+    # of tags, or the nodes at a level of a dimension (the root is level 0)
+    fields = {'concept_id': (LongType, NoneType),
+              'tag_ids': (ListType, NoneType),
+              'root_tag_id': (LongType, NoneType),
+              'level': (LongType, NoneType)}
+    __slots__ = tuple(fields)
+
+    def __init__(self, **kwargs):
+        super(CubeAxis, self).__init__(**kwargs)
+
+
+class CubeCell(ObjectCubeClass):
+    fields = {'tag_ids': ListType,
+              'count': LongType,
+              'object_ids': ListType}
+    __slots__ = tuple(fields)
+
+    def __init__(self, **kwargs):
+        super(CubeCell, self).__init__(**kwargs)
@@ -1,6 +1,14 @@
-from psycopg2.pool import ThreadedConnectionPool
+import threading
+import time
+from logging import getLogger
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import PoolError
 import settings
 
+logger = getLogger('DataLayer: Pool')
+
 
 def create_connection_string(**kwargs):
     data = {
@@ -12,29 +20,211 @@ def create_connection_string(**kwargs):
     }
     return ' '.join(['{0}={1}'.format(k, v) for (k, v) in data.items()])
 
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of PostgreSQL connections.
+
+    Unlike the psycopg2 pools, a checkout blocks when all connections are
+    in use, until one is returned or the timeout expires. Connections are
+    checked for health when they are handed out, and connections older
+    than max_lifetime seconds are closed and replaced.
+    """
+    def __init__(self, min_connections, max_connections, connection_string,
+                 timeout=None, max_lifetime=None, pre_ping=False,
+                 connection_factory=psycopg2.connect):
+        if min_connections < 0 or max_connections < 1 \
+                or min_connections > max_connections:
+            raise PoolError('Invalid pool size {0}/{1}'
+                            .format(min_connections, max_connections))
+
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.connection_string = connection_string
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.connection_factory = connection_factory
+
+        self._condition = threading.Condition()
+        self._idle = []
+        self._created = {}
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(min_connections):
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        connection = self.connection_factory(self.connection_string)
+        self._created[id(connection)] = time.time()
+        return connection
+
+    def _discard(self, connection):
+        self._created.pop(id(connection), None)
+        try:
+            if not connection.closed:
+                connection.close()
+        except Exception as ex:
+            logger.warning('Unable to close connection: %s', ex)
+
+    def _expired(self, connection):
+        if not self.max_lifetime:
+            return False
+        created = self._created.get(id(connection), 0)
+        return time.time() - created > self.max_lifetime
+
+    def _healthy(self, connection):
+        if connection.closed or self._expired(connection):
+            return False
+        if self.pre_ping:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                connection.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        started = time.time()
+
+        with self._condition:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise PoolError('Connection pool is closed')
+                    if self._idle:
+                        connection = self._idle.pop()
+                        break
+                    if self._in_use < self.max_connections:
+                        connection = None
+                        break
+
+                    remaining = None
+                    if timeout is not None:
+                        remaining = timeout - (time.time() - started)
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise PoolError(
+                                'Connection pool exhausted, waited {0:.3f}s'
+                                .format(time.time() - started))
+                    self._condition.wait(remaining)
+
+                # Reserve the slot before leaving the lock, so the
+                # connection can be opened or checked without holding it
+                self._in_use += 1
+            finally:
+                self._waiting -= 1
+
+        try:
+            if connection is not None and not self._healthy(connection):
+                with self._condition:
+                    self._recycled += 1
+                self._discard(connection)
+                connection = None
+            if connection is None:
+                connection = self._connect()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+        waited = time.time() - started
+        with self._condition:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return connection
+
+    def putconn(self, connection, close=False):
+        if not close and not connection.closed:
+            # Never hand out a connection in the middle of a transaction
+            try:
+                status = connection.get_transaction_status()
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                close = True
+
+        with self._condition:
+            self._in_use -= 1
+            if close or self._closed or connection.closed:
+                self._discard(connection)
+            elif self._expired(connection):
+                self._recycled += 1
+                self._discard(connection)
+            else:
+                self._idle.append(connection)
+            self._condition.notify()
+
+    def closeall(self):
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'min_connections': self.min_connections,
+                'max_connections': self.max_connections,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'checkout_time_avg': (self._wait_total / self._checkouts
+                                      if self._checkouts else 0.0),
+                'checkout_time_max': self._wait_max,
+            }
+
+
 pool = None
+pool_lock = threading.Lock()
 
 
 def get_pool():
     global pool
     if not pool:
-        db_config = {
-            'dbname': settings.DB_DBNAME,
-            'user': settings.DB_USER,
-            'host': settings.DB_HOST,
-            'password': settings.DB_PASSWORD,
-            'port': settings.DB_PORT
-        }
-
-        min_connections = 1
-        max_connections = 2
-
-        connection_string = create_connection_string(**db_config)
-        pool = ThreadedConnectionPool(
-            min_connections, max_connections, connection_string)
+        with pool_lock:
+            if not pool:
+                db_config = {
+                    'dbname': settings.DB_DBNAME,
+                    'user': settings.DB_USER,
+                    'host': settings.DB_HOST,
+                    'password': settings.DB_PASSWORD,
+                    'port': settings.DB_PORT
+                }
+
+                connection_string = create_connection_string(**db_config)
+                pool = ConnectionPool(
+                    settings.DB_POOL_MIN_CONNECTIONS,
+                    settings.DB_POOL_MAX_CONNECTIONS,
+                    connection_string,
+                    timeout=settings.DB_POOL_TIMEOUT,
+                    max_lifetime=settings.DB_POOL_MAX_LIFETIME,
+                    pre_ping=settings.DB_POOL_PRE_PING)
     return pool
 
 
+def get_pool_stats():
+    return get_pool().stats()
+
+
 def create_connection():
     return get_pool().getconn()
 
@@ -1,5 +1,6 @@
 import importlib
 import logging
+import threading
 
 from objectcube.services.base.service import Service
 from objectcube.settings import FACTORY_CONFIG
@@ -7,6 +8,12 @@ from objectcube.exceptions import ObjectCubeException
 
 logger = logging.getLogger('factory')
 
+# Service classes by class path, so a changed FACTORY_CONFIG entry
+# resolves to its new class, and the shared instance of each class
+service_classes = {}
+service_instances = {}
+service_lock = threading.Lock()
+
 
 def load_class(class_path):
     class_data = class_path.split(".")
@@ -25,18 +32,55 @@ def load_class(class_path):
         raise ObjectCubeException(message, ex)
 
 
-def get_service(service_name, *args, **kwargs):
-
+def load_service_class(service_name):
     # Check if the service_name has been configured in settings
     if service_name not in FACTORY_CONFIG.keys():
         raise ObjectCubeException('Service class {} has not been '
                                   'configured'.format(service_name))
 
     klass_path = FACTORY_CONFIG.get(service_name)
-    klass = load_class(klass_path)
+    klass = service_classes.get(klass_path)
+    if klass is None:
+        klass = load_class(klass_path)
+
+        if not issubclass(klass, Service):
+            raise ObjectCubeException('{} is not subclass of Service'
+                                      .format(klass_path))
+        service_classes[klass_path] = klass
+    return klass
+
+
+def get_service(service_name, *args, **kwargs):
+    """
+    Returns the configured service. By default one instance per class is
+    created and shared by all callers and threads of the process, so
+    services must be thread safe. What they keep between calls, such as
+    the blob index and catalog connections of FileBlobService, the
+    segment maps of PackBlobService and the bitmaps of TagIndexService,
+    is kept once per process. A new instance is created when constructor
+    arguments are given, or when called with shared=False.
+    """
+    shared = kwargs.pop('shared', True)
+    klass = load_service_class(service_name)
+    if args or kwargs or not shared:
+        return klass(*args, **kwargs)
+
+    service = service_instances.get(klass)
+    if service is None:
+        with service_lock:
+            service = service_instances.get(klass)
+            if service is None:
+                service = klass()
+                service_instances[klass] = service
+    return service
 
-    if not issubclass(klass, Service):
-        raise ObjectCubeException('{} is not subclass of Service'
-                                  .format(klass_path))
 
-    return klass(*args, **kwargs)
+def warm_up(service_names=None):
+    """
+    Loads and creates the shared instances of the given services, or of
+    all configured services, so the first request does not pay for it.
+    """
+    if service_names is None:
+        service_names = FACTORY_CONFIG.keys()
+    for service_name in service_names:
+        get_service(service_name)
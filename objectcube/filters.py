@@ -0,0 +1,174 @@
+"""
+Filter expressions over the tags of objects, such as
+
+    beach AND "summer 2014" AND NOT (people OR id:42)
+
+A word or a quoted string matches objects tagged with any tag of that
+value, and id:<number> objects tagged with the tag of that id. AND binds
+tighter than OR, and the operators are case insensitive. Expressions are
+parsed into tuples:
+
+    ('value', u'beach'), ('id', 42L), ('not', expression),
+    ('and', [expression, ...]), ('or', [expression, ...])
+"""
+import re
+
+from objectcube.exceptions import ObjectCubeException
+
+# Bounds the size of the SQL an expression compiles to
+MAX_TERMS = 32
+
+# Bounds the nesting of parentheses, as expressions are parsed and
+# compiled recursively
+MAX_DEPTH = 64
+
+TOKEN = re.compile(r'''
+    \s*(?:
+      (?P<open>\() | (?P<close>\)) |
+      "(?P<quoted>(?:[^"\\]|\\.)*)" |
+      id:(?P<id>\d+)\b |
+      (?P<word>[^\s()"]+)
+    )''', re.VERBOSE | re.UNICODE)
+
+OPERATORS = ('AND', 'OR', 'NOT')
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise ObjectCubeException('Invalid filter at {0}: {1}'
+                                      .format(position, text[position:]))
+        position = match.end()
+        if match.group('open'):
+            tokens.append(('(', None))
+        elif match.group('close'):
+            tokens.append((')', None))
+        elif match.group('quoted') is not None:
+            tokens.append(('value', re.sub(r'\\(.)', r'\1',
+                                           match.group('quoted'))))
+        elif match.group('id'):
+            tokens.append(('id', long(match.group('id'))))
+        elif match.group('word').upper() in OPERATORS:
+            tokens.append((match.group('word').upper(), None))
+        else:
+            tokens.append(('value', match.group('word')))
+    return tokens
+
+
+class _Parser(object):
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.terms = 0
+        self.depth = 0
+
+    def _peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+        return None
+
+    def _next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        expression = self._or()
+        if self._peek() is not None:
+            raise ObjectCubeException('Unexpected {0} in filter'
+                                      .format(self._peek()))
+        return expression
+
+    def _or(self):
+        operands = [self._and()]
+        while self._peek() == 'OR':
+            self._next()
+            operands.append(self._and())
+        return _combine('or', operands)
+
+    def _and(self):
+        operands = [self._not()]
+        while self._peek() == 'AND':
+            self._next()
+            operands.append(self._not())
+        return _combine('and', operands)
+
+    def _not(self):
+        # Repeated NOTs cancel out in pairs
+        negated = False
+        while self._peek() == 'NOT':
+            self._next()
+            negated = not negated
+        if negated:
+            return ('not', self._atom())
+        return self._atom()
+
+    def _atom(self):
+        kind = self._peek()
+        if kind == '(':
+            self._next()
+            self.depth += 1
+            if self.depth > MAX_DEPTH:
+                raise ObjectCubeException('Filter is nested more than {0} '
+                                          'levels deep'.format(MAX_DEPTH))
+            expression = self._or()
+            if self._peek() != ')':
+                raise ObjectCubeException('Missing ) in filter')
+            self._next()
+            self.depth -= 1
+            return expression
+        if kind in ('value', 'id'):
+            self.terms += 1
+            if self.terms > MAX_TERMS:
+                raise ObjectCubeException('Filter has more than {0} terms'
+                                          .format(MAX_TERMS))
+            return self._next()
+        raise ObjectCubeException('Expected a term in filter, got {0}'
+                                  .format(kind or 'the end'))
+
+
+def _combine(operator, operands):
+    # Nested operations of the same kind are flattened
+    if len(operands) == 1:
+        return operands[0]
+    flat = []
+    for operand in operands:
+        if operand[0] == operator:
+            flat.extend(operand[1])
+        else:
+            flat.append(operand)
+    return (operator, flat)
+
+
+def parse_filter(text):
+    """
+    Parses a filter expression.
+    :param text: the expression, see the module documentation
+    :return: the expression as tuples
+    :raises ObjectCubeException: if the expression is not valid
+    """
+    if not isinstance(text, basestring) or not text.strip():
+        raise ObjectCubeException('Function requires valid filter')
+    return _Parser(_tokenize(text)).parse()
+
+
+def filter_terms(expression):
+    """
+    :param expression: a parsed filter expression
+    :return: the set of the ('value', ...) and ('id', ...) terms in it
+    """
+    terms = set()
+    expressions = [expression]
+    while expressions:
+        expression = expressions.pop()
+        if expression[0] == 'not':
+            expressions.append(expression[1])
+        elif expression[0] in ('and', 'or'):
+            expressions.extend(expression[1])
+        else:
+            terms.add(expression)
+    return terms
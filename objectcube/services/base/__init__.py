@@ -5,3 +5,5 @@ from object import BaseObjectService
 from tag import BaseTagService
 from tagging import BaseTaggingService
 from dimension import BaseDimensionService
+from cube import BaseCubeService
+from tag_index import BaseTagIndexService
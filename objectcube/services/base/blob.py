@@ -10,8 +10,9 @@ class BaseBlobService(Service):
     is kept with each blob. Implementations could be storing files on
     file system, AWS-S3, Swift, etc.
 
-    Blobs are identified by MD5 checksums. This allows us to reuse objects
-    without duplicating them.
+    Blobs are identified by checksums of their data, MD5 unless
+    settings.DIGEST_ALGORITHM says otherwise. This allows us to reuse
+    objects without duplicating them.
     """
     def add(self, stream, meta=None, digest=None):
         """
@@ -30,6 +31,40 @@ class BaseBlobService(Service):
         """
         raise NotImplementedError()
 
+    def has_many(self, digests):
+        """
+        Checks which of many blobs are stored.
+        :param digests: iterable of digests
+        :return: dict of True or False by digest
+        """
+        raise NotImplementedError()
+
+    def touch(self, digest):
+        """
+        Renews the modification time of a blob, as adding it again would,
+        so a blob found to be stored is not collected as garbage before
+        the reference to it is made.
+        :param digest:
+        :return: False if the blob is not found
+        """
+        raise NotImplementedError()
+
+    def touch_many(self, digests):
+        """
+        Renews the modification times of many blobs.
+        :param digests: iterable of digests
+        :return: dict of True, or False if not found, by digest
+        """
+        raise NotImplementedError()
+
+    def delete(self, digest):
+        """
+
+        :param digest:
+        :return: None, raises exception if blob not found
+        """
+        raise NotImplementedError()
+
     def retrieve_uri(self, digest):
         """
 
@@ -46,11 +81,69 @@ class BaseBlobService(Service):
         """
         raise NotImplementedError()
 
-    def get_data(self, digest):
+    def retrieve_meta_many(self, digests):
         """
+        Retrieves the metadata of many blobs at once.
+        :param digests: iterable of digests
+        :return: dict of metadata by digest, for the blobs found
+        """
+        raise NotImplementedError()
 
+    def update_meta(self, digest, meta):
+        """
+        Replaces the metadata of a blob, without rewriting the blob.
         :param digest:
-        :return:
+        :param meta: dict, or None to remove the metadata
+        :return: None, raises exception if blob not found
+        """
+        raise NotImplementedError()
+
+    def get_data(self, digest, streaming=False):
+        """
+        Returns the content of a blob. The whole blob is read into memory,
+        unless streaming is set, when an open file-like object is
+        returned instead, which the caller must close.
+        :param digest:
+        :param streaming:
+        :return: file-like object
+        """
+        raise NotImplementedError()
+
+    def open_data(self, digest):
+        """
+        Opens a blob for reading, without reading it into memory. The
+        caller must close the returned file-like object.
+        :param digest:
+        :return: file-like object
+        """
+        raise NotImplementedError()
+
+    def get_size(self, digest):
+        """
+
+        :param digest:
+        :return: the size of the blob in bytes
+        """
+        raise NotImplementedError()
+
+    def iter_data(self, digest, offset=0, length=None, chunk_size=2**16):
+        """
+        Iterates over the content of a blob, or of the byte range starting
+        at offset, in chunks of at most chunk_size bytes.
+        :param digest:
+        :param offset: the first byte to return
+        :param length: the number of bytes to return, None for all
+        :param chunk_size:
+        :return: iterator of str
+        """
+        raise NotImplementedError()
+
+    def map_data(self, digest):
+        """
+        Maps a blob into memory read only, where the storage allows it,
+        so it can be read and sliced without copying.
+        :param digest:
+        :return: buffer supporting len() and slicing
         """
         raise NotImplementedError()
 
@@ -67,23 +67,25 @@ class BaseConceptService(Service):
         """
         raise NotImplementedError()
 
-    def retrieve(self, offset=0L, limit=10L):
+    def retrieve(self, offset=0L, limit=10L, after_id=0L):
         """
         Retrieves all concepts in database
         :param: offset: the first concepts to return
         :param: limit: the number of concepts to return
+        :param: after_id: only return concepts with a greater id
         :return: [Concept], empty set if none found
         """
         raise NotImplementedError()
 
     def retrieve_by_regex(self, title=None, description=None,
-                          offset=0L, limit=10L):
+                          offset=0L, limit=10L, after_id=0L):
         """
         Retrieves a given object by regex on name and/or description
         :param: title: regular expression to match on name
         :param: description: regular expression to match on description
         :param: offset: the first object to return
         :param: limit: the number of objects to return
+        :param: after_id: only return objects with a greater id
         :return: [Concept], empty set if none found
         """
         raise NotImplementedError()
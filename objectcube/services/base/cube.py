@@ -0,0 +1,17 @@
+from service import Service
+
+
+class BaseCubeService(Service):
+    def retrieve_cells(self, axes, filter_tag_ids=None, sample_size=3L):
+        """
+        Counts the objects in every cell of a cube in one query. A cell is
+        one tag of each axis, and holds the objects that have all of them.
+        Objects tagged with a descendant of a dimension node count under
+        that node.
+        :param: axes: list of one to three CubeAxis
+        :param: filter_tag_ids: only count objects that have all these tags
+        :param: sample_size: the number of object ids to return per cell,
+                             the lowest ones
+        :return: [CubeCell] of the non-empty cells, ordered by tag ids
+        """
+        raise NotImplementedError()
@@ -23,3 +23,13 @@ class BaseDimensionService(Service):
 
     def retrieve_dimension(self, root_node):
         raise NotImplementedError()
+
+    def retrieve_dimension_with_counts(self, root_node):
+        """
+        Retrieves a dimension with the number of objects tagged with each
+        node (direct_count) and with the node or any node below it
+        (subtree_count), each object counted once
+        :param: root_node: DimensionNode of the root
+        :return: the root DimensionNode, None if not found
+        """
+        raise NotImplementedError()
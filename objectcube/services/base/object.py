@@ -50,31 +50,108 @@ class BaseObjectService(Service):
         """
         raise NotImplementedError()
 
-    def retrieve(self, offset=0L, limit=10L):
+    def retrieve(self, offset=0L, limit=10L, after_id=0L):
         """
         Retrieves all objects in database
         :param: offset: the first object to return
         :param: limit: the number of objects to return
+        :param: after_id: only return objects with a greater id
         :return: [Object], empty set if none found
         """
         raise NotImplementedError()
 
-    def retrieve_by_regex(self, name, offset=0L, limit=10L):
+    def retrieve_by_regex(self, name, offset=0L, limit=10L, after_id=0L):
         """
         Retrieves a given object by regular expression on name
         :param: name: regular expression to match on name
         :param: offset: the first object to return
         :param: limit: the number of objects to return
+        :param: after_id: only return objects with a greater id
         :return: [Object], empty set if none found
         """
         raise NotImplementedError()
 
-    def retrieve_by_tag_id(self, tag_id, offset=0L, limit=10L):
+    def retrieve_by_tag_id(self, tag_id, offset=0L, limit=10L, after_id=0L):
         """
         Retrieves all objects tagged with a particular tag
         :param: tag: tag to match
         :param: offset: the first object to return
         :param: limit: the number of objects to return
+        :param: after_id: only return objects with a greater id
         :return: [Object], empty set if none found
         """
         raise NotImplementedError()
+
+    def iter_all(self, after_id=0L):
+        """
+        Iterates over all objects in id order, fetching them from the
+        database in batches. Close the iterator when stopping early.
+        :param: after_id: only return objects with a greater id
+        :return: iterator of Object
+        """
+        raise NotImplementedError()
+
+    def iter_by_tag_id(self, tag_id, after_id=0L):
+        """
+        Iterates over all objects tagged with a particular tag, in id
+        order, fetching them from the database in batches.
+        :param: tag_id: id of the tag to match
+        :param: after_id: only return objects with a greater id
+        :return: iterator of Object
+        """
+        raise NotImplementedError()
+
+    def retrieve_by_dimension_node(self, root_tag_id, node_tag_id,
+                                   offset=0L, limit=10L, after_id=0L):
+        """
+        Retrieves the objects tagged with a node of a dimension, or with
+        any node below it, each object once, in id order
+        :param: root_tag_id: id of the root tag of the dimension
+        :param: node_tag_id: id of the tag of the node
+        :param: offset: the first object to return
+        :param: limit: the number of objects to return
+        :param: after_id: only return objects with a greater id
+        :return: [Object], empty set if none found
+        """
+        raise NotImplementedError()
+
+    def count_by_dimension_node(self, root_tag_id, node_tag_id):
+        """
+        Counts the objects tagged with a node of a dimension, or with any
+        node below it, each object once
+        :param: root_tag_id: id of the root tag of the dimension
+        :param: node_tag_id: id of the tag of the node
+        :return: Number of objects as number
+        """
+        raise NotImplementedError()
+
+    def retrieve_by_filter(self, expression, offset=0L, limit=10L,
+                           after_id=0L):
+        """
+        Retrieves the objects matching a filter expression over their
+        tags, such as u'beach AND "2014" AND NOT people'
+        :param: expression: filter expression, see objectcube.filters
+        :param: offset: the first object to return
+        :param: limit: the number of objects to return
+        :param: after_id: only return objects with a greater id
+        :return: [Object], empty set if none found
+        """
+        raise NotImplementedError()
+
+    def count_by_filter(self, expression):
+        """
+        Counts the objects matching a filter expression over their tags
+        :param: expression: filter expression, see objectcube.filters
+        :return: Number of objects as number
+        """
+        raise NotImplementedError()
+
+    def retrieve_digests(self, first, last):
+        """
+        Fetch the distinct digests of objects within a range, in byte
+        order, e.g. to find the blobs no object refers to.
+        :param: first: the lowest digest to return
+        :param: last: the highest digest to return
+        :return: [digest], empty set if none found
+        """
+        raise NotImplementedError()
@@ -15,8 +15,8 @@ class BasePluginService(Service):
     def retrieve_by_name(self, name):
         raise NotImplementedError()
 
-    def retrieve(self, offset=0L, limit=10L):
+    def retrieve(self, offset=0L, limit=10L, after_id=0L):
         raise NotImplementedError()
 
-    def retrieve_by_regex(self, name, offset=0L, limit=10L):
+    def retrieve_by_regex(self, name, offset=0L, limit=10L, after_id=0L):
         raise NotImplementedError()
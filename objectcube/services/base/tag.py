@@ -12,6 +12,9 @@ class BaseTagService(Service):
     def retrieve_or_create(self, tag):
         raise NotImplementedError()
 
+    def retrieve_or_create_many(self, tags, page_size=1000L):
+        raise NotImplementedError()
+
     def update(self, tag):
         raise NotImplementedError()
 
@@ -24,14 +27,19 @@ class BaseTagService(Service):
     def retrieve_by_id(self, id_):
         raise NotImplementedError()
 
-    def retrieve(self, offset=0L, limit=10L):
+    def retrieve(self, offset=0L, limit=10L, after_id=0L):
+        raise NotImplementedError()
+
+    def retrieve_by_value(self, value, offset=0L, limit=10L, after_id=0L):
         raise NotImplementedError()
 
-    def retrieve_by_value(self, value, offset=0L, limit=10L):
+    def retrieve_by_plugin_id(self, plugin_id,
+                              offset=0L, limit=10L, after_id=0L):
         raise NotImplementedError()
 
-    def retrieve_by_plugin_id(self, plugin_id, offset=0L, limit=10L):
+    def retrieve_by_concept_id(self, concept_id,
+                               offset=0L, limit=10L, after_id=0L):
         raise NotImplementedError()
 
-    def retrieve_by_concept_id(self, concept_id, offset=0L, limit=10L):
+    def iter_by_concept_id(self, concept_id, after_id=0L):
         raise NotImplementedError()
@@ -0,0 +1,70 @@
+from service import Service
+
+
+class BaseTagIndexService(Service):
+    """
+    Answers questions about which objects have which tags from an index
+    of all the taggings held in memory, without a round trip to the
+    database for each. Each process has an index of its own, which it
+    loads on first use and keeps current from the changes that
+    TaggingService records.
+    """
+    def load(self):
+        """
+        Loads the index from the snapshot file, or from the taggings when
+        there is no recent snapshot, and reads the changes since.
+        """
+        raise NotImplementedError()
+
+    def refresh(self):
+        """
+        Applies the changes to the taggings made since the last refresh.
+        Queries refresh the index themselves when it is due.
+        """
+        raise NotImplementedError()
+
+    def save_snapshot(self):
+        """
+        Writes the index to the snapshot file, replacing it, so the next
+        load does not need to read all the taggings.
+        :return: the number of bytes written
+        """
+        raise NotImplementedError()
+
+    def prune_changes(self):
+        """
+        Deletes the recorded changes older than snapshots may be.
+        :return: the number of changes deleted
+        """
+        raise NotImplementedError()
+
+    def count_by_filter(self, expression):
+        """
+        Counts the objects that match a filter expression, see
+        objectcube.filters.
+        :param: expression: the expression, a unicode string
+        :return: the number of matching objects
+        """
+        raise NotImplementedError()
+
+    def retrieve_ids_by_filter(self, expression, limit=10L, after_id=0L):
+        """
+        Retrieves the ids of the objects that match a filter expression.
+        :param: expression: the expression, a unicode string
+        :param: limit: the maximum number of ids to return
+        :param: after_id: only return ids greater than this
+        :return: [id] in ascending order
+        """
+        raise NotImplementedError()
+
+    def retrieve_cells(self, axes, filter_tag_ids=None, sample_size=3L):
+        """
+        Counts the objects in every cell of a cube, like
+        CubeService.retrieve_cells().
+        :param: axes: list of one to three CubeAxis
+        :param: filter_tag_ids: only count objects that have all these tags
+        :param: sample_size: the number of object ids to return per cell,
+                             the lowest ones
+        :return: [CubeCell] of the non-empty cells, ordered by tag ids
+        """
+        raise NotImplementedError()
@@ -9,6 +9,9 @@ class BaseTaggingService(Service):
     def add(self, tagging):
         raise NotImplementedError()
 
+    def add_many(self, taggings, returning=True, page_size=1000L):
+        raise NotImplementedError()
+
     def update(self, tagging):
         raise NotImplementedError()
 
@@ -24,11 +27,19 @@ class BaseTaggingService(Service):
     def retrieve_by_id(self, id_):
         raise NotImplementedError()
 
-    def retrieve_by_tag_id(self, tag_id, offset=0L, limit=10L):
+    def retrieve_by_tag_id(self, tag_id, offset=0L, limit=10L, after_id=0L):
+        raise NotImplementedError()
+
+    def iter_by_tag_id(self, tag_id, after_id=0L):
+        raise NotImplementedError()
+
+    def retrieve_by_object_id(self, object_id,
+                              offset=0L, limit=10L, after_id=0L):
         raise NotImplementedError()
 
-    def retrieve_by_object_id(self, object_id, offset=0L, limit=10L):
+    def iter_by_object_id(self, object_id, after_id=0L):
         raise NotImplementedError()
 
-    def retrieve_by_set_id(self, plugin_set_id, offset=0L, limit=10L):
+    def retrieve_by_set_id(self, plugin_set_id,
+                           offset=0L, limit=10L, after_id=0L):
         raise NotImplementedError()
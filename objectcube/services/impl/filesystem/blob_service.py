@@ -1,43 +1,297 @@
+import binascii
 import os
+import re
 import cStringIO
+import errno
 import json
+import mmap
 import shutil
+import tempfile
+import time
 
 from objectcube.services.base import BaseBlobService
+from objectcube.services.impl.filesystem.catalog import BlobCatalog
+from objectcube.services.impl.filesystem.compression import ZLIB, \
+    ZlibReader, ZlibWriter, choose_encoding
 from objectcube.exceptions import ObjectCubeException
-from objectcube.utils import md5_from_stream
+from objectcube.utils import digest_algorithm, hash_and_copy
+from objectcube import settings
+from types import FloatType, IntType, LongType, NoneType
 from logging import getLogger
 
-READ_CHUNK_SIZE = 512
+WRITE_CHUNK_SIZE = 2**20
+STREAM_CHUNK_SIZE = 2**16
+META_SUFFIX = '.meta'
+CATALOG_NAME = 'catalog.sqlite3'
+TEMP_PREFIX = '.tmp-'
+
+# Digests are used as file and directory names, so they are limited to
+# characters that cannot escape the blob directory
+VALID_DIGEST = re.compile(r'^[0-9A-Za-z][0-9A-Za-z_-]*$')
+
+# Compressed blobs are stored under their digest with a suffix naming the
+# encoding, so a file can be read without the catalog. Files are looked
+# up in this order
+ENCODING_SUFFIXES = {ZLIB: '.z'}
+ENCODINGS = (None, ZLIB)
+
+
+def _fsync_directory(path):
+    # Makes a rename into the directory survive a crash
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_up_to(stream, size):
+    # Streams like sockets may return less than asked for before the end
+    chunks = []
+    while size > 0:
+        data = stream.read(size)
+        if not data:
+            break
+        chunks.append(data)
+        size -= len(data)
+    return ''.join(chunks)
+
+
+class _PrefixedStream(object):
+    """
+    Stream that returns data already read from another stream first, and
+    then the rest of that stream.
+    """
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.stream.read(size)
+        if size < 0:
+            data = self.prefix + self.stream.read()
+            self.prefix = ''
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        return data
+
+
+def _makedirs(path):
+    # Another process or thread may create the directory at the same time
+    try:
+        os.makedirs(path)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
 
 
 class FileBlobService(BaseBlobService):
+    """
+    Stores each blob in a file named by its digest. Files are spread over
+    two levels of directories named by the first two pairs of characters
+    of the digest, e.g. ab/cd/abcd..., so no directory grows too large.
+    Sizes and metadata of all blobs are kept in a catalog database in
+    the blob directory.
+
+    With settings.BLOB_COMPRESSION_LEVEL, blobs that compress well are
+    stored compressed, in files named by the digest and the suffix of the
+    encoding, and decompressed while they are read. Their digests and
+    sizes are those of the original data.
+
+    With settings.FILESYSTEM_BLOB_INDEX, the digests in the catalog are
+    loaded into memory at startup. A digest found there is reported as
+    present without touching the disk. Blobs are immutable and only
+    removed by delete(), so the index only misses blobs added by other
+    processes, which are looked up on disk and then remembered.
+    """
     def __init__(self):
         super(FileBlobService, self).__init__()
         self.logger = getLogger('FileBlobService')
-        self.blob_disk_location = os.environ.get('FILESYSTEM_BLOB_DIR',
-                                                 'blobs')
-        self.flush()
+        self.blob_disk_location = settings.FILESYSTEM_BLOB_DIR
+        _makedirs(self.blob_disk_location)
+        self.catalog = BlobCatalog(
+            os.path.join(self.blob_disk_location, CATALOG_NAME))
+
+        self.index = None
+        if settings.FILESYSTEM_BLOB_INDEX:
+            self.index = set(self.catalog.digests())
+            self.logger.info('Loaded %s digests', len(self.index))
 
     def flush(self):
         self.logger.debug('flush()')
+        self.catalog.close()
         if os.path.exists(os.path.join(self.blob_disk_location)):
             shutil.rmtree(self.blob_disk_location)
         os.makedirs(self.blob_disk_location)
+        if self.index is not None:
+            self.index.clear()
+
+    def _is_valid_digest(self, digest):
+        return isinstance(digest, basestring) \
+            and VALID_DIGEST.match(digest) is not None
+
+    def _get_shard_location(self, digest):
+        if not self._is_valid_digest(digest):
+            raise ObjectCubeException('Function requires valid digest')
+        # Digests other than MD5 start with the algorithm, so the shard is
+        # taken from the hex part
+        key = digest.rsplit('-', 1)[-1]
+        return os.path.join(self.blob_disk_location, key[0:2], key[2:4])
 
-    def _get_blob_path(self, digest):
-        return os.path.join(self.blob_disk_location, digest)
+    def _get_blob_path(self, digest, encoding=None):
+        path = os.path.join(self._get_shard_location(digest), digest)
+        if encoding:
+            path += ENCODING_SUFFIXES[encoding]
+        return path
+
+    def _find_blob(self, digest):
+        """
+        :return: (path, encoding) of the file of a blob, or None
+        """
+        for encoding in ENCODINGS:
+            path = self._get_blob_path(digest, encoding)
+            if os.path.exists(path):
+                return path, encoding
+        return None
+
+    def _parse_blob_name(self, name):
+        """
+        :return: (digest, encoding) of a blob file name, or None for
+                 other files
+        """
+        for encoding in ENCODINGS:
+            suffix = ENCODING_SUFFIXES.get(encoding, '')
+            if name.endswith(suffix):
+                digest = name[:len(name) - len(suffix)]
+                if self._is_valid_digest(digest):
+                    return digest, encoding
+        return None
+
+    def _measure(self, path, encoding):
+        # The size of the data before compression
+        if encoding != ZLIB:
+            return os.path.getsize(path)
+        size = 0
+        with ZlibReader(open(path, 'rb')) as f:
+            for data in iter(lambda: f.read(STREAM_CHUNK_SIZE), ''):
+                size += len(data)
+        return size
 
     def _get_meta_location(self, digest):
-        return os.path.join(self.blob_disk_location, '{0}.{1}'
-                            .format(digest, 'meta'))
+        # Metadata files written by earlier versions, see
+        # migrate_meta_files()
+        return os.path.join(self._get_shard_location(digest),
+                            digest + META_SUFFIX)
 
-    def retrieve_uri(self, digest):
-        self.logger.debug('has(): %s', repr(digest))
-        if self.has(digest):
-            return 'file://{}'.format(self._get_blob_path(digest))
+    def _read_meta_file(self, digest):
+        meta_file_path = self._get_meta_location(digest)
+        if not os.path.exists(meta_file_path):
+            return None
+        with open(meta_file_path, 'r') as fs:
+            return json.loads(fs.read().strip())
+
+    def migrate_flat_layout(self):
+        """
+        Moves blobs stored directly in the blob directory, by earlier
+        versions, into the sharded layout. Blobs that already exist in
+        the sharded layout are kept and the flat copy is removed.
+        :return: the number of files moved
+        """
+        self.logger.debug('migrate_flat_layout()')
+        moved = 0
+        for name in os.listdir(self.blob_disk_location):
+            flat_path = os.path.join(self.blob_disk_location, name)
+            digest = name[:-len(META_SUFFIX)] \
+                if name.endswith(META_SUFFIX) else name
+            if not self._is_valid_digest(digest) \
+                    or not os.path.isfile(flat_path):
+                continue
+
+            shard_path = os.path.join(self._get_shard_location(digest),
+                                      name)
+            _makedirs(os.path.dirname(shard_path))
+            if os.path.exists(shard_path):
+                os.remove(flat_path)
+            else:
+                os.rename(flat_path, shard_path)
+                moved += 1
+        self.logger.info('Moved %s files to the sharded layout', moved)
+        return moved
+
+    def migrate_meta_files(self):
+        """
+        Adds the blobs missing from the catalog, with the metadata from
+        the .meta files written by earlier versions, and removes those
+        files. Run migrate_flat_layout() first.
+        :return: the number of blobs added to the catalog
+        """
+        self.logger.debug('migrate_meta_files()')
+        added = 0
+        for level1 in os.listdir(self.blob_disk_location):
+            level1_path = os.path.join(self.blob_disk_location, level1)
+            if not os.path.isdir(level1_path):
+                continue
+            for level2 in os.listdir(level1_path):
+                shard = os.path.join(level1_path, level2)
+                names = set(os.listdir(shard))
+                blobs = dict(blob for blob in
+                             (self._parse_blob_name(name) for name in names)
+                             if blob is not None)
+                known = self.catalog.get_meta_many(blobs)
 
-        raise ObjectCubeException('No blob found by digest')
+                rows = []
+                for digest, encoding in blobs.items():
+                    if digest not in known:
+                        rows.append((digest,
+                                     self._measure(
+                                         self._get_blob_path(digest,
+                                                             encoding),
+                                         encoding),
+                                     self._read_meta_file(digest), encoding))
+                self.catalog.put_many(rows)
+                added += len(rows)
+
+                # Only remove the files once the catalog has the data
+                for name in names:
+                    if name.endswith(META_SUFFIX):
+                        os.remove(os.path.join(shard, name))
+        self.logger.info('Added %s blobs to the catalog', added)
+        return added
+
+    def migrate_compressed_names(self):
+        """
+        Renames the compressed blobs stored under their bare digest, as
+        recorded only in the catalog by earlier versions, to the name
+        with the suffix of their encoding.
+        :return: the number of files renamed
+        """
+        self.logger.debug('migrate_compressed_names()')
+        renamed = 0
+        for digest, encoding in self.catalog.list_encoded():
+            path = self._get_blob_path(digest)
+            encoded_path = self._get_blob_path(digest, encoding)
+            if os.path.exists(path) and not os.path.exists(encoded_path):
+                os.rename(path, encoded_path)
+                _fsync_directory(os.path.dirname(path))
+                renamed += 1
+        self.logger.info('Renamed %s compressed blobs', renamed)
+        return renamed
+
+    def retrieve_uri(self, digest):
+        """
+        The file of a compressed blob is not its data, so compressed blobs
+        have no URI, and are read with open_data() or iter_data().
+        """
+        self.logger.debug('retrieve_uri(): %s', repr(digest))
+        blob = self._find_blob(digest) if self.has(digest) else None
+        if blob is None:
+            raise ObjectCubeException('No blob found by digest')
+        path, encoding = blob
+        if encoding:
+            raise ObjectCubeException('Blob {0} is stored compressed, and '
+                                      'has no URI'.format(digest))
+        return 'file://{}'.format(path)
 
     def retrieve_meta(self, digest):
         self.logger.debug('retrieve_meta(): %s', repr(digest))
@@ -45,51 +299,450 @@ class FileBlobService(BaseBlobService):
             raise ObjectCubeException('No blob found by digest {}'
                                       .format(digest))
 
-        # Check if we have meta file on disk
-        meta_file_path = self._get_meta_location(digest)
+        meta = self.catalog.get_meta(digest)
+        if meta is None:
+            # Not in the catalog yet, as stored by an earlier version
+            meta = self._read_meta_file(digest)
+        return meta or dict()
 
-        # If not meta has been added, we return empty dict
-        if not os.path.exists(meta_file_path):
-            return dict()
-        with open(meta_file_path, 'r') as fs:
-            data = fs.read().strip()
-            d = json.loads(data)
-            return d
+    def retrieve_meta_many(self, digests):
+        self.logger.debug('retrieve_meta_many(): %s', repr(digests))
+        digests = [digest for digest in set(digests)
+                   if self._is_valid_digest(digest)]
 
-    def get_data(self, digest):
-        self.logger.debug('get_data(): %s', repr(digest))
+        found = self.catalog.get_meta_many(digests)
+        metas = {}
+        for digest, exists in self.has_many(digests).items():
+            if exists:
+                meta = found.get(digest)
+                if meta is None:
+                    meta = self._read_meta_file(digest)
+                metas[digest] = meta or dict()
+        return metas
+
+    def update_meta(self, digest, meta):
+        self.logger.debug('update_meta(): %s / %s', repr(digest), repr(meta))
         if not self.has(digest):
-            raise ObjectCubeException('Function requires valid digest')
+            raise ObjectCubeException('No blob found by digest {}'
+                                      .format(digest))
+        if not isinstance(meta, (dict, NoneType)):
+            raise ObjectCubeException('Function requires valid meta')
+
+        if not self.catalog.update_meta(digest, meta):
+            blob = self._find_blob(digest)
+            if blob is None:
+                raise ObjectCubeException('No blob found by digest {}'
+                                          .format(digest))
+            path, encoding = blob
+            self.catalog.put(digest, self._measure(path, encoding), meta,
+                             encoding)
 
-        blob_path = self._get_blob_path(digest)
+    def get_data(self, digest, streaming=False):
+        self.logger.debug('get_data(): %s', repr(digest))
+        if streaming:
+            return self.open_data(digest)
 
-        with open(blob_path, "rb") as f:
+        with self.open_data(digest) as f:
             data = cStringIO.StringIO(f.read())
             return data
 
+    def open_data(self, digest):
+        self.logger.debug('open_data(): %s', repr(digest))
+        if not self.has(digest):
+            raise ObjectCubeException('Function requires valid digest')
+        for encoding in ENCODINGS:
+            try:
+                f = open(self._get_blob_path(digest, encoding), 'rb')
+            except IOError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+                continue
+            if encoding == ZLIB:
+                return ZlibReader(f)
+            return f
+        # Collected by another process after it was indexed here
+        if self.index is not None:
+            self.index.discard(digest)
+        raise ObjectCubeException('No blob found by digest {}'
+                                  .format(digest))
+
+    def get_size(self, digest):
+        self.logger.debug('get_size(): %s', repr(digest))
+        if not self.has(digest):
+            raise ObjectCubeException('Function requires valid digest')
+        size = self.catalog.get_size(digest)
+        if size is None:
+            blob = self._find_blob(digest)
+            if blob is None:
+                raise ObjectCubeException('No blob found by digest {}'
+                                          .format(digest))
+            size = self._measure(*blob)
+        return size
+
+    def iter_data(self, digest, offset=0, length=None,
+                  chunk_size=STREAM_CHUNK_SIZE):
+        self.logger.debug('iter_data(): %s / %s / %s',
+                          repr(digest), repr(offset), repr(length))
+
+        if not isinstance(offset, (IntType, LongType)) or offset < 0:
+            raise ObjectCubeException('Function requires valid offset')
+        if not isinstance(length, (IntType, LongType, NoneType)) \
+                or (length is not None and length < 0):
+            raise ObjectCubeException('Function requires valid length')
+        if not isinstance(chunk_size, (IntType, LongType)) \
+                or chunk_size < 1:
+            raise ObjectCubeException('Function requires valid chunk size')
+
+        # Open the file now, so a missing blob raises before the first
+        # chunk is requested
+        return self._iter_file(self.open_data(digest), offset, length,
+                               chunk_size)
+
+    def _iter_file(self, f, offset, length, chunk_size):
+        with f:
+            f.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = chunk_size if remaining is None \
+                    else min(chunk_size, remaining)
+                data = f.read(size)
+                if not data:
+                    return
+                if remaining is not None:
+                    remaining -= len(data)
+                yield data
+
+    def map_data(self, digest):
+        self.logger.debug('map_data(): %s', repr(digest))
+        with self.open_data(digest) as f:
+            # Compressed blobs are returned decompressed instead
+            if isinstance(f, ZlibReader):
+                return f.read()
+            # Empty files cannot be mapped
+            if not os.fstat(f.fileno()).st_size:
+                return ''
+            # The mapping stays valid after the file is closed
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _write_temp(self, write):
+        # Temporary files are made in the blob directory, so they are
+        # renamed into place within one file system. Their names are not
+        # valid digests, so they are never taken for blobs
+        f = tempfile.NamedTemporaryFile(dir=self.blob_disk_location,
+                                        prefix=TEMP_PREFIX, delete=False)
+        try:
+            with f:
+                result = write(f)
+                f.flush()
+                os.fsync(f.fileno())
+        except:
+            os.remove(f.name)
+            raise
+        return f.name, result
+
+    def _move_into_place(self, temp_path, path):
+        try:
+            _makedirs(os.path.dirname(path))
+            os.rename(temp_path, path)
+            _fsync_directory(os.path.dirname(path))
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
     def add(self, stream, digest=None, meta=None):
         self.logger.debug('add(): %s / %s / %s',
                           repr(stream), repr(digest), repr(meta))
-        if not digest:
-            digest = md5_from_stream(stream)
-
-        if self.has(digest):
+        if digest and not self._is_valid_digest(digest):
+            raise ObjectCubeException('Function requires valid digest')
+        if digest and self._touch(digest):
             return digest
+        # A given digest is checked with its own algorithm, so blobs
+        # are found by the digests they were first added with
+        algorithm = digest_algorithm(digest) if digest else None
+
+        # Whether to compress is decided from the first chunk
+        head = _read_up_to(stream, WRITE_CHUNK_SIZE)
+        encoding = choose_encoding(head, settings.BLOB_COMPRESSION_LEVEL,
+                                   settings.BLOB_COMPRESSION_MIN_SIZE)
+        stream = _PrefixedStream(head, stream)
+
+        def write(f):
+            if encoding != ZLIB:
+                return hash_and_copy(stream, f, WRITE_CHUNK_SIZE, algorithm)
+            writer = ZlibWriter(f, settings.BLOB_COMPRESSION_LEVEL)
+            result = hash_and_copy(stream, writer, WRITE_CHUNK_SIZE,
+                                   algorithm)
+            writer.finish()
+            return result
 
-        blob_path = os.path.join(self.blob_disk_location, digest)
+        # Hash while writing to a temporary file, so the stream is read
+        # once and need not be seekable. The digest is of the data before
+        # compression. The blob only becomes visible by an atomic rename
+        # once it is complete and on disk
+        temp_path, (actual_digest, size) = self._write_temp(write)
+        self.logger.debug('add(): wrote %s bytes as %s', size, encoding)
 
-        with open(os.path.join(blob_path), 'wb') as file_fs:
-            data = stream.read(READ_CHUNK_SIZE)
-            while data:
-                file_fs.write(data)
-                data = stream.read(READ_CHUNK_SIZE)
+        if digest and digest != actual_digest:
+            os.remove(temp_path)
+            raise ObjectCubeException('Digest {0} does not match the data'
+                                      .format(digest))
+        digest = actual_digest
+
+        if self._touch(digest):
+            os.remove(temp_path)
+            return digest
 
-        if meta:
-            meta_file_path = self._get_meta_location(digest)
-            with open(meta_file_path, 'w') as fs:
-                fs.write(json.dumps(meta))
+        # The catalog row is written once the blob is in place, so every
+        # digest in the catalog, and in the index, is a stored blob. The
+        # file name tells whether it is compressed, so a blob left without
+        # a row by a crash is still read correctly
+        self._move_into_place(temp_path,
+                              self._get_blob_path(digest, encoding))
+        self.catalog.put(digest, size, meta, encoding)
+        if self.index is not None:
+            self.index.add(digest)
         return digest
 
+    def delete(self, digest):
+        self.logger.debug('delete(): %s', repr(digest))
+        if not self._remove(digest):
+            raise ObjectCubeException('No blob found by digest {}'
+                                      .format(digest))
+
+    def _touch(self, digest):
+        # Adding a blob again renews its modification time, so the garbage
+        # collector's grace period starts over for the new reference
+        for encoding in ENCODINGS:
+            try:
+                os.utime(self._get_blob_path(digest, encoding), None)
+            except OSError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+                continue
+            if self.index is not None:
+                self.index.add(digest)
+            return True
+        return False
+
+    def _exists(self, digest):
+        # Looks on disk, and remembers blobs added by other processes
+        exists = self._find_blob(digest) is not None
+        if exists and self.index is not None:
+            self.index.add(digest)
+        return exists
+
     def has(self, digest):
         self.logger.debug('has(): %s', repr(digest))
-        return os.path.exists(os.path.join(self.blob_disk_location, digest))
+        if not self._is_valid_digest(digest):
+            return False
+        if self.index is not None and digest in self.index:
+            return True
+        return self._exists(digest)
+
+    def has_many(self, digests):
+        self.logger.debug('has_many(): %s', repr(digests))
+        return dict((digest, self.has(digest)) for digest in digests)
+
+    def touch(self, digest):
+        self.logger.debug('touch(): %s', repr(digest))
+        if not self._is_valid_digest(digest):
+            return False
+        return self._touch(digest)
+
+    def touch_many(self, digests):
+        self.logger.debug('touch_many(): %s', repr(digests))
+        return dict((digest, self.touch(digest)) for digest in digests)
+
+    def collect_garbage(self, retrieve_referenced, dry_run=True,
+                        grace_period=None, batch_size=1000, pause=None,
+                        after='', time_limit=None):
+        """
+        Removes the blobs that are no longer referenced. The catalog is
+        read in pages of batch_size blobs in digest order, and the
+        references to each page are fetched for the same digest range,
+        so both sides are streamed without being held in memory.
+
+        Blobs modified within the grace period are kept, since a new
+        reference to them may not be visible yet; add() and touch() renew
+        the modification time of blobs added or found again. References
+        are checked once more just before a page is removed, and the
+        modification time once more as each blob is removed, so a blob
+        added again meanwhile is kept. Stale temporary files left by
+        failed writes are removed too.
+
+        A run stops after time_limit seconds, and can be continued from
+        the returned last digest.
+
+            object_service = get_service('ObjectService')
+            report = blob_service.collect_garbage(
+                object_service.retrieve_digests)
+
+        :param retrieve_referenced: callable taking the first and last
+                                    digest of a range, returning the
+                                    referenced digests within it
+        :param dry_run: only report what would be removed
+        :param grace_period: seconds, settings.BLOB_GC_GRACE_PERIOD if None
+        :param batch_size: the number of blobs checked at a time
+        :param pause: seconds to sleep after each batch, to throttle I/O,
+                      settings.BLOB_GC_PAUSE if None
+        :param after: only check blobs with a greater digest
+        :param time_limit: seconds to run for, or None to run to the end
+        :return: dict with the number of blobs scanned, unreferenced and
+                 kept as recent, the reclaimable bytes, the number of
+                 blobs and bytes removed, the number of stale temporary
+                 files, the last digest checked and whether the run
+                 reached the end of the catalog
+        """
+        self.logger.debug('collect_garbage(): %s / %s',
+                          repr(dry_run), repr(after))
+        if grace_period is None:
+            grace_period = settings.BLOB_GC_GRACE_PERIOD
+        if pause is None:
+            pause = settings.BLOB_GC_PAUSE
+
+        if not callable(retrieve_referenced):
+            raise ObjectCubeException('Function requires valid reference '
+                                      'lookup')
+        if not isinstance(grace_period, (IntType, LongType, FloatType)) \
+                or grace_period < 0:
+            raise ObjectCubeException('Function requires valid grace period')
+        if not isinstance(batch_size, (IntType, LongType)) or batch_size < 1:
+            raise ObjectCubeException('Function requires valid batch size')
+        if not isinstance(pause, (IntType, LongType, FloatType)) \
+                or pause < 0:
+            raise ObjectCubeException('Function requires valid pause')
+        if not isinstance(after, basestring):
+            raise ObjectCubeException('Function requires valid digest')
+        if not isinstance(time_limit, (IntType, LongType, FloatType,
+                                       NoneType)):
+            raise ObjectCubeException('Function requires valid time limit')
+
+        started = time.time()
+        cutoff = started - grace_period
+        report = {
+            'scanned': 0,
+            'unreferenced': 0,
+            'recent': 0,
+            'reclaimable_bytes': 0,
+            'removed': 0,
+            'removed_bytes': 0,
+            'stale_temp_files': self._collect_temp_files(cutoff, dry_run),
+            'last_digest': after,
+            'complete': False,
+        }
+
+        while True:
+            page = self.catalog.list_blobs(after, batch_size)
+            if not page:
+                report['complete'] = True
+                break
+
+            referenced = set(retrieve_referenced(page[0][0], page[-1][0]))
+            candidates = []
+            for digest, size in page:
+                report['scanned'] += 1
+                if digest in referenced:
+                    continue
+                modified = self._get_modified(digest)
+                if modified is None:
+                    # Removed by another collector
+                    continue
+                if modified > cutoff:
+                    report['recent'] += 1
+                    continue
+                report['unreferenced'] += 1
+                report['reclaimable_bytes'] += size
+                candidates.append((digest, size))
+
+            if candidates and not dry_run:
+                referenced = set(retrieve_referenced(candidates[0][0],
+                                                     candidates[-1][0]))
+                for digest, size in candidates:
+                    if digest not in referenced \
+                            and self._remove(digest, cutoff):
+                        report['removed'] += 1
+                        report['removed_bytes'] += size
+
+            after = report['last_digest'] = page[-1][0]
+            if time_limit is not None \
+                    and time.time() - started >= time_limit:
+                break
+            if pause:
+                time.sleep(pause)
+
+        self.logger.info('Garbage collection: %s', report)
+        return report
+
+    def _get_modified(self, digest):
+        for encoding in ENCODINGS:
+            try:
+                return os.path.getmtime(self._get_blob_path(digest, encoding))
+            except OSError:
+                continue
+        return None
+
+    def _remove(self, digest, cutoff=None):
+        """
+        Removes a blob, and with a cutoff only if it was not modified
+        after it.
+        :return: False if the blob was not found or was kept
+        """
+        if self.index is not None:
+            self.index.discard(digest)
+
+        # The blob is moved out of place before its modification time is
+        # checked. A concurrent add() then either renewed the time first,
+        # and the blob is put back, or no longer finds it and stores it
+        # again. Moved blobs left by a crash are removed as stale
+        # temporary files
+        trash_path = os.path.join(self.blob_disk_location, '{0}{1}.{2}'
+                                  .format(TEMP_PREFIX, digest,
+                                          binascii.hexlify(os.urandom(4))))
+        for encoding in ENCODINGS:
+            path = self._get_blob_path(digest, encoding)
+            try:
+                os.rename(path, trash_path)
+                break
+            except OSError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+        else:
+            self.catalog.delete(digest)
+            return False
+
+        if cutoff is not None and os.path.getmtime(trash_path) > cutoff:
+            self._restore(trash_path, path)
+            return False
+        try:
+            # Unless it was stored again meanwhile
+            if self._find_blob(digest) is None:
+                self.catalog.delete(digest)
+        finally:
+            os.remove(trash_path)
+        return True
+
+    def _restore(self, trash_path, path):
+        # A copy stored again meanwhile holds the same data
+        try:
+            os.link(trash_path, path)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        os.remove(trash_path)
+
+    def _collect_temp_files(self, cutoff, dry_run):
+        removed = 0
+        for name in os.listdir(self.blob_disk_location):
+            if not name.startswith(TEMP_PREFIX):
+                continue
+            path = os.path.join(self.blob_disk_location, name)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+        return removed
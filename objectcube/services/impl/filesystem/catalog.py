@@ -0,0 +1,284 @@
+import json
+import sqlite3
+import threading
+import time
+from logging import getLogger
+
+# Each entry upgrades the catalog by one version, tracked in
+# PRAGMA user_version. Entries are never changed once released.
+MIGRATIONS = [
+    'CREATE TABLE BLOBS ('
+    '  DIGEST TEXT PRIMARY KEY NOT NULL,'
+    '  SIZE INTEGER NOT NULL,'
+    '  META TEXT NULL'
+    ')',
+    # Blobs appended to segment files by PackBlobService. MODIFIED
+    # stands in for the modification time of a blob file.
+    'ALTER TABLE BLOBS ADD COLUMN SEGMENT_ID INTEGER NULL',
+    'ALTER TABLE BLOBS ADD COLUMN SEGMENT_OFFSET INTEGER NULL',
+    'ALTER TABLE BLOBS ADD COLUMN MODIFIED REAL NULL',
+    'CREATE INDEX BLOBS_SEGMENT_IDX ON BLOBS (SEGMENT_ID) '
+    'WHERE SEGMENT_ID IS NOT NULL',
+    # How the stored data is compressed, NULL if it is stored as is.
+    # SIZE remains the size of the data before compression.
+    'ALTER TABLE BLOBS ADD COLUMN ENCODING TEXT NULL',
+]
+
+# SQLite limits the number of parameters in one statement
+MAX_PARAMETERS = 500
+
+
+class BlobCatalog(object):
+    """
+    SQLite database with one row per blob in a blob directory, holding
+    its size and metadata. Every thread gets its own connection, and the
+    database runs in WAL mode so readers do not block the writer.
+    """
+    def __init__(self, path):
+        self.logger = getLogger('BlobCatalog')
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._generation = 0
+
+    def _connect(self):
+        # Statements commit on their own, transactions are explicit
+        connection = sqlite3.connect(self.path, timeout=30,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+
+        # BEGIN IMMEDIATE makes concurrent openers wait for each other
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            for sql in MIGRATIONS[version:]:
+                connection.execute(sql)
+            if version < len(MIGRATIONS):
+                connection.execute('PRAGMA user_version = {0}'
+                                   .format(len(MIGRATIONS)))
+                self.logger.info('Catalog %s migrated from version %s '
+                                 'to %s', self.path, version,
+                                 len(MIGRATIONS))
+            connection.execute('COMMIT')
+        except:
+            connection.execute('ROLLBACK')
+            connection.close()
+            raise
+        return connection
+
+    def _get_connection(self):
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            connection = self._connect()
+            with self._lock:
+                self._connections.append(connection)
+                local.connection = connection
+                local.generation = self._generation
+        return local.connection
+
+    def close(self):
+        """
+        Closes the connections of all threads. The catalog is opened
+        again by the next call, e.g. after the blob directory was removed.
+        """
+        with self._lock:
+            self._generation += 1
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+    def put(self, digest, size, meta=None, encoding=None):
+        self.put_many([(digest, size, meta, encoding)])
+
+    def put_many(self, rows):
+        """
+        Adds or replaces the rows of many blobs in one transaction.
+        :param rows: iterable of (digest, size, meta, encoding) tuples
+        """
+        connection = self._get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO BLOBS (DIGEST, SIZE, META, '
+                'ENCODING) VALUES (?, ?, ?, ?)',
+                ((digest, size, json.dumps(meta) if meta else None, encoding)
+                 for digest, size, meta, encoding in rows))
+            connection.execute('COMMIT')
+        except:
+            connection.execute('ROLLBACK')
+            raise
+
+    def put_packed_many(self, rows):
+        """
+        Adds or replaces the rows of many blobs stored in segment files,
+        in one transaction.
+        :param rows: iterable of (digest, size, meta, segment id, offset)
+                     tuples
+        """
+        modified = time.time()
+        connection = self._get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO BLOBS (DIGEST, SIZE, META, '
+                'SEGMENT_ID, SEGMENT_OFFSET, MODIFIED) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                ((digest, size, json.dumps(meta) if meta else None,
+                  segment_id, offset, modified)
+                 for digest, size, meta, segment_id, offset in rows))
+            connection.execute('COMMIT')
+        except:
+            connection.execute('ROLLBACK')
+            raise
+
+    def move_many(self, rows):
+        """
+        Points blobs to their new place in segment files, in one
+        transaction. Blobs removed in the meantime are skipped.
+        :param rows: iterable of (digest, old segment id, new segment id,
+                     new offset) tuples
+        """
+        connection = self._get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'UPDATE BLOBS SET SEGMENT_ID = ?, SEGMENT_OFFSET = ? '
+                'WHERE DIGEST = ? AND SEGMENT_ID = ?',
+                ((segment_id, offset, digest, old_segment_id)
+                 for digest, old_segment_id, segment_id, offset in rows))
+            connection.execute('COMMIT')
+        except:
+            connection.execute('ROLLBACK')
+            raise
+
+    def get_location(self, digest):
+        """
+        :return: (segment id, offset, size, modified) of a blob stored in
+                 a segment file, or None
+        """
+        return self._get_connection().execute(
+            'SELECT SEGMENT_ID, SEGMENT_OFFSET, SIZE, MODIFIED FROM BLOBS '
+            'WHERE DIGEST = ? AND SEGMENT_ID IS NOT NULL',
+            (digest,)).fetchone()
+
+    def touch(self, digest):
+        """
+        Renews the modification time of a blob stored in a segment file.
+        :return: False if no such blob is found
+        """
+        cursor = self._get_connection().execute(
+            'UPDATE BLOBS SET MODIFIED = ? '
+            'WHERE DIGEST = ? AND SEGMENT_ID IS NOT NULL',
+            (time.time(), digest))
+        return cursor.rowcount > 0
+
+    def get_segment_usage(self):
+        """
+        :return: dict of the bytes used by live blobs, by segment id
+        """
+        return dict(self._get_connection().execute(
+            'SELECT SEGMENT_ID, SUM(SIZE) FROM BLOBS '
+            'WHERE SEGMENT_ID IS NOT NULL GROUP BY SEGMENT_ID').fetchall())
+
+    def list_segment(self, segment_id):
+        """
+        :return: [(digest, offset, size)] of the blobs in a segment file,
+                 in offset order
+        """
+        return self._get_connection().execute(
+            'SELECT DIGEST, SEGMENT_OFFSET, SIZE FROM BLOBS '
+            'WHERE SEGMENT_ID = ? ORDER BY SEGMENT_OFFSET',
+            (segment_id,)).fetchall()
+
+    def update_meta(self, digest, meta):
+        """
+        :return: False if the catalog has no row for the digest
+        """
+        cursor = self._get_connection().execute(
+            'UPDATE BLOBS SET META = ? WHERE DIGEST = ?',
+            (json.dumps(meta) if meta else None, digest))
+        return cursor.rowcount > 0
+
+    def delete(self, digest, cutoff=None):
+        """
+        :param cutoff: keep a blob stored in a segment file if it was
+                       modified after this time
+        :return: False if no row was deleted
+        """
+        if cutoff is None:
+            cursor = self._get_connection().execute(
+                'DELETE FROM BLOBS WHERE DIGEST = ?', (digest,))
+        else:
+            cursor = self._get_connection().execute(
+                'DELETE FROM BLOBS WHERE DIGEST = ? '
+                'AND (SEGMENT_ID IS NULL OR MODIFIED <= ?)',
+                (digest, cutoff))
+        return cursor.rowcount > 0
+
+    def get_meta_many(self, digests):
+        """
+        :return: dict of the metadata of each digest found, where blobs
+                 without metadata have an empty dict
+        """
+        connection = self._get_connection()
+        digests = list(digests)
+        found = {}
+        for start in range(0, len(digests), MAX_PARAMETERS):
+            page = digests[start:start + MAX_PARAMETERS]
+            rows = connection.execute(
+                'SELECT DIGEST, META FROM BLOBS WHERE DIGEST IN ({0})'
+                .format(', '.join('?' * len(page))), page)
+            for digest, meta in rows:
+                found[digest] = json.loads(meta) if meta else {}
+        return found
+
+    def get_meta(self, digest):
+        """
+        :return: the metadata of the blob, or None if it is not found
+        """
+        return self.get_meta_many([digest]).get(digest)
+
+    def digests(self):
+        """
+        Iterates over the digests of all blobs, in sorted order.
+        """
+        cursor = self._get_connection().execute(
+            'SELECT DIGEST FROM BLOBS ORDER BY DIGEST')
+        for row in cursor:
+            yield row[0]
+
+    def list_blobs(self, after='', limit=1000):
+        """
+        Fetches a page of blobs in digest order, compared byte by byte.
+        :param after: only return blobs with a greater digest
+        :return: [(digest, size)]
+        """
+        return self._get_connection().execute(
+            'SELECT DIGEST, SIZE FROM BLOBS WHERE DIGEST > ? '
+            'ORDER BY DIGEST LIMIT ?', (after, limit)).fetchall()
+
+    def list_encoded(self):
+        """
+        :return: [(digest, encoding)] of the blobs stored compressed
+        """
+        return self._get_connection().execute(
+            'SELECT DIGEST, ENCODING FROM BLOBS '
+            'WHERE ENCODING IS NOT NULL').fetchall()
+
+    def get_encoding(self, digest):
+        """
+        :return: the encoding of the stored data, or None if it is stored
+                 as is or the blob is not found
+        """
+        row = self._get_connection().execute(
+            'SELECT ENCODING FROM BLOBS WHERE DIGEST = ?',
+            (digest,)).fetchone()
+        return row[0] if row else None
+
+    def get_size(self, digest):
+        row = self._get_connection().execute(
+            'SELECT SIZE FROM BLOBS WHERE DIGEST = ?', (digest,)).fetchone()
+        return row[0] if row else None
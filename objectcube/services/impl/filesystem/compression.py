@@ -0,0 +1,120 @@
+import zlib
+
+ZLIB = 'zlib'
+READ_CHUNK_SIZE = 2**16
+
+# Only a sample of the data is compressed to decide whether the whole of
+# it is worth compressing
+SAMPLE_SIZE = 2**16
+MAX_SAMPLE_RATIO = 0.9
+
+# Leading bytes of formats that are compressed already: JPEG, PNG, GIF,
+# ZIP (and Office documents), gzip, bzip2, xz, 7z, RAR, Ogg, FLAC and MP3
+COMPRESSED_SIGNATURES = ('\xff\xd8\xff', '\x89PNG', 'GIF8', 'PK\x03\x04',
+                         '\x1f\x8b', 'BZh', '\xfd7zXZ', '7z\xbc\xaf',
+                         'Rar!', 'OggS', 'fLaC', 'ID3')
+
+
+def choose_encoding(head, level, min_size):
+    """
+    Decides how to store a blob from its first bytes.
+    :param head: the first bytes of the blob, ideally SAMPLE_SIZE or more
+    :param level: zlib compression level, or 0 to never compress
+    :param min_size: blobs with a shorter head are not compressed
+    :return: ZLIB, or None to store the blob as is
+    """
+    if not level or len(head) < min_size:
+        return None
+    # MP4, MOV and HEIF files have the type box at offset 4
+    if head.startswith(COMPRESSED_SIGNATURES) or head[4:8] == 'ftyp':
+        return None
+    sample = head[:SAMPLE_SIZE]
+    if len(zlib.compress(sample, 1)) > len(sample) * MAX_SAMPLE_RATIO:
+        return None
+    return ZLIB
+
+
+class ZlibWriter(object):
+    """
+    Compresses the data written to it into a file. Call finish() after the
+    last write.
+    """
+    def __init__(self, f, level):
+        self.f = f
+        self.compressor = zlib.compressobj(level)
+
+    def write(self, data):
+        self.f.write(self.compressor.compress(data))
+
+    def finish(self):
+        self.f.write(self.compressor.flush())
+
+
+class ZlibReader(object):
+    """
+    Reads the decompressed data of a file written by ZlibWriter, holding
+    no more than a chunk of it in memory. Seeking backwards starts over
+    from the beginning of the file.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.decompressor = zlib.decompressobj()
+        self.buffer = ''
+        self.position = 0
+        self.done = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.f.close()
+
+    def _decompress_chunk(self):
+        # Returns an empty string only at the end of the data
+        while not self.done:
+            data = self.decompressor.unconsumed_tail \
+                or self.f.read(READ_CHUNK_SIZE)
+            if not data:
+                self.done = True
+                return self.decompressor.flush()
+            data = self.decompressor.decompress(data, READ_CHUNK_SIZE)
+            if data:
+                return data
+        return ''
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        available = len(self.buffer)
+        while size < 0 or available < size:
+            data = self._decompress_chunk()
+            if not data:
+                break
+            chunks.append(data)
+            available += len(data)
+
+        data = ''.join(chunks)
+        if 0 <= size < len(data):
+            data, self.buffer = data[:size], data[size:]
+        else:
+            self.buffer = ''
+        self.position += len(data)
+        return data
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        if whence != 0:
+            raise IOError('Compressed blobs only seek from the start')
+        if offset < self.position:
+            self.f.seek(0)
+            self.decompressor = zlib.decompressobj()
+            self.buffer = ''
+            self.position = 0
+            self.done = False
+        while self.position < offset:
+            if not self.read(min(offset - self.position, READ_CHUNK_SIZE)):
+                break
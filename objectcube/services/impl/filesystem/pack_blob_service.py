@@ -0,0 +1,350 @@
+import os
+import errno
+import fcntl
+import io
+import mmap
+import threading
+
+from objectcube.services.impl.filesystem.blob_service import \
+    FileBlobService, _PrefixedStream, _fsync_directory, _makedirs, \
+    _read_up_to
+from objectcube.exceptions import ObjectCubeException
+from objectcube.utils import digest_algorithm, digest_from_value
+from objectcube import settings
+from types import FloatType, IntType, LongType
+from logging import getLogger
+
+SEGMENT_DIR = 'segments'
+SEGMENT_SUFFIX = '.pack'
+LOCK_NAME = '.lock'
+
+
+class PackBlobService(FileBlobService):
+    """
+    Stores blobs of up to settings.PACK_BLOB_MAX_SIZE bytes back to back
+    in segment files of about settings.PACK_SEGMENT_SIZE bytes, so millions
+    of small blobs do not need millions of files. The catalog records the
+    segment and offset of each of them. Larger blobs are stored in files of
+    their own, like FileBlobService does.
+
+    Packed blobs are not compressed, as small blobs gain little from it.
+    Blobs are only appended to the newest segment. Removed blobs leave
+    their bytes behind until compact() rewrites the segments where
+    removed blobs take up much of the space. Segments are read through
+    memory maps.
+    """
+    def __init__(self):
+        super(PackBlobService, self).__init__()
+        self.logger = getLogger('PackBlobService')
+        self.segment_location = os.path.join(self.blob_disk_location,
+                                             SEGMENT_DIR)
+        _makedirs(self.segment_location)
+        self._append_lock = threading.Lock()
+        self._lock_file = None
+        self._segment_id = None
+        self._maps = {}
+        self._maps_lock = threading.Lock()
+
+    def flush(self):
+        with self._append_lock:
+            self._close()
+            super(PackBlobService, self).flush()
+            _makedirs(self.segment_location)
+
+    def _close(self):
+        # Maps are not closed, as other threads may still be reading from
+        # them; each is unmapped once no longer referenced
+        with self._maps_lock:
+            self._maps = {}
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self._segment_id = None
+
+    def _get_segment_path(self, segment_id):
+        return os.path.join(self.segment_location,
+                            '{0:08d}{1}'.format(segment_id, SEGMENT_SUFFIX))
+
+    def _get_segment_ids(self):
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)])
+                      for name in os.listdir(self.segment_location)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def _lock(self):
+        # Serialises appends across processes. Threads of this process are
+        # serialised by _append_lock, as they share the lock file
+        if self._lock_file is None:
+            self._lock_file = open(os.path.join(self.segment_location,
+                                                LOCK_NAME), 'a')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+
+    def _unlock(self):
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _get_active_segment_id(self):
+        # Another process may have started a newer segment. Call with the
+        # lock held
+        if self._segment_id is None:
+            self._segment_id = (self._get_segment_ids() or [1])[-1]
+        while os.path.exists(self._get_segment_path(self._segment_id + 1)):
+            self._segment_id += 1
+        return self._segment_id
+
+    def _append(self, blobs, record):
+        """
+        Appends data to the newest segment, starting a new one when it is
+        full, and makes it durable.
+        :param blobs: list of strings
+        :param record: function called with [(segment id, offset)] of each
+                       string to catalog them, before the lock is released.
+                       Until then, compact() would take the bytes for those
+                       of removed blobs once the segment is full
+        :return: [(segment id, offset)] of each string
+        """
+        locations = []
+        with self._append_lock:
+            self._lock()
+            f = None
+            try:
+                for data in blobs:
+                    if f is not None \
+                            and f.tell() >= settings.PACK_SEGMENT_SIZE:
+                        self._sync_segment(f)
+                        f.close()
+                        f = None
+                    if f is None:
+                        f = self._open_active_segment()
+                    locations.append((self._segment_id, f.tell()))
+                    f.write(data)
+                if f is not None:
+                    self._sync_segment(f)
+                    f.close()
+                    f = None
+                record(locations)
+            finally:
+                if f is not None:
+                    f.close()
+                self._unlock()
+        return locations
+
+    def _open_active_segment(self):
+        while True:
+            f = open(self._get_segment_path(self._get_active_segment_id()),
+                     'ab')
+            f.seek(0, os.SEEK_END)
+            if f.tell() < settings.PACK_SEGMENT_SIZE:
+                return f
+            f.close()
+            self._segment_id += 1
+
+    def _sync_segment(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+        _fsync_directory(self.segment_location)
+
+    def _map(self, segment_id, end):
+        # Maps are kept and replaced once the segment has grown past them
+        with self._maps_lock:
+            mapping = self._maps.get(segment_id)
+            if mapping is None or len(mapping) < end:
+                with open(self._get_segment_path(segment_id), 'rb') as f:
+                    mapping = mmap.mmap(f.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+                self._maps[segment_id] = mapping
+            return mapping
+
+    def _read_packed(self, digest):
+        """
+        :return: the data of a blob stored in a segment, or None if the
+                 blob is not stored in a segment
+        """
+        # A compaction may move the blob between looking it up and reading
+        # it, so look again if its segment is gone
+        for _ in range(2):
+            location = self.catalog.get_location(digest)
+            if location is None:
+                return None
+            segment_id, offset, size, modified = location
+            if not size:
+                return ''
+            try:
+                mapping = self._map(segment_id, offset + size)
+            except IOError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+                continue
+            return mapping[offset:offset + size]
+        raise ObjectCubeException('No blob found by digest {}'
+                                  .format(digest))
+
+    def add(self, stream, digest=None, meta=None):
+        self.logger.debug('add(): %s / %s / %s',
+                          repr(stream), repr(digest), repr(meta))
+        if digest and not self._is_valid_digest(digest):
+            raise ObjectCubeException('Function requires valid digest')
+        if digest and self._touch(digest):
+            return digest
+
+        # Blobs over the threshold are written to files of their own
+        data = _read_up_to(stream, settings.PACK_BLOB_MAX_SIZE + 1)
+        if len(data) > settings.PACK_BLOB_MAX_SIZE:
+            return super(PackBlobService, self).add(
+                _PrefixedStream(data, stream), digest, meta)
+
+        actual_digest = digest_from_value(
+            data, digest_algorithm(digest) if digest else None)
+        if digest and digest != actual_digest:
+            raise ObjectCubeException('Digest {0} does not match the data'
+                                      .format(digest))
+        digest = actual_digest
+        if self._touch(digest):
+            return digest
+
+        self._append([data], lambda locations: self.catalog.put_packed_many(
+            [(digest, len(data), meta) + location
+             for location in locations]))
+        if self.index is not None:
+            self.index.add(digest)
+        return digest
+
+    def _touch(self, digest):
+        if self.catalog.touch(digest):
+            if self.index is not None:
+                self.index.add(digest)
+            return True
+        return super(PackBlobService, self)._touch(digest)
+
+    def _exists(self, digest):
+        if self.catalog.get_location(digest) is not None:
+            if self.index is not None:
+                self.index.add(digest)
+            return True
+        return super(PackBlobService, self)._exists(digest)
+
+    def _get_modified(self, digest):
+        location = self.catalog.get_location(digest)
+        if location is not None:
+            return location[3]
+        return super(PackBlobService, self)._get_modified(digest)
+
+    def _remove(self, digest, cutoff=None):
+        # The bytes of a packed blob are reclaimed by compact()
+        if self.catalog.get_location(digest) is None:
+            return super(PackBlobService, self)._remove(digest, cutoff)
+        if self.index is not None:
+            self.index.discard(digest)
+        # The modification time is checked by the statement that deletes
+        # the row, so a concurrent add() either renews it first, and the
+        # blob is kept, or no longer finds the blob and stores it again
+        return self.catalog.delete(digest, cutoff)
+
+    def retrieve_uri(self, digest):
+        """
+        A packed blob is part of a segment, which compact() may remove, so
+        packed blobs have no URI, and are read with open_data() or
+        iter_data().
+        """
+        self.logger.debug('retrieve_uri(): %s', repr(digest))
+        location = self.catalog.get_location(digest) \
+            if self._is_valid_digest(digest) else None
+        if location is None:
+            return super(PackBlobService, self).retrieve_uri(digest)
+        raise ObjectCubeException('Blob {0} is stored in a segment, and has '
+                                  'no URI'.format(digest))
+
+    def get_data(self, digest, streaming=False):
+        self.logger.debug('get_data(): %s', repr(digest))
+        data = self._read_packed(digest) \
+            if self._is_valid_digest(digest) else None
+        if data is None:
+            return super(PackBlobService, self).get_data(digest, streaming)
+        return io.BytesIO(data)
+
+    def open_data(self, digest):
+        self.logger.debug('open_data(): %s', repr(digest))
+        data = self._read_packed(digest) \
+            if self._is_valid_digest(digest) else None
+        if data is None:
+            return super(PackBlobService, self).open_data(digest)
+        return io.BytesIO(data)
+
+    def get_size(self, digest):
+        self.logger.debug('get_size(): %s', repr(digest))
+        location = self.catalog.get_location(digest) \
+            if self._is_valid_digest(digest) else None
+        if location is None:
+            return super(PackBlobService, self).get_size(digest)
+        return location[2]
+
+    def map_data(self, digest):
+        # Packed blobs are small, so they are returned as a copy rather
+        # than as a map of their own
+        self.logger.debug('map_data(): %s', repr(digest))
+        data = self._read_packed(digest) \
+            if self._is_valid_digest(digest) else None
+        if data is None:
+            return super(PackBlobService, self).map_data(digest)
+        return data
+
+    def compact(self, max_garbage=0.5):
+        """
+        Rewrites the segments where more than max_garbage of the bytes
+        belong to removed blobs. Their live blobs are appended to the
+        newest segment, and the old segment is removed. The newest
+        segment is never compacted.
+        :param max_garbage: fraction of removed bytes, between 0 and 1
+        :return: dict with the number of segments compacted and the
+                 number of bytes reclaimed
+        """
+        self.logger.debug('compact(): %s', repr(max_garbage))
+        if not isinstance(max_garbage, (IntType, LongType, FloatType)) \
+                or not 0 <= max_garbage < 1:
+            raise ObjectCubeException('Function requires valid max garbage')
+
+        report = {'segments': 0, 'reclaimed_bytes': 0}
+        with self._append_lock:
+            self._lock()
+            try:
+                active = self._get_active_segment_id()
+            finally:
+                self._unlock()
+
+        usage = self.catalog.get_segment_usage()
+        for segment_id in self._get_segment_ids():
+            if segment_id >= active:
+                continue
+            path = self._get_segment_path(segment_id)
+            size = os.path.getsize(path)
+            live = usage.get(segment_id, 0)
+            if size and float(size - live) / size <= max_garbage:
+                continue
+
+            blobs = self.catalog.list_segment(segment_id)
+            if blobs:
+                mapping = self._map(segment_id, size)
+                self._append(
+                    [mapping[offset:offset + length]
+                     for digest, offset, length in blobs],
+                    lambda locations: self.catalog.move_many(
+                        (digest, segment_id, new_segment_id, new_offset)
+                        for (digest, offset, length), (new_segment_id,
+                                                       new_offset)
+                        in zip(blobs, locations)))
+
+            # Another process compacting at the same time may have moved
+            # or removed the blobs first
+            if self.catalog.list_segment(segment_id):
+                continue
+            with self._maps_lock:
+                self._maps.pop(segment_id, None)
+            try:
+                os.remove(path)
+            except OSError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+                continue
+            report['segments'] += 1
+            report['reclaimed_bytes'] += size - live
+
+        self.logger.info('Compaction: %s', report)
+        return report
@@ -0,0 +1,356 @@
+"""
+Compressed bitmaps of non-negative integers, laid out like Roaring
+bitmaps. The integers are split by their high bits into chunks of 2**16,
+and each chunk is kept as a sorted array of the low 16 bits of its
+integers while it holds up to ARRAY_MAX of them, or as a long of 2**16
+bits once it holds more. A sparse chunk costs 2 bytes per integer, and a
+dense one at most 8 KiB, so no integer costs more than 2 bytes.
+
+Operations on two dense chunks are single operations on longs, which
+Python performs in C.
+"""
+import binascii
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+
+CHUNK_BITS = 16
+LOW_MASK = (1 << CHUNK_BITS) - 1
+ARRAY_MAX = 4096
+
+# Dense chunks are converted to and from strings of 2**13 bytes, the
+# least significant first
+_CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+_HEX_FORMAT = '%0{0}x'.format(2 * _CHUNK_BYTES)
+_NONZERO = re.compile(r'[^\x00]')
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1)
+              for byte in range(256)]
+
+
+def _alternating_mask(width):
+    # Fields of width one bits and width zero bits, across a dense chunk
+    field = (1 << width) - 1
+    mask = 0
+    for shift in range(0, 1 << CHUNK_BITS, 2 * width):
+        mask |= field << shift
+    return mask
+
+
+_M1, _M2, _M4, _M8, _M16 = [_alternating_mask(1 << n) for n in range(5)]
+
+
+def _popcount(bits):
+    # Counts the bits of each 2, 4, ... 32 bit field in parallel. The sum
+    # of the 32 bit fields is then the remainder modulo 2**32 - 1, as it
+    # is less than that
+    bits -= bits >> 1 & _M1
+    bits = (bits & _M2) + (bits >> 2 & _M2)
+    bits = (bits + (bits >> 4)) & _M4
+    bits = (bits + (bits >> 8)) & _M8
+    bits = (bits + (bits >> 16)) & _M16
+    return int(bits % 0xFFFFFFFF)
+
+
+def _to_bits(values):
+    data = bytearray(_CHUNK_BYTES)
+    for value in values:
+        data[value >> 3] |= 1 << (value & 7)
+    data.reverse()
+    return long(binascii.hexlify(data), 16)
+
+
+def _to_bytes(bits):
+    return binascii.unhexlify(_HEX_FORMAT % bits)[::-1]
+
+
+def _iter_bits(bits, start=0):
+    # The set bits from start on, in ascending order. Only the bytes
+    # that are not zero are visited
+    data = _to_bytes(bits)
+    for match in _NONZERO.finditer(data, start >> 3):
+        offset = match.start()
+        for bit in _BYTE_BITS[ord(data[offset])]:
+            value = offset * 8 + bit
+            if value >= start:
+                yield value
+
+
+def _filter(values, bits, keep):
+    # The values of a sparse chunk that are, or are not, in a dense one
+    data = bytearray(_to_bytes(bits))
+    return array('H', [value for value in values
+                       if (data[value >> 3] >> (value & 7) & 1) == keep])
+
+
+def _and(a, b):
+    if type(a) is array:
+        if type(b) is array:
+            return array('H', sorted(set(a).intersection(b)))
+        return _filter(a, b, True)
+    if type(b) is array:
+        return _filter(b, a, True)
+    return a & b
+
+
+def _and_len(a, b):
+    if type(a) is array and type(b) is array:
+        return len(set(a).intersection(b))
+    return _len(_and(a, b))
+
+
+def _or(a, b):
+    if type(a) is array and type(b) is array:
+        values = sorted(set(a).union(b))
+        if len(values) <= ARRAY_MAX:
+            return array('H', values)
+        return _to_bits(values)
+    if type(a) is array:
+        a = _to_bits(a)
+    if type(b) is array:
+        b = _to_bits(b)
+    return a | b
+
+
+def _sub(a, b):
+    if type(a) is array:
+        if type(b) is array:
+            return array('H', sorted(set(a).difference(b)))
+        return _filter(a, b, False)
+    if type(b) is array:
+        b = _to_bits(b)
+    return a & ~b
+
+
+def _len(chunk):
+    if type(chunk) is array:
+        return len(chunk)
+    return _popcount(chunk)
+
+
+class Bitmap(object):
+    """
+    A set of non-negative integers. Supports len(), in, iteration in
+    ascending order, &, | and -, and add() and discard(). The results of
+    operations share no chunks with their operands.
+    """
+    __slots__ = ('_chunks', '_size')
+
+    def __init__(self, values=()):
+        self._chunks = {}
+        self._size = 0
+        for value in values:
+            self.add(value)
+
+    @classmethod
+    def from_sorted(cls, values):
+        """
+        Builds a bitmap from integers in ascending order, which may repeat,
+        faster than adding them one by one.
+        """
+        bitmap = cls()
+        for key, group in groupby(values, lambda value: value >> CHUNK_BITS):
+            low = sorted(set(value & LOW_MASK for value in group))
+            bitmap._chunks[key] = array('H', low) \
+                if len(low) <= ARRAY_MAX else _to_bits(low)
+            bitmap._size += len(low)
+        return bitmap
+
+    @classmethod
+    def _from_chunks(cls, chunks):
+        bitmap = cls()
+        bitmap._chunks = dict((key, chunk) for key, chunk in chunks.items()
+                              if chunk)
+        bitmap._size = None
+        return bitmap
+
+    def __len__(self):
+        if self._size is None:
+            self._size = sum(_len(chunk) for chunk in self._chunks.values())
+        return self._size
+
+    def __nonzero__(self):
+        return bool(self._chunks)
+
+    def __contains__(self, value):
+        chunk = self._chunks.get(value >> CHUNK_BITS)
+        if chunk is None:
+            return False
+        low = value & LOW_MASK
+        if type(chunk) is array:
+            index = bisect_left(chunk, low)
+            return index < len(chunk) and chunk[index] == low
+        return bool(chunk >> low & 1)
+
+    def __iter__(self):
+        return self.iter_after(-1)
+
+    def iter_after(self, start):
+        """
+        Iterates over the integers greater than start, in ascending order.
+        """
+        first_key = (start + 1) >> CHUNK_BITS
+        for key in sorted(key for key in self._chunks if key >= first_key):
+            chunk = self._chunks[key]
+            base = long(key) << CHUNK_BITS
+            low = (start + 1) & LOW_MASK if key == first_key else 0
+            if type(chunk) is array:
+                for i in xrange(bisect_left(chunk, low), len(chunk)):
+                    yield base | chunk[i]
+            else:
+                for value in _iter_bits(chunk, low):
+                    yield base | value
+
+    def last(self):
+        """
+        :return: the greatest integer, or None when the bitmap is empty
+        """
+        if not self._chunks:
+            return None
+        key = max(self._chunks)
+        chunk = self._chunks[key]
+        low = chunk[-1] if type(chunk) is array else chunk.bit_length() - 1
+        return long(key) << CHUNK_BITS | low
+
+    def add(self, value):
+        """
+        :return: True if the value was not in the bitmap
+        """
+        key, low = value >> CHUNK_BITS, value & LOW_MASK
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            self._chunks[key] = array('H', [low])
+        elif type(chunk) is array:
+            index = bisect_left(chunk, low)
+            if index < len(chunk) and chunk[index] == low:
+                return False
+            chunk.insert(index, low)
+            if len(chunk) > ARRAY_MAX:
+                self._chunks[key] = _to_bits(chunk)
+        elif chunk >> low & 1:
+            return False
+        else:
+            self._chunks[key] = chunk | 1 << low
+        if self._size is not None:
+            self._size += 1
+        return True
+
+    def discard(self, value):
+        """
+        :return: True if the value was in the bitmap
+        """
+        key, low = value >> CHUNK_BITS, value & LOW_MASK
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            return False
+        if type(chunk) is array:
+            index = bisect_left(chunk, low)
+            if index == len(chunk) or chunk[index] != low:
+                return False
+            del chunk[index]
+        elif not chunk >> low & 1:
+            return False
+        else:
+            # Dense chunks stay dense until the bitmap is rebuilt
+            chunk &= ~(1 << low)
+            self._chunks[key] = chunk
+        if not chunk:
+            del self._chunks[key]
+        if self._size is not None:
+            self._size -= 1
+        return True
+
+    def __and__(self, other):
+        if len(self._chunks) > len(other._chunks):
+            self, other = other, self
+        return Bitmap._from_chunks(
+            dict((key, _and(chunk, other._chunks[key]))
+                 for key, chunk in self._chunks.items()
+                 if key in other._chunks))
+
+    def __or__(self, other):
+        chunks = dict(other._chunks)
+        for key, chunk in self._chunks.items():
+            chunks[key] = _or(chunk, chunks[key]) if key in chunks \
+                else _copy(chunk)
+        for key, chunk in chunks.items():
+            if key not in self._chunks:
+                chunks[key] = _copy(chunk)
+        return Bitmap._from_chunks(chunks)
+
+    def __sub__(self, other):
+        return Bitmap._from_chunks(
+            dict((key, _sub(chunk, other._chunks[key])
+                  if key in other._chunks else _copy(chunk))
+                 for key, chunk in self._chunks.items()))
+
+    def intersection_len(self, other):
+        """
+        len(self & other), without building the intersection.
+        """
+        if len(self._chunks) > len(other._chunks):
+            self, other = other, self
+        return sum(_and_len(chunk, other._chunks[key])
+                   for key, chunk in self._chunks.items()
+                   if key in other._chunks)
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Bitmap({0} integers in {1} chunks)'.format(
+            len(self), len(self._chunks))
+
+    def memory_size(self):
+        """
+        The approximate number of bytes the bitmap takes up in memory.
+        """
+        return sys.getsizeof(self) + sys.getsizeof(self._chunks) \
+            + sum(sys.getsizeof(key) + sys.getsizeof(chunk)
+                  for key, chunk in self._chunks.items())
+
+    def dump(self):
+        """
+        :return: the chunks as a dict of plain strings and longs, which
+                 marshal can write, for load()
+        """
+        return dict((key, chunk.tostring() if type(chunk) is array
+                     else chunk) for key, chunk in self._chunks.items())
+
+    @classmethod
+    def load(cls, chunks):
+        """
+        Rebuilds a bitmap from the output of dump(), on a machine of the
+        same byte order.
+        """
+        bitmap = cls()
+        for key, chunk in chunks.items():
+            if isinstance(chunk, str):
+                bitmap._chunks[key] = array('H', chunk)
+                bitmap._size += len(chunk) // 2
+            else:
+                bitmap._chunks[key] = chunk
+                bitmap._size += _popcount(chunk)
+        return bitmap
+
+
+def _copy(chunk):
+    # Longs are immutable, arrays are not
+    return array('H', chunk) if type(chunk) is array else chunk
+
+
+def union(bitmaps):
+    """
+    The union of any number of bitmaps.
+    """
+    chunks = {}
+    for bitmap in bitmaps:
+        for key, chunk in bitmap._chunks.items():
+            chunks.setdefault(key, []).append(chunk)
+    return Bitmap._from_chunks(dict(
+        (key, reduce(_or, parts[1:], _copy(parts[0])))
+        for key, parts in chunks.items()))
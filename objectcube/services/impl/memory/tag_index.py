@@ -0,0 +1,435 @@
+import errno
+import marshal
+import os
+import tempfile
+import threading
+import time
+from itertools import islice
+
+from objectcube.services.base import BaseTagIndexService
+from objectcube.services.impl.memory.bitmap import Bitmap, union
+from objectcube.services.impl.postgresql.utils import \
+    execute_sql_fetch_single, execute_sql_fetch_multiple, execute_sql_iterate
+from objectcube.services.impl.postgresql.cube import MAX_AXES, \
+    validate_axis, is_id_list
+from objectcube.exceptions import ObjectCubeException
+from objectcube.data_objects import CubeCell
+from objectcube.filters import parse_filter, filter_terms
+from objectcube import settings
+from types import LongType, ListType, NoneType, UnicodeType
+from logging import getLogger
+
+# Snapshots written in another layout are ignored
+SNAPSHOT_VERSION = 1
+
+# The number of tags whose object ids are fetched at a time when loading
+LOAD_ITERSIZE = 100
+
+DB_NOW = 'EXTRACT(EPOCH FROM CLOCK_TIMESTAMP())::FLOAT8'
+
+
+class TagIndexService(BaseTagIndexService):
+    """
+    Keeps the ids of the objects of every tag in a compressed bitmap, and
+    the ids of all objects in another, for negations. Filters and cube
+    cells are computed on the bitmaps, and only the values of tags are
+    looked up in the database.
+
+    The index applies the rows TaggingService appends to TAGGING_CHANGES,
+    so settings.TAGGING_CHANGE_FEED must be on in every process that
+    changes taggings. Objects that are deleted, and untagged objects
+    created with an id below one the index has seen, only show up in
+    negations after the index is loaded from the taggings again.
+
+    Every process holds an index of its own. One thread at a time loads
+    or refreshes it, reading the database without blocking lookups,
+    which only wait while the bitmaps are swapped in or the changes read
+    are applied. Lookups made while another thread refreshes the index
+    use it as it is.
+    """
+    def __init__(self):
+        super(TagIndexService, self).__init__()
+        self.logger = getLogger('TagIndexService')
+        # Guards the bitmaps, which only the thread holding the update
+        # lock changes
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._tags = None
+        self._objects = None
+        # Set once the index is loaded and caught up with the changes
+        self._loaded = False
+        self._last_change_id = 0L
+        # Changes created after this database time are read again
+        self._since = None
+        self._refreshed = 0
+
+    def _position(self):
+        # The last change so far, and the time of the database
+        sql = 'SELECT COALESCE(MAX(ID), 0) AS ID, {0} AS NOW ' \
+              'FROM TAGGING_CHANGES'.format(DB_NOW)
+        return execute_sql_fetch_single(lambda id, now: (id, now), sql)
+
+    def load(self):
+        self.logger.debug('load()')
+        with self._update_lock:
+            self._load()
+
+    def _load(self):
+        # Call with the update lock held
+        tags, objects, last_change_id, since = \
+            self._read_snapshot() or self._read_taggings()
+        with self._lock:
+            self._tags, self._objects = tags, objects
+        self._last_change_id = last_change_id
+        self._since = since
+        self._refresh()
+        self._loaded = True
+
+    def _read_taggings(self):
+        # Output: (tags, objects, last change id, since) of a new index
+        last_change_id, now = self._position()
+        tags = {}
+        sql = 'SELECT TAG_ID, ' \
+              '  ARRAY_AGG(DISTINCT OBJECT_ID ORDER BY OBJECT_ID) ' \
+              '    AS OBJECT_IDS ' \
+              'FROM TAGGINGS ' \
+              'GROUP BY TAG_ID'
+        for tag_id, object_ids in execute_sql_iterate(
+                lambda tag_id, object_ids: (tag_id, object_ids), sql, (),
+                LOAD_ITERSIZE):
+            tags[tag_id] = Bitmap.from_sorted(object_ids)
+
+        # Read after the taggings, so it has every object they refer to
+        sql = 'SELECT ID ' \
+              'FROM OBJECTS ' \
+              'ORDER BY ID'
+        objects = Bitmap.from_sorted(execute_sql_iterate(lambda id: id, sql))
+
+        self.logger.info('Loaded %s tags from the taggings', len(tags))
+        return (tags, objects, last_change_id,
+                now - settings.TAG_INDEX_CHANGE_LOOKBACK)
+
+    def _read_snapshot(self):
+        # Output: (tags, objects, last change id, since) of a new index,
+        #         or None if there is no snapshot that can be used
+        try:
+            with open(settings.TAG_INDEX_SNAPSHOT, 'rb') as f:
+                state = marshal.load(f)
+        except IOError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+            return None
+        except (EOFError, ValueError, TypeError):
+            self.logger.warning('Ignoring damaged snapshot %s',
+                                settings.TAG_INDEX_SNAPSHOT)
+            return None
+        if not isinstance(state, tuple) or state[0] != SNAPSHOT_VERSION:
+            return None
+
+        # The changes since may have been pruned
+        _, last_change_id, since, objects, tags = state
+        _, now = self._position()
+        if since < now - settings.TAG_INDEX_CHANGE_RETENTION:
+            self.logger.info('Ignoring snapshot older than the changes')
+            return None
+
+        tags = dict((tag_id, Bitmap.load(chunks))
+                    for tag_id, chunks in tags.items())
+        self.logger.info('Loaded %s tags from %s', len(tags),
+                         settings.TAG_INDEX_SNAPSHOT)
+        return tags, Bitmap.load(objects), last_change_id, since
+
+    def refresh(self):
+        self.logger.debug('refresh()')
+        with self._update_lock:
+            if not self._loaded:
+                self._load()
+            else:
+                self._refresh()
+
+    def _refresh(self):
+        # Call with the update lock held. Only this thread changes the
+        # bitmaps, so it reads them without the lock, and only takes it
+        # to apply what it read from the database.
+        # Rows are read in id order, which is the order the changes to
+        # each pair were committed in, as they are made under a lock on
+        # the object. Each row says whether the object has the tag, so
+        # reading a row again does no harm
+        _, now = self._position()
+        sql = 'SELECT ID, OBJECT_ID, TAG_ID, PRESENT ' \
+              'FROM TAGGING_CHANGES ' \
+              'WHERE ID > %s ' \
+              '   OR CREATED > TO_TIMESTAMP(%s) ' \
+              'ORDER BY ID'
+        params = (self._last_change_id, self._since)
+        changes = execute_sql_fetch_multiple(
+            lambda id, object_id, tag_id, present:
+            (id, object_id, tag_id, present), sql, params)
+
+        sql = 'SELECT ID ' \
+              'FROM OBJECTS ' \
+              'WHERE ID > %s ' \
+              'ORDER BY ID'
+        params = (self._objects.last() or 0L,)
+        object_ids = execute_sql_fetch_multiple(lambda id: id, sql, params)
+
+        with self._lock:
+            for _, object_id, tag_id, present in changes:
+                bitmap = self._tags.get(tag_id)
+                if present:
+                    if bitmap is None:
+                        bitmap = self._tags[tag_id] = Bitmap()
+                    bitmap.add(object_id)
+                    self._objects.add(object_id)
+                elif bitmap is not None:
+                    bitmap.discard(object_id)
+                    if not bitmap:
+                        del self._tags[tag_id]
+            for id_ in object_ids:
+                self._objects.add(id_)
+
+        if changes:
+            self._last_change_id = max(self._last_change_id,
+                                       changes[-1][0])
+        self._since = now - settings.TAG_INDEX_CHANGE_LOOKBACK
+        self._refreshed = time.time()
+
+    def _current(self):
+        # Call without the lock held. The first lookup loads the index,
+        # and later ones wait for that. Once it is due, a lookup refreshes
+        # the index, unless another thread is refreshing it already
+        if not self._loaded:
+            with self._update_lock:
+                if not self._loaded:
+                    self._load()
+        elif self._due() and self._update_lock.acquire(False):
+            try:
+                self._refresh()
+            finally:
+                self._update_lock.release()
+
+    def _due(self):
+        return time.time() - self._refreshed \
+            >= settings.TAG_INDEX_REFRESH_INTERVAL
+
+    def save_snapshot(self):
+        self.logger.debug('save_snapshot()')
+        # The update lock keeps the bitmaps from changing while they are
+        # written out, and lookups go on meanwhile
+        with self._update_lock:
+            if not self._loaded:
+                self._load()
+            elif self._due():
+                self._refresh()
+            data = marshal.dumps((
+                SNAPSHOT_VERSION, self._last_change_id, self._since,
+                self._objects.dump(),
+                dict((tag_id, bitmap.dump())
+                     for tag_id, bitmap in self._tags.items())))
+
+        # Written next to the snapshot and renamed over it, so a crash
+        # leaves either the old snapshot or the new one
+        path = settings.TAG_INDEX_SNAPSHOT
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix='.tag_index')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return len(data)
+
+    def prune_changes(self):
+        self.logger.debug('prune_changes()')
+        sql = 'WITH D AS (' \
+              '  DELETE FROM TAGGING_CHANGES ' \
+              '  WHERE CREATED < CLOCK_TIMESTAMP() ' \
+              '                  - %s * INTERVAL \'1 second\' ' \
+              '  RETURNING 1) ' \
+              'SELECT COUNT(1) AS count ' \
+              'FROM D'
+        params = (settings.TAG_INDEX_CHANGE_RETENTION,)
+        return execute_sql_fetch_single(lambda count: count, sql, params)
+
+    def _resolve_filter_terms(self, expression):
+        # Input: A parsed filter expression
+        # Output: {term: [tag id]}
+        terms = filter_terms(expression)
+        tag_ids = dict((term, [term[1]] if term[0] == 'id' else [])
+                       for term in terms)
+        values = [term[1] for term in terms if term[0] == 'value']
+        if values:
+            sql = 'SELECT ID, VALUE ' \
+                  'FROM TAGS ' \
+                  'WHERE VALUE = ANY(%s)'
+            for id_, value in execute_sql_fetch_multiple(
+                    lambda id, value: (id, value), sql, (values,)):
+                tag_ids[('value', value)].append(id_)
+        return tag_ids
+
+    def _evaluate(self, expression, tag_ids):
+        # Input: A parsed filter expression, with its terms resolved
+        # Output: Bitmap of the matching objects, which may be one of the
+        #         index's own, so must not be changed
+        # Call with the lock held
+        kind = expression[0]
+        if kind in ('id', 'value'):
+            bitmaps = [self._tags[id_] for id_ in tag_ids[expression]
+                       if id_ in self._tags]
+            return bitmaps[0] if len(bitmaps) == 1 else union(bitmaps)
+
+        if kind == 'or':
+            return union(self._evaluate(operand, tag_ids)
+                         for operand in expression[1])
+
+        # A conjunction intersects its positive operands, the smallest
+        # first, and then removes its negated operands. Negations outside
+        # conjunctions are taken from all objects
+        if kind == 'not':
+            positives, negatives = [], [expression[1]]
+        else:
+            positives = [operand for operand in expression[1]
+                         if operand[0] != 'not']
+            negatives = [operand[1] for operand in expression[1]
+                         if operand[0] == 'not']
+        result = None
+        for bitmap in sorted((self._evaluate(operand, tag_ids)
+                              for operand in positives), key=len):
+            result = bitmap if result is None else result & bitmap
+            if not result:
+                return result
+        if result is None:
+            result = self._objects
+        for operand in negatives:
+            result = result - self._evaluate(operand, tag_ids)
+        return result
+
+    def _parse_filter(self, expression):
+        if not isinstance(expression, UnicodeType):
+            raise ObjectCubeException('Function requires valid filter')
+        expression = parse_filter(expression)
+        return expression, self._resolve_filter_terms(expression)
+
+    def count_by_filter(self, expression):
+        self.logger.debug('count_by_filter(): %s', repr(expression))
+
+        expression, tag_ids = self._parse_filter(expression)
+        self._current()
+        with self._lock:
+            return long(len(self._evaluate(expression, tag_ids)))
+
+    def retrieve_ids_by_filter(self, expression, limit=10L, after_id=0L):
+        self.logger.debug('retrieve_ids_by_filter(): %s / %s / %s',
+                          repr(expression), repr(limit), repr(after_id))
+
+        if not isinstance(limit, LongType) or limit < 0:
+            raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
+
+        expression, tag_ids = self._parse_filter(expression)
+        self._current()
+        with self._lock:
+            objects = self._evaluate(expression, tag_ids)
+            return list(islice(objects.iter_after(after_id), limit))
+
+    def _axis_tags(self, axis):
+        # Input: A valid axis
+        # Output: [(tag id, [tag id])] of the tags of the axis, in order,
+        #         each with the tags whose objects fall under it
+        if axis.tag_ids is not None:
+            return [(tag_id, [tag_id])
+                    for tag_id in sorted(set(axis.tag_ids))]
+
+        if axis.concept_id is not None:
+            sql = 'SELECT ID ' \
+                  'FROM TAGS ' \
+                  'WHERE CONCEPT_ID = %s ' \
+                  'ORDER BY ID'
+            return [(tag_id, [tag_id]) for tag_id in
+                    execute_sql_fetch_multiple(lambda id: id, sql,
+                                               (axis.concept_id,))]
+
+        # The nodes at the level are those with that many ancestors, and
+        # every node within their borders falls under them
+        sql = 'SELECT N.NODE_TAG_ID AS TAG_ID, ' \
+              '       ARRAY_AGG(D.NODE_TAG_ID) AS TAG_IDS ' \
+              'FROM DIMENSIONS N ' \
+              '  JOIN DIMENSIONS D ON D.ROOT_TAG_ID = N.ROOT_TAG_ID ' \
+              '   AND D.LEFT_BORDER BETWEEN N.LEFT_BORDER ' \
+              '                         AND N.RIGHT_BORDER ' \
+              'WHERE N.ROOT_TAG_ID = %s ' \
+              '  AND (SELECT COUNT(1) ' \
+              '       FROM DIMENSIONS A ' \
+              '       WHERE A.ROOT_TAG_ID = N.ROOT_TAG_ID ' \
+              '         AND A.LEFT_BORDER < N.LEFT_BORDER ' \
+              '         AND A.RIGHT_BORDER > N.RIGHT_BORDER) = %s ' \
+              'GROUP BY N.NODE_TAG_ID ' \
+              'ORDER BY N.NODE_TAG_ID'
+        return execute_sql_fetch_multiple(
+            lambda tag_id, tag_ids: (tag_id, tag_ids), sql,
+            (axis.root_tag_id, axis.level))
+
+    def retrieve_cells(self, axes, filter_tag_ids=None, sample_size=3L):
+        self.logger.debug('retrieve_cells(): %s / %s / %s',
+                          repr(axes), repr(filter_tag_ids),
+                          repr(sample_size))
+
+        if not isinstance(axes, ListType) \
+                or not 0 < len(axes) <= MAX_AXES:
+            raise ObjectCubeException('Function requires valid axes')
+        for axis in axes:
+            validate_axis(axis)
+        if not isinstance(filter_tag_ids, NoneType) \
+                and not is_id_list(filter_tag_ids):
+            raise ObjectCubeException('Function requires valid filter')
+        if not isinstance(sample_size, LongType) or sample_size < 0:
+            raise ObjectCubeException('Function requires valid sample size')
+
+        axes_tags = [self._axis_tags(axis) for axis in axes]
+        cells = []
+        self._current()
+        with self._lock:
+            bitmaps = [[(tag_id, union(self._tags[id_] for id_ in tag_ids
+                                       if id_ in self._tags))
+                        for tag_id, tag_ids in axis_tags]
+                       for axis_tags in axes_tags]
+
+            if filter_tag_ids:
+                objects = None
+                for tag_id in set(filter_tag_ids):
+                    bitmap = self._tags.get(tag_id, Bitmap())
+                    objects = bitmap if objects is None \
+                        else objects & bitmap
+                bitmaps[0] = [(tag_id, bitmap & objects)
+                              for tag_id, bitmap in bitmaps[0]]
+
+            def add_cells(axis, tag_ids, objects):
+                last = axis == len(bitmaps) - 1
+                for tag_id, bitmap in bitmaps[axis]:
+                    # Counting needs no intersection of its own
+                    if last and not sample_size and objects is not None:
+                        count = objects.intersection_len(bitmap)
+                        if count:
+                            cells.append(CubeCell(
+                                tag_ids=tag_ids + [tag_id],
+                                count=long(count), object_ids=[]))
+                        continue
+                    cell = bitmap if objects is None else objects & bitmap
+                    if not cell:
+                        continue
+                    if last:
+                        cells.append(CubeCell(
+                            tag_ids=tag_ids + [tag_id],
+                            count=long(len(cell)),
+                            object_ids=list(islice(cell, sample_size))))
+                    else:
+                        add_cells(axis + 1, tag_ids + [tag_id], cell)
+
+            add_cells(0, [], None)
+        return cells
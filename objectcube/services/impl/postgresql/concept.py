@@ -5,6 +5,10 @@ from objectcube.services.base import BaseConceptService
 from types import LongType, UnicodeType, NoneType
 from logging import getLogger
 
+# A concept that exists is found by the first attempt, unless it was
+# created by a concurrent caller while the attempt ran
+RETRIEVE_OR_CREATE_ATTEMPTS = 2
+
 
 class ConceptService(BaseConceptService):
     def __init__(self):
@@ -74,14 +78,29 @@ class ConceptService(BaseConceptService):
         if not isinstance(concept, Concept):
             raise ObjectCubeException('Function requires valid Concept')
 
-        # Try to retrieve a concept with the title
-        db_concept = self.retrieve_by_title(concept.title)
-
-        # If concept was found return it, otherwise add and return
-        if db_concept:
-            return db_concept
-        else:
-            return self.add(concept)
+        # Inserts the concept, or selects it when it exists, so retrieving
+        # an existing concept writes nothing. The select sees the table as
+        # it was when the statement started, so a concept committed by a
+        # concurrent caller since then is found by a second attempt
+        sql = 'WITH INSERTED AS ( ' \
+              '  INSERT INTO ' \
+              '  CONCEPTS (TITLE, DESCRIPTION) ' \
+              '  VALUES (%s, %s) ' \
+              '  ON CONFLICT (TITLE) ' \
+              '  DO NOTHING ' \
+              '  RETURNING * ' \
+              ') ' \
+              'SELECT * FROM INSERTED ' \
+              'UNION ALL ' \
+              'SELECT * ' \
+              'FROM CONCEPTS ' \
+              'WHERE TITLE = %s'
+        params = (concept.title, concept.description, concept.title)
+        for _ in range(RETRIEVE_OR_CREATE_ATTEMPTS):
+            db_concept = execute_sql_fetch_single(Concept, sql, params)
+            if db_concept is not None:
+                return db_concept
+        raise ObjectCubeException('Could not retrieve or create Concept')
 
     def update(self, concept):
         self.logger.debug('update(): %s', repr(concept))
@@ -126,22 +145,26 @@ class ConceptService(BaseConceptService):
         params = (title, )
         return execute_sql_fetch_single(Concept, sql, params)
 
-    def retrieve(self, offset=0L, limit=10L):
+    def retrieve(self, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve(): %s / %s', repr(offset), repr(limit))
 
         if not isinstance(offset, LongType):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT * ' \
               'FROM CONCEPTS ' \
+              'WHERE ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (offset, limit)
+        params = (after_id, offset, limit)
         return execute_sql_fetch_multiple(Concept, sql, params)
 
     def retrieve_by_regex(self, title=None, description=None,
-                          offset=0L, limit=10L):
+                          offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_or_create(): %s / %s / %s / %s',
                           repr(title), repr(description),
                           repr(offset), repr(limit))
@@ -157,24 +180,32 @@ class ConceptService(BaseConceptService):
             raise ObjectCubeException('Function requires valid offset')
         if limit is None or not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         if title and description:
             sql = 'SELECT * ' \
                   'FROM CONCEPTS ' \
                   'WHERE TITLE ~ %s ' \
                   '  AND DESCRIPTION ~ %s' \
+                  '  AND ID > %s ' \
+                  'ORDER BY ID ' \
                   'OFFSET %s LIMIT %s'
-            params = (title, description, offset, limit)
+            params = (title, description, after_id, offset, limit)
         elif title:
             sql = 'SELECT * ' \
                   'FROM CONCEPTS ' \
                   'WHERE TITLE ~ %s ' \
+                  '  AND ID > %s ' \
+                  'ORDER BY ID ' \
                   'OFFSET %s LIMIT %s'
-            params = (title, offset, limit)
+            params = (title, after_id, offset, limit)
         else:
             sql = 'SELECT * ' \
                   'FROM CONCEPTS ' \
                   'WHERE DESCRIPTION ~ %s ' \
+                  '  AND ID > %s ' \
+                  'ORDER BY ID ' \
                   'OFFSET %s LIMIT %s'
-            params = (description, offset, limit)
+            params = (description, after_id, offset, limit)
         return execute_sql_fetch_multiple(Concept, sql, params)
@@ -0,0 +1,125 @@
+from utils import execute_sql_fetch_multiple
+from objectcube.services.base import BaseCubeService
+from objectcube.exceptions import ObjectCubeException
+from objectcube.data_objects import CubeAxis, CubeCell
+from types import LongType, ListType, NoneType
+from logging import getLogger
+
+MAX_AXES = 3
+
+
+def validate_axis(axis):
+    if not isinstance(axis, CubeAxis):
+        raise ObjectCubeException('Function requires valid axis')
+    kinds = [axis.concept_id, axis.tag_ids, axis.root_tag_id]
+    if len([kind for kind in kinds if kind is not None]) != 1:
+        raise ObjectCubeException('Axis requires one of concept id, '
+                                  'tag ids or root tag id')
+    if axis.tag_ids is not None and not is_id_list(axis.tag_ids):
+        raise ObjectCubeException('Axis requires valid tag ids')
+    if axis.root_tag_id is None:
+        if axis.level is not None:
+            raise ObjectCubeException('Axis level requires root tag id')
+    elif axis.level is None or axis.level < 0:
+        raise ObjectCubeException('Axis requires valid level')
+
+
+def is_id_list(ids):
+    return isinstance(ids, ListType) and len(ids) > 0 \
+        and all(isinstance(id_, LongType) for id_ in ids)
+
+
+class CubeService(BaseCubeService):
+    def __init__(self):
+        super(CubeService, self).__init__()
+        self.logger = getLogger('postgreSQL: CubeService')
+
+    def _axis_sql(self, axis):
+        # Input: A valid axis
+        # Output: SQL of the distinct (OBJECT_ID, TAG_ID) pairs of the
+        #         axis, and its parameters
+        if axis.concept_id is not None:
+            sql = 'SELECT DISTINCT T.OBJECT_ID, T.TAG_ID ' \
+                  'FROM TAGGINGS T JOIN TAGS G ON T.TAG_ID = G.ID ' \
+                  'WHERE G.CONCEPT_ID = %s'
+            return sql, [axis.concept_id]
+
+        if axis.tag_ids is not None:
+            sql = 'SELECT DISTINCT T.OBJECT_ID, T.TAG_ID ' \
+                  'FROM TAGGINGS T ' \
+                  'WHERE T.TAG_ID = ANY(%s)'
+            return sql, [axis.tag_ids]
+
+        # The nodes at the level are those with that many ancestors, and
+        # an object tagged with any node within the borders of one of
+        # them falls under it
+        sql = 'SELECT DISTINCT T.OBJECT_ID, N.NODE_TAG_ID AS TAG_ID ' \
+              'FROM DIMENSIONS N ' \
+              '  JOIN DIMENSIONS D ON D.ROOT_TAG_ID = N.ROOT_TAG_ID ' \
+              '   AND D.LEFT_BORDER BETWEEN N.LEFT_BORDER ' \
+              '                         AND N.RIGHT_BORDER ' \
+              '  JOIN TAGGINGS T ON T.TAG_ID = D.NODE_TAG_ID ' \
+              'WHERE N.ROOT_TAG_ID = %s ' \
+              '  AND (SELECT COUNT(1) ' \
+              '       FROM DIMENSIONS A ' \
+              '       WHERE A.ROOT_TAG_ID = N.ROOT_TAG_ID ' \
+              '         AND A.LEFT_BORDER < N.LEFT_BORDER ' \
+              '         AND A.RIGHT_BORDER > N.RIGHT_BORDER) = %s'
+        return sql, [axis.root_tag_id, axis.level]
+
+    def retrieve_cells(self, axes, filter_tag_ids=None, sample_size=3L):
+        self.logger.debug('retrieve_cells(): %s / %s / %s',
+                          repr(axes), repr(filter_tag_ids),
+                          repr(sample_size))
+
+        if not isinstance(axes, ListType) \
+                or not 0 < len(axes) <= MAX_AXES:
+            raise ObjectCubeException('Function requires valid axes')
+        for axis in axes:
+            validate_axis(axis)
+        if not isinstance(filter_tag_ids, NoneType) \
+                and not is_id_list(filter_tag_ids):
+            raise ObjectCubeException('Function requires valid filter')
+        if not isinstance(sample_size, LongType) or sample_size < 0:
+            raise ObjectCubeException('Function requires valid sample size')
+
+        # One pass joins the axes on the object, and groups the pairs by
+        # the tag of each axis
+        names = ['A{0}'.format(i) for i in range(len(axes))]
+        columns = ', '.join('{0}.TAG_ID'.format(name) for name in names)
+        params = []
+        if sample_size:
+            samples = '(ARRAY_AGG(A0.OBJECT_ID ' \
+                      'ORDER BY A0.OBJECT_ID))[1:%s]'
+            params.append(sample_size)
+        else:
+            samples = 'ARRAY[]::BIGINT[]'
+
+        joins = []
+        for name, axis in zip(names, axes):
+            axis_sql, axis_params = self._axis_sql(axis)
+            if joins:
+                joins.append('JOIN ({0}) {1} ON {1}.OBJECT_ID = A0.OBJECT_ID'
+                             .format(axis_sql, name))
+            else:
+                joins.append('({0}) {1}'.format(axis_sql, name))
+            params.extend(axis_params)
+
+        filters = []
+        for tag_id in filter_tag_ids or []:
+            filters.append('EXISTS (SELECT 1 FROM TAGGINGS F '
+                           'WHERE F.OBJECT_ID = A0.OBJECT_ID '
+                           '  AND F.TAG_ID = %s)')
+            params.append(tag_id)
+
+        sql = 'SELECT ARRAY[{0}] AS TAG_IDS, ' \
+              '       COUNT(1) AS COUNT, ' \
+              '       {1} AS OBJECT_IDS ' \
+              'FROM {2} ' \
+              '{3}' \
+              'GROUP BY {0} ' \
+              'ORDER BY {0}'.format(
+                  columns, samples, ' '.join(joins),
+                  'WHERE {0} '.format(' AND '.join(filters))
+                  if filters else '')
+        return execute_sql_fetch_multiple(CubeCell, sql, params)
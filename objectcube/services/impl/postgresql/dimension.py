@@ -1,4 +1,5 @@
 from utils import execute_sql_fetch_single, execute_sql_fetch_multiple
+from objectcube.contexts import UnitOfWork
 from objectcube.services.base import BaseDimensionService
 from objectcube.exceptions import ObjectCubeException
 from objectcube.data_objects import DimensionNode
@@ -46,6 +47,8 @@ class DimensionService(BaseDimensionService):
             node_tag_value=nodes[counter[0]].node_tag_value,
             left_border=nodes[counter[0]].left_border,
             right_border=nodes[counter[0]].right_border,
+            direct_count=nodes[counter[0]].direct_count,
+            subtree_count=nodes[counter[0]].subtree_count,
             child_nodes=[]
         )
         counter[0] += 1
@@ -87,15 +90,53 @@ class DimensionService(BaseDimensionService):
             self._write_nodes(child, root_tag_id)
         return root_node
 
-    def _read_tree(self, root_node):
+    def _write_counts(self, root_node):
+        # Input: The root node of a tree written to the database
+        # Side effect: The object counts of every node of the tree have
+        #              been counted from scratch. TaggingService keeps
+        #              them up to date from then on
+        sql = 'INSERT ' \
+              'INTO DIMENSION_COUNTS ( ' \
+              '  ROOT_TAG_ID, NODE_TAG_ID, DIRECT_COUNT, SUBTREE_COUNT' \
+              ') ' \
+              'SELECT N.ROOT_TAG_ID, N.NODE_TAG_ID, ' \
+              '  (SELECT COUNT(DISTINCT T.OBJECT_ID) ' \
+              '   FROM TAGGINGS T ' \
+              '   WHERE T.TAG_ID = N.NODE_TAG_ID), ' \
+              '  (SELECT COUNT(DISTINCT T.OBJECT_ID) ' \
+              '   FROM DIMENSIONS D ' \
+              '     JOIN TAGGINGS T ON T.TAG_ID = D.NODE_TAG_ID ' \
+              '   WHERE D.ROOT_TAG_ID = N.ROOT_TAG_ID ' \
+              '     AND D.LEFT_BORDER BETWEEN N.LEFT_BORDER ' \
+              '                           AND N.RIGHT_BORDER) ' \
+              'FROM DIMENSIONS N ' \
+              'WHERE N.ROOT_TAG_ID = %s ' \
+              'RETURNING NODE_TAG_ID'
+        params = (root_node.root_tag_id,)
+        execute_sql_fetch_multiple(lambda node_tag_id: node_tag_id,
+                                   sql, params)
+
+    def _read_tree(self, root_node, counts=False):
         # Input: A valid root node
         # Output: The root node of a valid tree structure
-        sql = ('SELECT D.root_tag_id, D.node_tag_id, T.value, '
-               '       D.left_border, D.right_border '
-               'FROM Dimensions D '
-               '  JOIN Tags T ON D.node_tag_id = T.id '
-               'WHERE D.root_tag_id = %s '
-               'ORDER BY D.left_border ASC')
+        if counts:
+            sql = ('SELECT D.root_tag_id, D.node_tag_id, T.value, '
+                   '       D.left_border, D.right_border, '
+                   '       C.direct_count, C.subtree_count '
+                   'FROM Dimensions D '
+                   '  JOIN Tags T ON D.node_tag_id = T.id '
+                   '  LEFT JOIN Dimension_Counts C '
+                   '    ON C.root_tag_id = D.root_tag_id '
+                   '   AND C.node_tag_id = D.node_tag_id '
+                   'WHERE D.root_tag_id = %s '
+                   'ORDER BY D.left_border ASC')
+        else:
+            sql = ('SELECT D.root_tag_id, D.node_tag_id, T.value, '
+                   '       D.left_border, D.right_border '
+                   'FROM Dimensions D '
+                   '  JOIN Tags T ON D.node_tag_id = T.id '
+                   'WHERE D.root_tag_id = %s '
+                   'ORDER BY D.left_border ASC')
         params = (root_node.root_tag_id,)
         nodes = execute_sql_fetch_multiple(DimensionNode, sql, params)
         if len(nodes) == 0:
@@ -125,6 +166,7 @@ class DimensionService(BaseDimensionService):
         return execute_sql_fetch_multiple(DimensionNode, sql, params)
 
     def _delete_all(self, root_node):
+        # The counts of the nodes are deleted with them
         sql = 'DELETE ' \
               'FROM DIMENSIONS ' \
               'WHERE root_tag_id = %s ' \
@@ -148,7 +190,9 @@ class DimensionService(BaseDimensionService):
 
         # Construct a valid tree, first in memory, then on disk
         self._calculate_borders(root)
-        self._write_nodes(root)
+        with UnitOfWork():
+            self._write_nodes(root)
+            self._write_counts(root)
 
         # Return a valid tree from disk to make sure
         return self.retrieve_dimension(root)
@@ -164,19 +208,15 @@ class DimensionService(BaseDimensionService):
         # which can safely be passed to the caller
         self._calculate_borders(root)
 
-        # Retrieve the old tree, if it exists, for safekeeping, then delete it
-        old_tree = self.retrieve_dimension(root)
-        if old_tree:
-            self._delete_all(old_tree)
-
-        # Then we write the new tree
-        # If it fails then we reinstall the old tree and raise exception
-        # Otherwise return the new tree and be happy :)
+        # Delete the old tree, if it exists, and write the new one in one
+        # unit of work. If writing fails, the deletion is rolled back
+        # with it, so the old tree is kept
         try:
-            self._write_nodes(root)
-        except:
-            self._delete_all(root)
-            self._write_nodes(old_tree)
+            with UnitOfWork():
+                self._delete_all(root)
+                self._write_nodes(root)
+                self._write_counts(root)
+        except ObjectCubeException:
             raise ObjectCubeException('Could not replace with illegal tree')
 
         # Return the result
@@ -215,3 +255,12 @@ class DimensionService(BaseDimensionService):
             raise ObjectCubeException('Function requires valid root node')
 
         return self._read_tree(root)
+
+    def retrieve_dimension_with_counts(self, root):
+        self.logger.debug('retrieve_dimension_with_counts(): %s',
+                          repr(root))
+
+        if not isinstance(root, DimensionNode):
+            raise ObjectCubeException('Function requires valid root node')
+
+        return self._read_tree(root, counts=True)
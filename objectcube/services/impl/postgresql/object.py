@@ -1,10 +1,25 @@
-from utils import execute_sql_fetch_single, execute_sql_fetch_multiple
+from utils import execute_sql_fetch_single, execute_sql_fetch_multiple, \
+    execute_sql_iterate
 from objectcube.services.base import BaseObjectService
 from objectcube.exceptions import ObjectCubeException
 from objectcube.data_objects import Object, Tag
+from objectcube.filters import parse_filter, filter_terms
 from types import LongType, UnicodeType
 from logging import getLogger
 
+# Objects tagged with any node within the borders of a node, found by a
+# range scan of the dimension in one statement, whatever the subtree size
+SUBTREE_OBJECT_IDS = 'SELECT T.OBJECT_ID ' \
+    'FROM DIMENSIONS N ' \
+    '  JOIN DIMENSIONS D ON D.ROOT_TAG_ID = N.ROOT_TAG_ID ' \
+    '   AND D.LEFT_BORDER BETWEEN N.LEFT_BORDER AND N.RIGHT_BORDER ' \
+    '  JOIN TAGGINGS T ON T.TAG_ID = D.NODE_TAG_ID ' \
+    'WHERE N.ROOT_TAG_ID = %s ' \
+    '  AND N.NODE_TAG_ID = %s'
+
+# Filter terms are estimated by counting up to this many taggings of them
+FILTER_ESTIMATE_LIMIT = 10000
+
 
 class ObjectService(BaseObjectService):
     def __init__(self):
@@ -99,21 +114,25 @@ class ObjectService(BaseObjectService):
         params = (id_,)
         return execute_sql_fetch_single(Object, sql, params)
 
-    def retrieve(self, offset=0L, limit=10L):
+    def retrieve(self, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve(): %s / %s', repr(offset), repr(limit))
 
         if not isinstance(offset, LongType):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT ID, NAME, DIGEST ' \
               'FROM OBJECTS ' \
+              'WHERE ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (offset, limit)
+        params = (after_id, offset, limit)
         return execute_sql_fetch_multiple(Object, sql, params)
 
-    def retrieve_by_regex(self, name, offset=0L, limit=10L):
+    def retrieve_by_regex(self, name, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_by_regex(): %s / %s / %s',
                           repr(name), repr(offset), repr(limit))
 
@@ -124,15 +143,19 @@ class ObjectService(BaseObjectService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT ID, NAME, DIGEST ' \
               'FROM OBJECTS ' \
               'WHERE NAME ~ %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (name, offset, limit)
+        params = (name, after_id, offset, limit)
         return execute_sql_fetch_multiple(Object, sql, params)
 
-    def retrieve_by_tag_id(self, tag_id, offset=0L, limit=10L):
+    def retrieve_by_tag_id(self, tag_id, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_by_tag_id(): %s / %s / %s',
                           repr(tag_id), repr(offset), repr(limit))
 
@@ -143,10 +166,227 @@ class ObjectService(BaseObjectService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT O.ID, O.NAME, O.DIGEST ' \
               'FROM OBJECTS O JOIN TAGGINGS T ON O.ID = T.OBJECT_ID ' \
               'WHERE T.TAG_ID = %s ' \
+              '  AND T.OBJECT_ID > %s ' \
+              'ORDER BY T.OBJECT_ID ' \
               'OFFSET %s LIMIT %s'
-        params = (tag_id, offset, limit)
+        params = (tag_id, after_id, offset, limit)
+        return execute_sql_fetch_multiple(Object, sql, params)
+
+    def iter_all(self, after_id=0L):
+        self.logger.debug('iter_all(): %s', repr(after_id))
+
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
+
+        sql = 'SELECT ID, NAME, DIGEST ' \
+              'FROM OBJECTS ' \
+              'WHERE ID > %s ' \
+              'ORDER BY ID'
+        params = (after_id,)
+        return execute_sql_iterate(Object, sql, params)
+
+    def iter_by_tag_id(self, tag_id, after_id=0L):
+        self.logger.debug('iter_by_tag_id(): %s', repr(tag_id))
+
+        if not isinstance(tag_id, LongType):
+            raise ObjectCubeException('Function requires valid Tag id')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
+
+        sql = 'SELECT O.ID, O.NAME, O.DIGEST ' \
+              'FROM OBJECTS O JOIN TAGGINGS T ON O.ID = T.OBJECT_ID ' \
+              'WHERE T.TAG_ID = %s ' \
+              '  AND T.OBJECT_ID > %s ' \
+              'ORDER BY T.OBJECT_ID'
+        params = (tag_id, after_id)
+        return execute_sql_iterate(Object, sql, params)
+
+    def _validate_dimension_node(self, root_tag_id, node_tag_id):
+        if not isinstance(root_tag_id, LongType):
+            raise ObjectCubeException('Function requires valid root Tag id')
+        if not isinstance(node_tag_id, LongType):
+            raise ObjectCubeException('Function requires valid node Tag id')
+
+    def retrieve_by_dimension_node(self, root_tag_id, node_tag_id,
+                                   offset=0L, limit=10L, after_id=0L):
+        self.logger.debug('retrieve_by_dimension_node(): %s / %s / %s / %s',
+                          repr(root_tag_id), repr(node_tag_id),
+                          repr(offset), repr(limit))
+
+        self._validate_dimension_node(root_tag_id, node_tag_id)
+
+        if not isinstance(offset, LongType):
+            raise ObjectCubeException('Function requires valid offset')
+        if not isinstance(limit, LongType):
+            raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
+
+        sql = 'SELECT O.ID, O.NAME, O.DIGEST ' \
+              'FROM OBJECTS O ' \
+              'WHERE O.ID IN ({0} ' \
+              '               AND T.OBJECT_ID > %s) ' \
+              'ORDER BY O.ID ' \
+              'OFFSET %s LIMIT %s'.format(SUBTREE_OBJECT_IDS)
+        params = (root_tag_id, node_tag_id, after_id, offset, limit)
         return execute_sql_fetch_multiple(Object, sql, params)
+
+    def count_by_dimension_node(self, root_tag_id, node_tag_id):
+        self.logger.debug('count_by_dimension_node(): %s / %s',
+                          repr(root_tag_id), repr(node_tag_id))
+
+        self._validate_dimension_node(root_tag_id, node_tag_id)
+
+        sql = 'SELECT COUNT(DISTINCT OBJECT_ID) AS count ' \
+              'FROM ({0}) S'.format(SUBTREE_OBJECT_IDS)
+        params = (root_tag_id, node_tag_id)
+        return execute_sql_fetch_single(lambda count: count, sql, params)
+
+    def _resolve_filter_terms(self, expression):
+        # Input: A parsed filter expression
+        # Output: {term: [tag id]} and {tag id: estimated taggings}, the
+        #         estimates capped at FILTER_ESTIMATE_LIMIT
+        terms = filter_terms(expression)
+        tag_ids = dict((term, [term[1]]) for term in terms
+                       if term[0] == 'id')
+        values = [term[1] for term in terms if term[0] == 'value']
+        if values:
+            for term in terms:
+                if term[0] == 'value':
+                    tag_ids[term] = []
+            sql = 'SELECT ID, VALUE ' \
+                  'FROM TAGS ' \
+                  'WHERE VALUE = ANY(%s)'
+            for id_, value in execute_sql_fetch_multiple(
+                    lambda id, value: (id, value), sql, (values,)):
+                tag_ids[('value', value)].append(id_)
+
+        all_tag_ids = sorted(set(id_ for ids in tag_ids.values()
+                                 for id_ in ids))
+        sql = 'SELECT G.ID, ' \
+              '  (SELECT COUNT(1) ' \
+              '   FROM (SELECT 1 ' \
+              '         FROM TAGGINGS T ' \
+              '         WHERE T.TAG_ID = G.ID ' \
+              '         LIMIT %s) S) AS ESTIMATE ' \
+              'FROM UNNEST(%s::BIGINT[]) AS G (ID)'
+        params = (FILTER_ESTIMATE_LIMIT, all_tag_ids)
+        estimates = dict(execute_sql_fetch_multiple(
+            lambda id, estimate: (id, estimate), sql, params)) \
+            if all_tag_ids else {}
+        return tag_ids, estimates
+
+    def _compile_filter(self, expression, tag_ids, estimates, after_id):
+        # Input: A parsed filter expression, with its terms resolved
+        # Output: SQL of the ids of the matching objects above after_id,
+        #         its parameters, and the estimated number of them, or
+        #         None when it can be most of the objects
+        kind = expression[0]
+        if kind in ('id', 'value'):
+            ids = tag_ids[expression]
+            sql = 'SELECT OBJECT_ID ' \
+                  'FROM TAGGINGS ' \
+                  'WHERE TAG_ID = ANY(%s) ' \
+                  '  AND OBJECT_ID > %s'
+            return sql, [ids, after_id], sum(estimates.get(id_, 0)
+                                             for id_ in ids)
+
+        if kind == 'or':
+            compiled = [self._compile_filter(operand, tag_ids, estimates,
+                                             after_id)
+                        for operand in expression[1]]
+            sql = ' UNION '.join('({0})'.format(c[0]) for c in compiled)
+            params = [param for c in compiled for param in c[1]]
+            if any(c[2] is None for c in compiled):
+                return sql, params, None
+            return sql, params, sum(c[2] for c in compiled)
+
+        # A conjunction is the intersection of its positive operands, the
+        # most selective first, less the union of its negated operands.
+        # Negations outside conjunctions are taken from all objects
+        if kind == 'not':
+            positives, negatives = [], [expression[1]]
+        else:
+            positives = [operand for operand in expression[1]
+                         if operand[0] != 'not']
+            negatives = [operand[1] for operand in expression[1]
+                         if operand[0] == 'not']
+        compiled = sorted(
+            [self._compile_filter(operand, tag_ids, estimates, after_id)
+             for operand in positives],
+            key=lambda c: (c[2] is None, c[2]))
+        if not compiled:
+            compiled = [('SELECT ID AS OBJECT_ID '
+                         'FROM OBJECTS '
+                         'WHERE ID > %s', [after_id], None)]
+        sql = ' INTERSECT '.join('({0})'.format(c[0]) for c in compiled)
+        params = [param for c in compiled for param in c[1]]
+        for operand in negatives:
+            negated = self._compile_filter(operand, tag_ids, estimates,
+                                           after_id)
+            sql += ' EXCEPT ({0})'.format(negated[0])
+            params.extend(negated[1])
+        return sql, params, compiled[0][2]
+
+    def _filter_sql(self, expression, after_id=0L):
+        if not isinstance(expression, UnicodeType):
+            raise ObjectCubeException('Function requires valid filter')
+        expression = parse_filter(expression)
+        tag_ids, estimates = self._resolve_filter_terms(expression)
+        sql, params, _ = self._compile_filter(expression, tag_ids,
+                                              estimates, after_id)
+        return sql, params
+
+    def retrieve_by_filter(self, expression, offset=0L, limit=10L,
+                           after_id=0L):
+        self.logger.debug('retrieve_by_filter(): %s / %s / %s',
+                          repr(expression), repr(offset), repr(limit))
+
+        if not isinstance(offset, LongType):
+            raise ObjectCubeException('Function requires valid offset')
+        if not isinstance(limit, LongType):
+            raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
+
+        # The cursor is pushed down into every term
+        filter_sql, params = self._filter_sql(expression, after_id)
+        sql = 'SELECT O.ID, O.NAME, O.DIGEST ' \
+              'FROM OBJECTS O ' \
+              'WHERE O.ID IN ({0}) ' \
+              'ORDER BY O.ID ' \
+              'OFFSET %s LIMIT %s'.format(filter_sql)
+        params = tuple(params) + (offset, limit)
+        return execute_sql_fetch_multiple(Object, sql, params)
+
+    def count_by_filter(self, expression):
+        self.logger.debug('count_by_filter(): %s', repr(expression))
+
+        filter_sql, params = self._filter_sql(expression)
+        sql = 'SELECT COUNT(1) AS count ' \
+              'FROM ({0}) F'.format(filter_sql)
+        return execute_sql_fetch_single(lambda count: count, sql,
+                                        tuple(params))
+
+    def retrieve_digests(self, first, last):
+        self.logger.debug('retrieve_digests(): %s / %s',
+                          repr(first), repr(last))
+
+        if not isinstance(first, basestring):
+            raise ObjectCubeException('Function requires valid first digest')
+        if not isinstance(last, basestring):
+            raise ObjectCubeException('Function requires valid last digest')
+
+        # The "C" collation compares bytes, like the blob catalog does
+        sql = 'SELECT DISTINCT DIGEST COLLATE "C" AS DIGEST ' \
+              'FROM OBJECTS ' \
+              'WHERE DIGEST COLLATE "C" BETWEEN %s AND %s ' \
+              'ORDER BY 1'
+        params = (first, last)
+        return execute_sql_fetch_multiple(lambda digest: digest, sql, params)
@@ -56,7 +56,7 @@ class PluginService(BasePluginService):
         params = (name, )
         return execute_sql_fetch_single(Plugin, sql, params)
 
-    def retrieve(self, offset=0L, limit=10L):
+    def retrieve(self, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve(): %s / %s',
                           repr(offset), repr(limit))
 
@@ -64,14 +64,18 @@ class PluginService(BasePluginService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT ID, NAME, MODULE ' \
               'FROM PLUGINS ' \
+              'WHERE ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (offset, limit)
+        params = (after_id, offset, limit)
         return execute_sql_fetch_multiple(Plugin, sql, params)
 
-    def retrieve_by_regex(self, name, offset=0L, limit=10L):
+    def retrieve_by_regex(self, name, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_by_regex(): %s / %s / %s',
                           repr(name), repr(offset), repr(limit))
 
@@ -81,10 +85,14 @@ class PluginService(BasePluginService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT  ID, NAME, MODULE ' \
               'FROM PLUGINS ' \
               'WHERE NAME ~ %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (name, offset, limit)
+        params = (name, after_id, offset, limit)
         return execute_sql_fetch_multiple(Plugin, sql, params)
@@ -1,10 +1,16 @@
-from utils import execute_sql_fetch_single, execute_sql_fetch_multiple
+from utils import execute_sql_fetch_single, execute_sql_fetch_multiple, \
+    execute_sql_insert_many, execute_sql_iterate
 from objectcube.services.base import BaseTagService
 from objectcube.data_objects import Concept, Plugin, Tag
 from objectcube.exceptions import ObjectCubeException
+from objectcube.contexts import UnitOfWork
 from types import LongType, UnicodeType, NoneType
 from logging import getLogger
 
+# A tag that exists is found by the first attempt, unless it was created
+# by a concurrent caller while the attempt ran
+RETRIEVE_OR_CREATE_ATTEMPTS = 2
+
 
 class TagService(BaseTagService):
     def __init__(self):
@@ -48,9 +54,7 @@ class TagService(BaseTagService):
               ') RETURNING *'
         return execute_sql_fetch_single(Tag, sql, params)
 
-    def retrieve_or_create(self, tag):
-        self.logger.debug('retrieve_or_create(): %s', repr(tag))
-
+    def _validate_retrieve_or_create(self, tag):
         # Need to give a tag, but cannot have ID
         if not isinstance(tag, Tag):
             raise ObjectCubeException('Function requires valid Tag')
@@ -65,29 +69,94 @@ class TagService(BaseTagService):
         if not tag.plugin_id:
             raise ObjectCubeException('Function requires valid plugin_id')
 
-        # Try to retrieve the single tag from the database
-        sql = 'SELECT * ' \
+    def retrieve_or_create(self, tag):
+        self.logger.debug('retrieve_or_create(): %s', repr(tag))
+        self._validate_retrieve_or_create(tag)
+
+        # Inserts the tag, or selects it when it exists, so retrieving an
+        # existing tag writes nothing. The select sees the table as it
+        # was when the statement started, so a tag committed by a
+        # concurrent caller since then is found by a second attempt
+        sql = 'WITH INSERTED AS ( ' \
+              '  INSERT INTO TAGS ( ' \
+              '    VALUE, DESCRIPTION, TYPE, MUTABLE, CONCEPT_ID, PLUGIN_ID' \
+              '  ) VALUES (%s, %s, %s, %s, %s, %s) ' \
+              '  ON CONFLICT (VALUE, TYPE, CONCEPT_ID, PLUGIN_ID) ' \
+              '  DO NOTHING ' \
+              '  RETURNING * ' \
+              ') ' \
+              'SELECT * FROM INSERTED ' \
+              'UNION ALL ' \
+              'SELECT * ' \
               'FROM TAGS ' \
-              'WHERE VALUE = %s ' \
-              '  AND TYPE = %s ' \
-              '  AND CONCEPT_ID = %s ' \
-              '  AND PLUGIN_ID = %s ' \
-              'OFFSET %s LIMIT %s'
-        params = (tag.value, tag.type, tag.concept_id, tag.plugin_id, 0L, 2L)
-        tags = execute_sql_fetch_multiple(Tag, sql, params)
-
-        # Check for duplicates, this should not happen
-        if len(tags) > 1:
-            raise ObjectCubeException('Panic: No plugin duplicates allowed')
-
-        # If the single tag exists, return it
-        if len(tags) == 1:
-            return tags[0]
-
-        # Tag does not exist; create it
-        # Should be safe to use add() as all parameters have been checked
-        # Can still give errors on foreign keys, but that is normal
-        return self.add(tag)
+              'WHERE VALUE = %s AND TYPE = %s ' \
+              '  AND CONCEPT_ID = %s AND PLUGIN_ID = %s'
+        params = (tag.value, tag.description, tag.type, tag.mutable,
+                  tag.concept_id, tag.plugin_id,
+                  tag.value, tag.type, tag.concept_id, tag.plugin_id)
+        for _ in range(RETRIEVE_OR_CREATE_ATTEMPTS):
+            db_tag = execute_sql_fetch_single(Tag, sql, params)
+            if db_tag is not None:
+                return db_tag
+        raise ObjectCubeException('Could not retrieve or create Tag')
+
+    def retrieve_or_create_many(self, tags, page_size=1000L):
+        self.logger.debug('retrieve_or_create_many(): %s', repr(page_size))
+
+        if not isinstance(page_size, LongType) or page_size < 1:
+            raise ObjectCubeException('Function requires valid page size')
+
+        # Validate everything before writing anything
+        tags = list(tags)
+        keys = []
+        rows = {}
+        for tag in tags:
+            self._validate_retrieve_or_create(tag)
+            key = (tag.value, tag.type, tag.concept_id, tag.plugin_id)
+            keys.append(key)
+            # One statement cannot affect a row twice, so the first of
+            # equal tags is written. Writing in key order keeps
+            # concurrent batches from deadlocking on each other
+            rows.setdefault(key, (tag.value, tag.description, tag.type,
+                                  tag.mutable, tag.concept_id,
+                                  tag.plugin_id))
+
+        # As in retrieve_or_create(), existing tags are selected rather
+        # than written, and tags committed concurrently are found by a
+        # second attempt
+        sql = 'WITH INPUT ( ' \
+              '  VALUE, DESCRIPTION, TYPE, MUTABLE, CONCEPT_ID, PLUGIN_ID' \
+              ') AS (VALUES {0}), ' \
+              'INSERTED AS ( ' \
+              '  INSERT INTO TAGS ( ' \
+              '    VALUE, DESCRIPTION, TYPE, MUTABLE, CONCEPT_ID, PLUGIN_ID' \
+              '  ) ' \
+              '  SELECT * FROM INPUT ' \
+              '  ON CONFLICT (VALUE, TYPE, CONCEPT_ID, PLUGIN_ID) ' \
+              '  DO NOTHING ' \
+              '  RETURNING * ' \
+              ') ' \
+              'SELECT * FROM INSERTED ' \
+              'UNION ALL ' \
+              'SELECT T.* ' \
+              'FROM TAGS T ' \
+              '  JOIN INPUT I ' \
+              '    ON T.VALUE = I.VALUE AND T.TYPE = I.TYPE ' \
+              '   AND T.CONCEPT_ID = I.CONCEPT_ID ' \
+              '   AND T.PLUGIN_ID = I.PLUGIN_ID'
+        template = '(%s, %s, %s, %s, %s, %s)'
+        by_key = {}
+        missing = sorted(rows)
+        for _ in range(RETRIEVE_OR_CREATE_ATTEMPTS):
+            db_tags = execute_sql_insert_many(
+                Tag, sql, template, (rows[key] for key in missing),
+                page_size=page_size)
+            by_key.update(((t.value, t.type, t.concept_id, t.plugin_id), t)
+                          for t in db_tags)
+            missing = [key for key in missing if key not in by_key]
+            if not missing:
+                return [by_key[key] for key in keys]
+        raise ObjectCubeException('Could not retrieve or create Tags')
 
     def update(self, tag):
         self.logger.debug('update(): %s', repr(tag))
@@ -98,45 +167,54 @@ class TagService(BaseTagService):
         if not tag.id:
             raise ObjectCubeException('Function requires valid Tag id')
 
-        # Get the old tag to verify that it exists,
-        # and then run some business logic checks
-        old = self.retrieve_by_id(tag.id)
-        if not old:
-            raise ObjectCubeException('No Tag found to update')
-        if not old.mutable:
-            raise ObjectCubeException('Cannot change a non-mutable concept')
-        if tag.plugin_id != old.plugin_id:
-            raise ObjectCubeException('Cannot change generating plugin ')
-        if old.plugin_id and tag.concept_id != old.concept_id:
-            raise ObjectCubeException('Cannot change plugin-generated concept')
-
-        # Build the SQL expression for the attributes that may be changed
-        params = tuple()
-        attributes = []
-
-        if tag.value != old.value:
-            attributes.append('VALUE = %s')
-            params += (tag.value, )
-
-        if tag.description != old.description:
-            attributes.append('DESCRIPTION = %s')
-            params += (tag.description, )
-
-        if tag.concept_id != old.concept_id:
-            attributes.append('CONCEPT_ID = %s')
-            params += (tag.concept_id, )
-
-        if tag.type != old.type:
-            attributes.append('TYPE = %s')
-            params += (tag.type, )
-
-        sql_attributes = ', '
-        params += (tag.id, )
-
-        sql = 'UPDATE TAGS SET ' + \
-              sql_attributes.join(attributes) + \
-              ' WHERE ID = %s RETURNING *'
-        return execute_sql_fetch_single(Tag, sql, params)
+        # Read and write in one transaction, with the old row locked,
+        # so the checks below still hold when the update is written
+        with UnitOfWork():
+            # Get the old tag to verify that it exists,
+            # and then run some business logic checks
+            sql = 'SELECT * ' \
+                  'FROM TAGS ' \
+                  'WHERE ID = %s ' \
+                  'FOR UPDATE'
+            old = execute_sql_fetch_single(Tag, sql, (tag.id,))
+            if not old:
+                raise ObjectCubeException('No Tag found to update')
+            if not old.mutable:
+                raise ObjectCubeException(
+                    'Cannot change a non-mutable concept')
+            if tag.plugin_id != old.plugin_id:
+                raise ObjectCubeException('Cannot change generating plugin ')
+            if old.plugin_id and tag.concept_id != old.concept_id:
+                raise ObjectCubeException(
+                    'Cannot change plugin-generated concept')
+
+            # Build the SQL expression for the attributes that may change
+            params = tuple()
+            attributes = []
+
+            if tag.value != old.value:
+                attributes.append('VALUE = %s')
+                params += (tag.value, )
+
+            if tag.description != old.description:
+                attributes.append('DESCRIPTION = %s')
+                params += (tag.description, )
+
+            if tag.concept_id != old.concept_id:
+                attributes.append('CONCEPT_ID = %s')
+                params += (tag.concept_id, )
+
+            if tag.type != old.type:
+                attributes.append('TYPE = %s')
+                params += (tag.type, )
+
+            sql_attributes = ', '
+            params += (tag.id, )
+
+            sql = 'UPDATE TAGS SET ' + \
+                  sql_attributes.join(attributes) + \
+                  ' WHERE ID = %s RETURNING *'
+            return execute_sql_fetch_single(Tag, sql, params)
 
     def delete_by_id(self, id_):
         self.logger.debug('delete(): %s', repr(id_))
@@ -186,21 +264,25 @@ class TagService(BaseTagService):
         params = (id_,)
         return execute_sql_fetch_single(Tag, sql, params)
 
-    def retrieve(self, offset=0L, limit=10L):
+    def retrieve(self, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve()')
 
         if not isinstance(offset, LongType):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT * ' \
               'FROM TAGS ' \
-              'LIMIT %s OFFSET %s'
-        params = (limit, offset)
+              'WHERE ID > %s ' \
+              'ORDER BY ID ' \
+              'OFFSET %s LIMIT %s'
+        params = (after_id, offset, limit)
         return execute_sql_fetch_multiple(Tag, sql, params)
 
-    def retrieve_by_value(self, value, offset=0L, limit=10L):
+    def retrieve_by_value(self, value, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_by_value(): %s', repr(value))
 
         if not isinstance(value, UnicodeType):
@@ -209,16 +291,20 @@ class TagService(BaseTagService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT * ' \
               'FROM TAGS ' \
               'WHERE VALUE = %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (value, offset, limit)
+        params = (value, after_id, offset, limit)
         return execute_sql_fetch_multiple(Tag, sql, params)
 
     def retrieve_by_regex(self, value=None, description=None,
-                          offset=0L, limit=10L):
+                          offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_or_create(): %s / %s / %s / %s',
                           repr(value), repr(description),
                           repr(offset), repr(limit))
@@ -234,29 +320,38 @@ class TagService(BaseTagService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         if value and description:
             sql = 'SELECT * ' \
                   'FROM TAGS ' \
                   'WHERE VALUE ~ %s ' \
                   '  AND DESCRIPTION ~ %s' \
+                  '  AND ID > %s ' \
+                  'ORDER BY ID ' \
                   'OFFSET %s LIMIT %s'
-            params = (value, description, offset, limit)
+            params = (value, description, after_id, offset, limit)
         elif value:
             sql = 'SELECT * ' \
                   'FROM TAGS ' \
                   'WHERE VALUE ~ %s ' \
+                  '  AND ID > %s ' \
+                  'ORDER BY ID ' \
                   'OFFSET %s LIMIT %s'
-            params = (value, offset, limit)
+            params = (value, after_id, offset, limit)
         else:
             sql = 'SELECT * ' \
                   'FROM TAGS ' \
                   'WHERE DESCRIPTION ~ %s ' \
+                  '  AND ID > %s ' \
+                  'ORDER BY ID ' \
                   'OFFSET %s LIMIT %s'
-            params = (description, offset, limit)
+            params = (description, after_id, offset, limit)
         return execute_sql_fetch_multiple(Tag, sql, params)
 
-    def retrieve_by_plugin_id(self, plugin_id, offset=0L, limit=10L):
+    def retrieve_by_plugin_id(self, plugin_id,
+                              offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_by_plugin_id(): %s', repr(plugin_id))
 
         if not isinstance(plugin_id, LongType):
@@ -266,15 +361,20 @@ class TagService(BaseTagService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT * ' \
               'FROM TAGS ' \
               'WHERE PLUGIN_ID = %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (plugin_id, offset, limit)
+        params = (plugin_id, after_id, offset, limit)
         return execute_sql_fetch_multiple(Tag, sql, params)
 
-    def retrieve_by_concept_id(self, concept_id, offset=0L, limit=10L):
+    def retrieve_by_concept_id(self, concept_id,
+                               offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_by_concept_id(): %s', repr(concept_id))
 
         if not isinstance(concept_id, LongType):
@@ -284,10 +384,30 @@ class TagService(BaseTagService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT * ' \
               'FROM TAGS ' \
               'WHERE CONCEPT_ID = %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (concept_id, offset, limit)
+        params = (concept_id, after_id, offset, limit)
         return execute_sql_fetch_multiple(Tag, sql, params)
+
+    def iter_by_concept_id(self, concept_id, after_id=0L):
+        self.logger.debug('iter_by_concept_id(): %s', repr(concept_id))
+
+        if not isinstance(concept_id, LongType):
+            raise ObjectCubeException('Function requires valid Concept id')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
+
+        sql = 'SELECT * ' \
+              'FROM TAGS ' \
+              'WHERE CONCEPT_ID = %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID'
+        params = (concept_id, after_id)
+        return execute_sql_iterate(Tag, sql, params)
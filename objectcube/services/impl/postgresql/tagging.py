@@ -1,16 +1,192 @@
-from utils import execute_sql_fetch_single, execute_sql_fetch_multiple
+from utils import execute_sql_fetch_single, execute_sql_fetch_multiple, \
+    execute_sql_insert_many, execute_sql_iterate
 from objectcube.services.base import BaseTaggingService
 from objectcube.exceptions import ObjectCubeException
+from objectcube.contexts import UnitOfWork
 from objectcube.data_objects import Tagging
+from objectcube import settings
+from collections import Counter
 from types import LongType
 from logging import getLogger
 
+# The objects whose changes are recorded in one round of queries
+OBJECTS_PAGE_SIZE = 1000
+
 
 class TaggingService(BaseTaggingService):
     def __init__(self):
         super(TaggingService, self).__init__()
         self.logger = getLogger('postgreSQL: TaggingService')
 
+    def _validate_new(self, tagging):
+        if not isinstance(tagging, Tagging):
+            raise ObjectCubeException('Function requires valid tagging')
+        if tagging.id is not None:
+            raise ObjectCubeException('Function must not get Tagging id')
+        if tagging.plugin_set_id and not tagging.plugin_id:
+            raise ObjectCubeException('Cannot have plugin set w/o plugin')
+
+    def _record_changes(self, added=(), removed=()):
+        # Input: (object id, tag id) of the taggings just added and just
+        #        removed, in the current unit of work
+        # Side effect: DIMENSION_COUNTS counts each of the objects once
+        #              under each node it is tagged with, or below, and
+        #              TAGGING_CHANGES records whether the objects have the
+        #              tags, when the change feed is on
+        changes = Counter()
+        for pair in added:
+            changes[pair] += 1
+        for pair in removed:
+            changes[pair] -= 1
+        if not changes:
+            return
+
+        if settings.TAGGING_CHANGE_FEED:
+            object_ids = sorted(set(object_id for object_id, _ in changes))
+            for start in range(0, len(object_ids), OBJECTS_PAGE_SIZE):
+                self._append_changes(
+                    object_ids[start:start + OBJECTS_PAGE_SIZE], changes)
+
+        # Only tags in dimensions change counts, and most are not
+        sql = 'SELECT DISTINCT NODE_TAG_ID ' \
+              'FROM DIMENSIONS ' \
+              'WHERE NODE_TAG_ID = ANY(%s)'
+        params = (list(set(tag_id for _, tag_id in changes)),)
+        dimension_tag_ids = set(execute_sql_fetch_multiple(
+            lambda node_tag_id: node_tag_id, sql, params))
+        object_ids = sorted(set(object_id for object_id, tag_id in changes
+                                if tag_id in dimension_tag_ids))
+
+        for start in range(0, len(object_ids), OBJECTS_PAGE_SIZE):
+            self._update_object_counts(
+                object_ids[start:start + OBJECTS_PAGE_SIZE], changes)
+
+    def _lock_objects(self, object_ids):
+        # Locking the objects, in id order, serialises the changes to the
+        # taggings of each object, so the taggings read next include those
+        # committed by others in the meantime
+        sql = 'SELECT ID ' \
+              'FROM OBJECTS ' \
+              'WHERE ID = ANY(%s) ' \
+              'ORDER BY ID ' \
+              'FOR NO KEY UPDATE'
+        execute_sql_fetch_multiple(lambda id: id, sql, (object_ids,))
+
+    def _append_changes(self, object_ids, changes):
+        # Whether each object has each changed tag is read after the
+        # objects are locked, so the last row of a pair is always right,
+        # however many transactions change it at once
+        self._lock_objects(object_ids)
+        page = set(object_ids)
+        pairs = sorted(pair for pair, change in changes.items()
+                       if change and pair[0] in page)
+        if not pairs:
+            return
+        sql = 'INSERT INTO TAGGING_CHANGES (OBJECT_ID, TAG_ID, PRESENT) ' \
+              'SELECT C.OBJECT_ID, C.TAG_ID, ' \
+              '  EXISTS (SELECT 1 ' \
+              '          FROM TAGGINGS T ' \
+              '          WHERE T.OBJECT_ID = C.OBJECT_ID ' \
+              '            AND T.TAG_ID = C.TAG_ID) ' \
+              'FROM UNNEST(%s::BIGINT[], %s::BIGINT[]) ' \
+              '  AS C (OBJECT_ID, TAG_ID) ' \
+              'RETURNING ID'
+        params = ([object_id for object_id, _ in pairs],
+                  [tag_id for _, tag_id in pairs])
+        execute_sql_fetch_multiple(lambda id: id, sql, params)
+
+    def _update_object_counts(self, object_ids, changes):
+        self._lock_objects(object_ids)
+
+        sql = 'SELECT T.OBJECT_ID, T.TAG_ID, COUNT(1) AS COUNT ' \
+              'FROM TAGGINGS T ' \
+              'WHERE T.OBJECT_ID = ANY(%s) ' \
+              '  AND T.TAG_ID IN (SELECT NODE_TAG_ID FROM DIMENSIONS) ' \
+              'GROUP BY T.OBJECT_ID, T.TAG_ID'
+        after = Counter()
+        for object_id, tag_id, count in execute_sql_fetch_multiple(
+                lambda object_id, tag_id, count: (object_id, tag_id, count),
+                sql, (object_ids,)):
+            after[(object_id, tag_id)] = count
+        # The taggings before the changes, as others' changes are counted
+        # already
+        page = set(object_ids)
+        before = Counter(after)
+        for (object_id, tag_id), change in changes.items():
+            if object_id in page:
+                before[(object_id, tag_id)] -= change
+
+        # Every node of every dimension each tag is at or below
+        sql = 'SELECT D.NODE_TAG_ID AS TAG_ID, N.ROOT_TAG_ID, ' \
+              '       N.NODE_TAG_ID ' \
+              'FROM DIMENSIONS D ' \
+              '  JOIN DIMENSIONS N ON N.ROOT_TAG_ID = D.ROOT_TAG_ID ' \
+              '   AND D.LEFT_BORDER BETWEEN N.LEFT_BORDER ' \
+              '                         AND N.RIGHT_BORDER ' \
+              'WHERE D.NODE_TAG_ID = ANY(%s)'
+        params = (list(set(tag_id for _, tag_id in before)),)
+        ancestors = {}
+        for tag_id, root_tag_id, node_tag_id in execute_sql_fetch_multiple(
+                lambda tag_id, root_tag_id, node_tag_id:
+                (tag_id, root_tag_id, node_tag_id), sql, params):
+            ancestors.setdefault(tag_id, []).append(
+                (root_tag_id, node_tag_id))
+
+        def nodes(taggings):
+            direct, subtree = set(), set()
+            for (object_id, tag_id), count in taggings.items():
+                if count <= 0:
+                    continue
+                for root_tag_id, node_tag_id in ancestors.get(tag_id, []):
+                    node = (object_id, root_tag_id, node_tag_id)
+                    subtree.add(node)
+                    if node_tag_id == tag_id:
+                        direct.add(node)
+            return direct, subtree
+
+        deltas = {}
+        for index, (old, new) in enumerate(zip(nodes(before), nodes(after))):
+            for node, delta in [(n, 1) for n in new - old] \
+                    + [(n, -1) for n in old - new]:
+                key = node[1:]
+                deltas.setdefault(key, [0, 0])[index] += delta
+        deltas = sorted((key, delta) for key, delta in deltas.items()
+                        if delta != [0, 0])
+        if not deltas:
+            return
+
+        # Lock the counts in a fixed order before updating them, so
+        # concurrent updates wait rather than deadlock
+        keys = [key for key, _ in deltas]
+        sql = 'SELECT C.NODE_TAG_ID ' \
+              'FROM DIMENSION_COUNTS C ' \
+              '  JOIN UNNEST(%s::BIGINT[], %s::BIGINT[]) ' \
+              '    AS K (ROOT_TAG_ID, NODE_TAG_ID) ' \
+              '    ON C.ROOT_TAG_ID = K.ROOT_TAG_ID ' \
+              '   AND C.NODE_TAG_ID = K.NODE_TAG_ID ' \
+              'ORDER BY C.ROOT_TAG_ID, C.NODE_TAG_ID ' \
+              'FOR UPDATE OF C'
+        params = ([key[0] for key in keys], [key[1] for key in keys])
+        execute_sql_fetch_multiple(lambda node_tag_id: node_tag_id,
+                                   sql, params)
+
+        sql = 'UPDATE DIMENSION_COUNTS C ' \
+              'SET DIRECT_COUNT = C.DIRECT_COUNT + V.DIRECT_DELTA, ' \
+              '    SUBTREE_COUNT = C.SUBTREE_COUNT + V.SUBTREE_DELTA ' \
+              'FROM UNNEST(%s::BIGINT[], %s::BIGINT[], ' \
+              '            %s::BIGINT[], %s::BIGINT[]) ' \
+              '  AS V (ROOT_TAG_ID, NODE_TAG_ID, DIRECT_DELTA, ' \
+              '        SUBTREE_DELTA) ' \
+              'WHERE C.ROOT_TAG_ID = V.ROOT_TAG_ID ' \
+              '  AND C.NODE_TAG_ID = V.NODE_TAG_ID ' \
+              'RETURNING C.NODE_TAG_ID'
+        params = ([key[0] for key, _ in deltas],
+                  [key[1] for key, _ in deltas],
+                  [delta[0] for _, delta in deltas],
+                  [delta[1] for _, delta in deltas])
+        execute_sql_fetch_multiple(lambda node_tag_id: node_tag_id,
+                                   sql, params)
+
     def count(self):
         self.logger.debug('count()')
         sql = 'SELECT COUNT(1) AS count ' \
@@ -20,12 +196,7 @@ class TaggingService(BaseTaggingService):
     def add(self, tagging):
         self.logger.debug('add(): %s ', repr(tagging))
 
-        if not isinstance(tagging, Tagging):
-            raise ObjectCubeException('Function requires valid tagging')
-        if tagging.id is not None:
-            raise ObjectCubeException('Function must not get Tagging id')
-        if tagging.plugin_set_id and not tagging.plugin_id:
-            raise ObjectCubeException('Cannot have plugin set w/o plugin')
+        self._validate_new(tagging)
 
         # Build the SQL expression, starting with required attributes
         sql_attributes = 'TAG_ID, OBJECT_ID'
@@ -51,7 +222,60 @@ class TaggingService(BaseTaggingService):
               ') VALUES (' \
               + sql_values + \
               ') RETURNING *'
-        return execute_sql_fetch_single(Tagging, sql, params)
+        with UnitOfWork():
+            db_tagging = execute_sql_fetch_single(Tagging, sql, params)
+            self._record_changes(
+                added=[(db_tagging.object_id, db_tagging.tag_id)])
+        return db_tagging
+
+    def add_many(self, taggings, returning=True, page_size=1000L):
+        self.logger.debug('add_many(): %s / %s',
+                          repr(returning), repr(page_size))
+
+        if not isinstance(page_size, LongType) or page_size < 1:
+            raise ObjectCubeException('Function requires valid page size')
+
+        # Rows are validated as they are consumed; an invalid tagging
+        # rolls back the whole batch, as it runs in one transaction
+        added = []
+        keys = []
+
+        def rows():
+            for tagging in taggings:
+                self._validate_new(tagging)
+                added.append((tagging.object_id, tagging.tag_id))
+                row = (tagging.tag_id, tagging.object_id,
+                       tagging.meta or None, tagging.plugin_id or None,
+                       tagging.plugin_set_id or None)
+                keys.append(row)
+                yield row
+
+        sql = 'INSERT INTO TAGGINGS (' \
+              '  TAG_ID, OBJECT_ID, META, PLUGIN_ID, PLUGIN_SET_ID' \
+              ') VALUES {0}'
+        if returning:
+            sql += ' RETURNING *'
+        template = '(%s, %s, %s, %s, %s)'
+        with UnitOfWork():
+            result = execute_sql_insert_many(Tagging if returning else None,
+                                             sql, template, rows(),
+                                             page_size)
+            self._record_changes(added=added)
+        if not returning:
+            return result
+
+        # RETURNING does not keep the order of the rows, so the taggings
+        # are matched back to their input by their columns. Equal
+        # taggings get their ids in ascending order
+        by_key = {}
+        for db_tagging in sorted(result, key=lambda t: t.id):
+            by_key.setdefault((db_tagging.tag_id, db_tagging.object_id,
+                               db_tagging.meta, db_tagging.plugin_id,
+                               db_tagging.plugin_set_id),
+                              []).append(db_tagging)
+        for matches in by_key.values():
+            matches.reverse()
+        return [by_key[key].pop() for key in keys]
 
     def update(self, tagging):
         self.logger.debug('update(): %s', repr(tagging))
@@ -94,22 +318,27 @@ class TaggingService(BaseTaggingService):
         if not tagging.plugin_set_id:
             raise ObjectCubeException('Function requires valid plugin set id')
 
-        if tagging.id:
-            db_tagging = self.update(tagging)
-        else:
-            db_tagging = self.add(tagging)
-
-        # Delete all the other ones in the set
-        # It is possible that this deletes nothing, which is OK
-        # This could happen, for example, when confirming a tagging
-        # without alternatives
-        sql = 'DELETE ' \
-              'FROM TAGGINGS ' \
-              'WHERE PLUGIN_SET_ID = %s ' \
-              '  AND NOT ID = %s ' \
-              'RETURNING *'
-        params = (db_tagging.plugin_set_id, db_tagging.id)
-        execute_sql_fetch_single(Tagging, sql, params)
+        # The tagging and the deletion of its alternatives are
+        # committed together, or not at all
+        with UnitOfWork():
+            if tagging.id:
+                db_tagging = self.update(tagging)
+            else:
+                db_tagging = self.add(tagging)
+
+            # Delete all the other ones in the set
+            # It is possible that this deletes nothing, which is OK
+            # This could happen, for example, when confirming a tagging
+            # without alternatives
+            sql = 'DELETE ' \
+                  'FROM TAGGINGS ' \
+                  'WHERE PLUGIN_SET_ID = %s ' \
+                  '  AND NOT ID = %s ' \
+                  'RETURNING *'
+            params = (db_tagging.plugin_set_id, db_tagging.id)
+            removed = execute_sql_fetch_multiple(Tagging, sql, params)
+            self._record_changes(
+                removed=[(t.object_id, t.tag_id) for t in removed])
         return db_tagging
 
     def delete(self, tagging):
@@ -124,7 +353,11 @@ class TaggingService(BaseTaggingService):
               'WHERE ID = %s' \
               'RETURNING *'
         params = (tagging.id, )
-        db_tagging = execute_sql_fetch_single(Tagging, sql, params)
+        with UnitOfWork():
+            db_tagging = execute_sql_fetch_single(Tagging, sql, params)
+            if db_tagging:
+                self._record_changes(
+                    removed=[(db_tagging.object_id, db_tagging.tag_id)])
 
         if not db_tagging:
             raise ObjectCubeException('No Tagging found to delete')
@@ -140,7 +373,11 @@ class TaggingService(BaseTaggingService):
               'WHERE ID = %s' \
               'RETURNING *'
         params = (id_, )
-        db_tagging = execute_sql_fetch_single(Tagging, sql, params)
+        with UnitOfWork():
+            db_tagging = execute_sql_fetch_single(Tagging, sql, params)
+            if db_tagging:
+                self._record_changes(
+                    removed=[(db_tagging.object_id, db_tagging.tag_id)])
 
         if not db_tagging:
             raise ObjectCubeException('No Tagging found to delete')
@@ -157,9 +394,12 @@ class TaggingService(BaseTaggingService):
               'WHERE PLUGIN_SET_ID = %s ' \
               'RETURNING *'
         params = (plugin_set_id, )
-        db_tagging = execute_sql_fetch_single(Tagging, sql, params)
+        with UnitOfWork():
+            removed = execute_sql_fetch_multiple(Tagging, sql, params)
+            self._record_changes(
+                removed=[(t.object_id, t.tag_id) for t in removed])
 
-        if not db_tagging:
+        if not removed:
             raise ObjectCubeException('No Tagging found to delete')
         return None
 
@@ -175,7 +415,7 @@ class TaggingService(BaseTaggingService):
         params = (id_,)
         return execute_sql_fetch_single(Tagging, sql, params)
 
-    def retrieve(self, offset=0L, limit=10L):
+    def retrieve(self, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve(): %s / %s',
                           repr(offset), repr(limit))
 
@@ -183,14 +423,18 @@ class TaggingService(BaseTaggingService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT * ' \
               'FROM TAGGINGS ' \
+              'WHERE ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (offset, limit)
+        params = (after_id, offset, limit)
         return execute_sql_fetch_multiple(Tagging, sql, params)
 
-    def retrieve_by_tag_id(self, tag_id, offset=0L, limit=10L):
+    def retrieve_by_tag_id(self, tag_id, offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_by_tag_id(): %s', repr(tag_id))
 
         if not isinstance(tag_id, LongType):
@@ -200,15 +444,36 @@ class TaggingService(BaseTaggingService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT * ' \
               'FROM TAGGINGS ' \
               'WHERE TAG_ID = %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (tag_id, offset, limit)
+        params = (tag_id, after_id, offset, limit)
         return execute_sql_fetch_multiple(Tagging, sql, params)
 
-    def retrieve_by_object_id(self, object_id, offset=0L, limit=10L):
+    def iter_by_tag_id(self, tag_id, after_id=0L):
+        self.logger.debug('iter_by_tag_id(): %s', repr(tag_id))
+
+        if not isinstance(tag_id, LongType):
+            raise ObjectCubeException('Function requires valid tag id')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
+
+        sql = 'SELECT * ' \
+              'FROM TAGGINGS ' \
+              'WHERE TAG_ID = %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID'
+        params = (tag_id, after_id)
+        return execute_sql_iterate(Tagging, sql, params)
+
+    def retrieve_by_object_id(self, object_id,
+                              offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_by_object_id(): %s', repr(object_id))
 
         if not isinstance(object_id, LongType):
@@ -218,15 +483,36 @@ class TaggingService(BaseTaggingService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT * ' \
               'FROM TAGGINGS ' \
               'WHERE OBJECT_ID = %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (object_id, offset, limit)
+        params = (object_id, after_id, offset, limit)
         return execute_sql_fetch_multiple(Tagging, sql, params)
 
-    def retrieve_by_set_id(self, plugin_set_id, offset=0L, limit=10L):
+    def iter_by_object_id(self, object_id, after_id=0L):
+        self.logger.debug('iter_by_object_id(): %s', repr(object_id))
+
+        if not isinstance(object_id, LongType):
+            raise ObjectCubeException('Function requires valid object id')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
+
+        sql = 'SELECT * ' \
+              'FROM TAGGINGS ' \
+              'WHERE OBJECT_ID = %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID'
+        params = (object_id, after_id)
+        return execute_sql_iterate(Tagging, sql, params)
+
+    def retrieve_by_set_id(self, plugin_set_id,
+                           offset=0L, limit=10L, after_id=0L):
         self.logger.debug('retrieve_by_set_id(): %s', repr(plugin_set_id))
 
         if not isinstance(plugin_set_id, LongType):
@@ -236,10 +522,14 @@ class TaggingService(BaseTaggingService):
             raise ObjectCubeException('Function requires valid offset')
         if not isinstance(limit, LongType):
             raise ObjectCubeException('Function requires valid limit')
+        if not isinstance(after_id, LongType):
+            raise ObjectCubeException('Function requires valid after id')
 
         sql = 'SELECT * ' \
               'FROM TAGGINGS ' \
               'WHERE PLUGIN_SET_ID = %s ' \
+              '  AND ID > %s ' \
+              'ORDER BY ID ' \
               'OFFSET %s LIMIT %s'
-        params = (plugin_set_id, offset, limit)
+        params = (plugin_set_id, after_id, offset, limit)
         return execute_sql_fetch_multiple(Tagging, sql, params)
@@ -1,13 +1,25 @@
+import itertools
 import psycopg2
 import psycopg2.extensions
-from psycopg2.extras import NamedTupleCursor
 from objectcube.contexts import Connection
+from objectcube.data_objects import ObjectCubeClass
 from objectcube.exceptions import ObjectCubeException
 from logging import getLogger
 
 psycopg2.extensions.register_type(psycopg2.extensions.UNICODE)
 psycopg2.extensions.register_type(psycopg2.extensions.UNICODEARRAY)
 logger = getLogger('PostgreSQL: Utils')
+cursor_names = itertools.count()
+
+
+def _row_builder(value_object_class, cursor):
+    # Data objects are built from the trusted rows without type checking,
+    # other callables are called with the columns as keyword arguments
+    columns = [column[0] for column in cursor.description]
+    if isinstance(value_object_class, type) \
+            and issubclass(value_object_class, ObjectCubeClass):
+        return value_object_class.row_builder(columns)
+    return lambda row: value_object_class(**dict(zip(columns, row)))
 
 
 def execute_sql_fetch_single(value_object_class, sql, params=()):
@@ -15,11 +27,11 @@ def execute_sql_fetch_single(value_object_class, sql, params=()):
     logger.debug('SQL command: ' + repr(sql) + ' Parameters: ' + repr(params))
     try:
         with Connection() as c:
-            with c.cursor(cursor_factory=NamedTupleCursor) as cursor:
+            with c.cursor() as cursor:
                 cursor.execute(sql, params)
                 row = cursor.fetchone()
                 if row:
-                    return value_object_class(**row._asdict())
+                    return _row_builder(value_object_class, cursor)(row)
                 else:
                     return None
     except Exception as ex:
@@ -32,12 +44,98 @@ def execute_sql_fetch_multiple(value_object_class, sql, params):
     logger.debug('SQL command: ' + repr(sql) + ' Parameters: ' + repr(params))
     try:
         with Connection() as c:
-            with c.cursor(cursor_factory=NamedTupleCursor) as cursor:
+            with c.cursor() as cursor:
+                cursor.execute(sql, params)
+                build = _row_builder(value_object_class, cursor)
+                return [build(row) for row in cursor.fetchall()]
+    except Exception as ex:
+        raise ObjectCubeException(ex.message)
+
+
+def execute_sql_iterate(value_object_class, sql, params=(), itersize=1000):
+    """
+    Generator yielding one value object per row, read in batches of
+    itersize rows through a server side cursor, so memory use does not
+    depend on the size of the result. The connection is returned when the
+    rows run out, or when the generator is closed by a consumer that
+    stops early.
+    """
+    logger.debug('Execute SQL, iterate values')
+    logger.debug('SQL command: ' + repr(sql) + ' Parameters: ' + repr(params))
+    try:
+        with Connection() as c:
+            cursor = c.cursor('objectcube_iterate_{0}'
+                              .format(next(cursor_names)))
+            cursor.itersize = itersize
+            try:
                 cursor.execute(sql, params)
+                build = None
+                for row in cursor:
+                    if build is None:
+                        build = _row_builder(value_object_class, cursor)
+                    try:
+                        yield build(row)
+                    except GeneratorExit:
+                        # Stopping early is not a failure, and must not
+                        # roll back a unit of work the statement joined
+                        return
+            finally:
+                cursor.close()
+    except Exception as ex:
+        logger.error(ex.message)
+        raise ObjectCubeException(ex.message)
+
+
+def _pages(rows, page_size):
+    page = []
+    for row in rows:
+        page.append(row)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
 
+
+def execute_sql_insert_many(value_object_class, sql, template, rows,
+                            page_size=1000):
+    """
+    Inserts many rows with multi-row INSERT statements, one per page of
+    rows, in a single transaction.
+    :param value_object_class: class to build returned rows with, or None
+    :param sql: INSERT statement with a {0} placeholder for the VALUES list
+    :param template: parameter template for one row, e.g. '(%s, %s)'
+    :param rows: iterable of parameter tuples, consumed lazily
+    :param page_size: the number of rows sent in one statement
+    :return: [value_object_class], or the number of rows inserted if
+             value_object_class is None. PostgreSQL does not promise that
+             RETURNING gives rows in VALUES order, so callers that need
+             the order must match the returned rows to their input
+    """
+    logger.debug('Execute SQL, insert many rows')
+    logger.debug('SQL command: ' + repr(sql) + ' Template: ' + repr(template))
+    try:
+        with Connection() as c:
+            with c.cursor() as cursor:
                 return_list = []
-                for row in cursor.fetchall():
-                    return_list.append(value_object_class(**row._asdict()))
-                return return_list
+                inserted = 0
+                build = None
+                for page in _pages(rows, page_size):
+                    values = ','.join(cursor.mogrify(template, row)
+                                      for row in page)
+                    cursor.execute(sql.format(values))
+                    inserted += cursor.rowcount
+                    if value_object_class:
+                        if build is None:
+                            build = _row_builder(value_object_class, cursor)
+                        return_list.extend(build(row)
+                                           for row in cursor.fetchall())
+
+                if value_object_class:
+                    return return_list
+                return inserted
+    except ObjectCubeException:
+        raise
     except Exception as ex:
+        logger.error(ex.message)
         raise ObjectCubeException(ex.message)
@@ -9,6 +9,77 @@ DB_PASSWORD = os.environ.get('OBJECTCUBE_DB_PASSWORD',
                              os.environ.get('LOGNAME'))
 DB_MEASURE = int(os.environ.get('OBJECTCUBE_MEASURE', False))
 
+# Connection pool configurations. A checkout waits up to DB_POOL_TIMEOUT
+# seconds for a free connection, connections are replaced after
+# DB_POOL_MAX_LIFETIME seconds, and DB_POOL_PRE_PING checks each
+# connection with a round trip before it is handed out.
+DB_POOL_MIN_CONNECTIONS = int(os.environ.get('OBJECTCUBE_DB_POOL_MIN', 1))
+DB_POOL_MAX_CONNECTIONS = int(os.environ.get('OBJECTCUBE_DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('OBJECTCUBE_DB_POOL_TIMEOUT', 30))
+DB_POOL_MAX_LIFETIME = float(
+    os.environ.get('OBJECTCUBE_DB_POOL_MAX_LIFETIME', 3600))
+DB_POOL_PRE_PING = int(os.environ.get('OBJECTCUBE_DB_POOL_PRE_PING', False))
+
+# Directory of the file system blob store. It is created when missing,
+# and existing blobs are kept when the service starts.
+FILESYSTEM_BLOB_DIR = os.environ.get('FILESYSTEM_BLOB_DIR', 'blobs')
+
+# Keep the digests of all blobs in memory, so has() rarely touches the
+# disk. Costs about 100 bytes per blob.
+FILESYSTEM_BLOB_INDEX = int(os.environ.get('OBJECTCUBE_BLOB_INDEX', True))
+
+# The blob garbage collector keeps blobs added or re-added within the
+# last BLOB_GC_GRACE_PERIOD seconds, and sleeps BLOB_GC_PAUSE seconds
+# after each batch to leave I/O for other traffic.
+BLOB_GC_GRACE_PERIOD = float(
+    os.environ.get('OBJECTCUBE_BLOB_GC_GRACE_PERIOD', 86400))
+BLOB_GC_PAUSE = float(os.environ.get('OBJECTCUBE_BLOB_GC_PAUSE', 0.05))
+
+# Algorithm of the digests of new blobs, see objectcube.utils.ALGORITHMS.
+# Blobs keep the digests they were added with. Tree digests are computed
+# by HASH_THREADS threads.
+DIGEST_ALGORITHM = os.environ.get('OBJECTCUBE_DIGEST_ALGORITHM', 'md5')
+HASH_THREADS = int(os.environ.get('OBJECTCUBE_HASH_THREADS', 4))
+
+# Blobs of at least BLOB_COMPRESSION_MIN_SIZE bytes that compress well are
+# stored compressed with zlib at BLOB_COMPRESSION_LEVEL, from 1 to 9. Off
+# when the level is 0. Digests and sizes are those of the original data.
+BLOB_COMPRESSION_LEVEL = int(
+    os.environ.get('OBJECTCUBE_BLOB_COMPRESSION_LEVEL', 0))
+BLOB_COMPRESSION_MIN_SIZE = int(
+    os.environ.get('OBJECTCUBE_BLOB_COMPRESSION_MIN_SIZE', 2**12))
+
+# PackBlobService appends blobs of up to PACK_BLOB_MAX_SIZE bytes to
+# segment files of about PACK_SEGMENT_SIZE bytes, and stores larger blobs
+# in files of their own like FileBlobService.
+PACK_BLOB_MAX_SIZE = int(os.environ.get('OBJECTCUBE_PACK_BLOB_MAX_SIZE',
+                                        2**16))
+PACK_SEGMENT_SIZE = int(os.environ.get('OBJECTCUBE_PACK_SEGMENT_SIZE',
+                                       2**28))
+
+# TaggingService records in TAGGING_CHANGES whether an object still has
+# a tag after each change to its taggings when TAGGING_CHANGE_FEED is on.
+# TagIndexService needs it to stay current. It must be on in every process
+# that changes taggings, so true, yes and on turn it on as well as 1.
+TAGGING_CHANGE_FEED = os.environ.get(
+    'OBJECTCUBE_TAGGING_CHANGE_FEED', '').strip().lower() \
+    in ('1', 'true', 'yes', 'on')
+
+# TagIndexService starts from the snapshot file TAG_INDEX_SNAPSHOT, unless
+# it is older than TAG_INDEX_CHANGE_RETENTION seconds, the age at which
+# changes are deleted from TAGGING_CHANGES. It reads new changes at most
+# every TAG_INDEX_REFRESH_INTERVAL seconds, and reads those of the last
+# TAG_INDEX_CHANGE_LOOKBACK seconds again, in case they were committed
+# after they were first looked for.
+TAG_INDEX_SNAPSHOT = os.environ.get('OBJECTCUBE_TAG_INDEX_SNAPSHOT',
+                                    'tag_index.snapshot')
+TAG_INDEX_REFRESH_INTERVAL = float(
+    os.environ.get('OBJECTCUBE_TAG_INDEX_REFRESH_INTERVAL', 1))
+TAG_INDEX_CHANGE_LOOKBACK = float(
+    os.environ.get('OBJECTCUBE_TAG_INDEX_CHANGE_LOOKBACK', 60))
+TAG_INDEX_CHANGE_RETENTION = float(
+    os.environ.get('OBJECTCUBE_TAG_INDEX_CHANGE_RETENTION', 7 * 86400))
+
 # Concept service configuration.
 FACTORY_CONFIG = {
     'TagService': 'objectcube.services.impl.postgresql.tag.'
@@ -20,6 +91,8 @@ FACTORY_CONFIG = {
     'ObjectService': 'objectcube.services.impl.postgresql.object.'
                      'ObjectService',
 
+    # Or 'objectcube.services.impl.filesystem.pack_blob_service.'
+    # 'PackBlobService' for stores of many small blobs
     'BlobService': 'objectcube.services.impl.filesystem.'
                    'blob_service.FileBlobService',
 
@@ -31,6 +104,14 @@ FACTORY_CONFIG = {
 
     'TaggingService': 'objectcube.services.impl.postgresql.tagging.'
                   'TaggingService',
+
+    'CubeService': 'objectcube.services.impl.postgresql.cube.'
+                   'CubeService',
+
+    # Keeps an index of all the taggings in memory, see
+    # TAGGING_CHANGE_FEED
+    'TagIndexService': 'objectcube.services.impl.memory.tag_index.'
+                       'TagIndexService',
 }
 
 PLUGINS = (
@@ -1,10 +1,142 @@
 import hashlib
-from hashlib import md5
+import os
+import threading
+from multiprocessing.pool import ThreadPool
 
+from objectcube.exceptions import ObjectCubeException
+from objectcube import settings
 
-def md5_from_stream(f, block_size=2**20):
+# Digests are written as <algorithm>-<hex>, except MD5 digests, which are
+# plain hex as they were before other algorithms were supported. Tree
+# digests hash each TREE_CHUNK_SIZE chunk on its own, in parallel, and
+# then the leaf digests in order. The chunk size is part of the digest
+# and must never change.
+MD5 = 'md5'
+ALGORITHMS = {
+    MD5: MD5,
+    'sha1': 'sha1',
+    'sha256': 'sha256',
+    'sha256tree': 'sha256',
+}
+TREE_CHUNK_SIZE = 2**22
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    # Threads do not survive a fork, so a forked process makes its own
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPool(settings.HASH_THREADS)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _hash_chunk(name, chunk):
+    # update() releases the GIL while hashing large data, so chunks hash
+    # in parallel
+    h = hashlib.new(name)
+    h.update(chunk)
+    return h.digest()
+
+
+class _Hasher(object):
+    def __init__(self, algorithm):
+        self.prefix = '' if algorithm == MD5 else algorithm + '-'
+        self.hash = hashlib.new(ALGORITHMS[algorithm])
+
+    def update(self, data):
+        self.hash.update(data)
+
+    def hexdigest(self):
+        return self.prefix + self.hash.hexdigest()
+
+
+class _TreeHasher(object):
+    def __init__(self, algorithm):
+        self.prefix = algorithm + '-'
+        self.name = ALGORITHMS[algorithm]
+        self.pool = _get_pool()
+        # Waiting for the oldest leaves bounds the chunks held in memory
+        self.max_pending = 2 * settings.HASH_THREADS
+        self.leaves = []
+        self.waited = 0
+        self.chunks = []
+        self.size = 0
+
+    def update(self, data):
+        # Only the last, partial chunk is buffered, so data is copied once
+        # however it is split between calls
+        offset = 0
+        if self.chunks:
+            offset = min(len(data), TREE_CHUNK_SIZE - self.size)
+            self.chunks.append(data[:offset])
+            self.size += offset
+            if self.size < TREE_CHUNK_SIZE:
+                return
+            self._add_leaf(''.join(self.chunks))
+            self.chunks = []
+            self.size = 0
+        while len(data) - offset >= TREE_CHUNK_SIZE:
+            self._add_leaf(data[offset:offset + TREE_CHUNK_SIZE])
+            offset += TREE_CHUNK_SIZE
+        if offset < len(data):
+            self.chunks.append(data[offset:])
+            self.size = len(data) - offset
+
+    def _add_leaf(self, chunk):
+        self.leaves.append(self.pool.apply_async(_hash_chunk,
+                                                 (self.name, chunk)))
+        while len(self.leaves) - self.waited > self.max_pending:
+            self.leaves[self.waited].wait()
+            self.waited += 1
+
+    def hexdigest(self):
+        if self.chunks:
+            self._add_leaf(''.join(self.chunks))
+            self.chunks = []
+            self.size = 0
+        root = hashlib.new(self.name)
+        for leaf in self.leaves:
+            root.update(leaf.get())
+        return self.prefix + root.hexdigest()
+
+
+def new_hasher(algorithm=None):
+    """
+    Creates a hasher with update(data) and hexdigest() methods, like
+    those of hashlib, whose hexdigest() returns a digest string.
+    :param algorithm: one of ALGORITHMS, settings.DIGEST_ALGORITHM if None
+    """
+    algorithm = algorithm or settings.DIGEST_ALGORITHM
+    if algorithm not in ALGORITHMS:
+        raise ObjectCubeException('Unknown digest algorithm {0}'
+                                  .format(algorithm))
+    if ALGORITHMS[algorithm] != algorithm:
+        return _TreeHasher(algorithm)
+    return _Hasher(algorithm)
+
+
+def digest_algorithm(digest):
+    """
+    Returns the algorithm a digest was made with, e.g. to check data
+    against it.
+    """
+    if '-' not in digest:
+        return MD5
+    algorithm = digest.rsplit('-', 1)[0]
+    if algorithm not in ALGORITHMS:
+        raise ObjectCubeException('Unknown digest algorithm {0}'
+                                  .format(algorithm))
+    return algorithm
+
+
+def digest_from_stream(f, algorithm=None, block_size=2**20):
     f.seek(0)
-    digest = hashlib.md5()
+    digest = new_hasher(algorithm)
     while True:
         data = f.read(block_size)
         if not data:
@@ -14,7 +146,34 @@ def md5_from_stream(f, block_size=2**20):
     return digest.hexdigest()
 
 
-def md5_from_value(value):
-    h = md5()
+def digest_from_value(value, algorithm=None):
+    h = new_hasher(algorithm)
     h.update(str(value))
     return h.hexdigest()
+
+
+def md5_from_stream(f, block_size=2**20):
+    return digest_from_stream(f, MD5, block_size)
+
+
+def md5_from_value(value):
+    return digest_from_value(value, MD5)
+
+
+def hash_and_copy(src, dst, block_size=2**20, algorithm=None):
+    """
+    Copies a stream from its current position to a file-like object in
+    one pass, computing the digest on the way. The source does not need
+    to be seekable.
+    :return: tuple of the digest and the number of bytes copied
+    """
+    digest = new_hasher(algorithm)
+    size = 0
+    while True:
+        data = src.read(block_size)
+        if not data:
+            break
+        digest.update(data)
+        dst.write(data)
+        size += len(data)
+    return digest.hexdigest(), size
@@ -1,10 +1,15 @@
 DROP TABLE IF EXISTS OBJECTS CASCADE;
 DROP TABLE IF EXISTS TAGGINGS CASCADE;
+DROP TABLE IF EXISTS DIMENSION_COUNTS CASCADE;
+DROP TABLE IF EXISTS TAGGING_CHANGES CASCADE;
 DROP TABLE IF EXISTS DIMENSIONS CASCADE;
 DROP TABLE IF EXISTS BLOB CASCADE;
 DROP TABLE IF EXISTS TAGS CASCADE;
 DROP TABLE IF EXISTS PLUGINS CASCADE;
 DROP TABLE IF EXISTS CONCEPTS CASCADE;
+DROP TABLE IF EXISTS SCHEMA_VERSION CASCADE;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 
 CREATE TABLE PLUGINS (
@@ -59,3 +64,60 @@ CREATE TABLE TAGGINGS (
   FOREIGN KEY(OBJECT_ID) REFERENCES OBJECTS(ID),
   FOREIGN KEY(PLUGIN_ID) REFERENCES PLUGINS(ID)
 );
+
+-- Secondary indexes, see migrations/001_secondary_indexes.sql
+CREATE INDEX TAGGINGS_TAG_ID_OBJECT_ID_IDX ON TAGGINGS (TAG_ID, OBJECT_ID);
+CREATE INDEX TAGGINGS_OBJECT_ID_TAG_ID_IDX ON TAGGINGS (OBJECT_ID, TAG_ID);
+CREATE INDEX TAGGINGS_PLUGIN_SET_ID_IDX ON TAGGINGS (PLUGIN_SET_ID)
+  WHERE PLUGIN_SET_ID IS NOT NULL;
+CREATE INDEX TAGS_VALUE_IDX ON TAGS (VALUE);
+CREATE INDEX DIMENSIONS_NODE_TAG_ID_IDX ON DIMENSIONS (NODE_TAG_ID, ROOT_TAG_ID);
+CREATE INDEX DIMENSIONS_ROOT_TAG_ID_LEFT_IDX ON DIMENSIONS (ROOT_TAG_ID, LEFT_BORDER);
+CREATE INDEX TAGS_VALUE_TRGM_IDX ON TAGS USING GIN (VALUE gin_trgm_ops);
+CREATE INDEX TAGS_DESCRIPTION_TRGM_IDX ON TAGS USING GIN (DESCRIPTION gin_trgm_ops);
+CREATE INDEX OBJECTS_NAME_TRGM_IDX ON OBJECTS USING GIN (NAME gin_trgm_ops);
+CREATE INDEX CONCEPTS_TITLE_TRGM_IDX ON CONCEPTS USING GIN (TITLE gin_trgm_ops);
+
+-- Keyset pagination indexes, see migrations/002_keyset_indexes.sql
+CREATE INDEX TAGGINGS_TAG_ID_ID_IDX ON TAGGINGS (TAG_ID, ID);
+CREATE INDEX TAGS_CONCEPT_ID_ID_IDX ON TAGS (CONCEPT_ID, ID)
+  WHERE CONCEPT_ID IS NOT NULL;
+CREATE INDEX TAGS_PLUGIN_ID_ID_IDX ON TAGS (PLUGIN_ID, ID)
+  WHERE PLUGIN_ID IS NOT NULL;
+
+-- Key for upserting plugin tags, see migrations/003_tags_unique_plugin_key.sql
+CREATE UNIQUE INDEX TAGS_PLUGIN_KEY_IDX
+  ON TAGS (VALUE, TYPE, CONCEPT_ID, PLUGIN_ID);
+
+-- Digest ranges for blob garbage collection, see
+-- migrations/004_objects_digest_index.sql
+CREATE INDEX OBJECTS_DIGEST_IDX ON OBJECTS (DIGEST COLLATE "C");
+
+-- Object counts per dimension node, see migrations/005_dimension_counts.sql
+CREATE TABLE DIMENSION_COUNTS (
+  ROOT_TAG_ID BIGINT NOT NULL,
+  NODE_TAG_ID BIGINT NOT NULL,
+  DIRECT_COUNT BIGINT NOT NULL DEFAULT 0,
+  SUBTREE_COUNT BIGINT NOT NULL DEFAULT 0,
+  CONSTRAINT DIMENSION_COUNTS_PK PRIMARY KEY(ROOT_TAG_ID, NODE_TAG_ID),
+  FOREIGN KEY(ROOT_TAG_ID, NODE_TAG_ID)
+    REFERENCES DIMENSIONS(ROOT_TAG_ID, NODE_TAG_ID) ON DELETE CASCADE
+);
+
+-- Change feed of the taggings, see migrations/006_tagging_changes.sql
+CREATE TABLE TAGGING_CHANGES (
+  ID BIGSERIAL PRIMARY KEY NOT NULL,
+  OBJECT_ID BIGINT NOT NULL,
+  TAG_ID BIGINT NOT NULL,
+  PRESENT BOOLEAN NOT NULL,
+  CREATED TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CLOCK_TIMESTAMP()
+);
+CREATE INDEX TAGGING_CHANGES_CREATED_IDX ON TAGGING_CHANGES (CREATED);
+
+-- The schema version this file corresponds to; migrations/ holds the
+-- steps to bring an existing database up to it
+CREATE TABLE SCHEMA_VERSION (
+  VERSION BIGINT PRIMARY KEY NOT NULL,
+  APPLIED TIMESTAMP NOT NULL DEFAULT NOW()
+);
+INSERT INTO SCHEMA_VERSION (VERSION) VALUES (1), (2), (3), (4), (5), (6);
@@ -1,5 +1,7 @@
 import unittest
 from objectcube.contexts import Connection
+from objectcube.data_objects import Object, Tag, Tagging
+from objectcube.factory import get_service
 
 
 class TestDatabaseAwareTest(unittest.TestCase):
@@ -20,6 +22,26 @@ class ObjectCubeTestCase(TestDatabaseAwareTest):
 
     def __init__(self, *args, **kwargs):
         super(ObjectCubeTestCase, self).__init__(*args, **kwargs)
+        self.object_service = get_service('ObjectService')
+        self.tag_service = get_service('TagService')
+        self.tagging_service = get_service('TaggingService')
+
+    def _create_tags(self, values, concept_id=None):
+        return [self.tag_service.add(Tag(value=value, description=u'D',
+                                         mutable=False, type=1L,
+                                         concept_id=concept_id))
+                for value in values]
+
+    def _create_objects(self, count):
+        return [self.object_service.add(Object(name=u'O' + unicode(i),
+                                               digest=u'D' + unicode(i)))
+                for i in range(count)]
+
+    def _tag(self, object_, *tags, **kwargs):
+        return [self.tagging_service.add(Tagging(tag_id=tag.id,
+                                                 object_id=object_.id,
+                                                 **kwargs))
+                for tag in tags]
 
     # def _create_test_tag(self, value=u'Value', description=u'Description',
     #                      plugin=None, concept=None):
@@ -0,0 +1,82 @@
+import random
+import unittest
+
+from objectcube.services.impl.memory.bitmap import ARRAY_MAX, Bitmap, union
+
+
+class TestBitmap(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+
+    def _sample(self, size, span):
+        return set(random.randrange(span) for _ in range(size))
+
+    def test_holds_sparse_and_dense_chunks(self):
+        for values in [set(), {0L}, self._sample(100, 2**16),
+                       self._sample(3 * ARRAY_MAX, 2**16),
+                       self._sample(ARRAY_MAX, 2**40)]:
+            bitmap = Bitmap(values)
+            self.assertEqual(list(bitmap), sorted(values))
+            self.assertEqual(len(bitmap), len(values))
+            self.assertEqual(Bitmap.from_sorted(sorted(values)), bitmap)
+            for value in list(values)[:10]:
+                self.assertIn(value, bitmap)
+
+    def test_from_sorted_skips_repeats(self):
+        bitmap = Bitmap.from_sorted([1L, 1L, 2L, 2**20, 2**20])
+        self.assertEqual(list(bitmap), [1L, 2L, 2**20])
+        self.assertEqual(len(bitmap), 3)
+
+    def test_set_operations(self):
+        for size_a, size_b in [(10, 10), (10, 20000), (20000, 30000)]:
+            a = self._sample(size_a, 2**17)
+            b = self._sample(size_b, 2**17)
+            bitmap_a, bitmap_b = Bitmap(a), Bitmap(b)
+            self.assertEqual(list(bitmap_a & bitmap_b), sorted(a & b))
+            self.assertEqual(list(bitmap_a | bitmap_b), sorted(a | b))
+            self.assertEqual(list(bitmap_a - bitmap_b), sorted(a - b))
+            self.assertEqual(list(bitmap_b - bitmap_a), sorted(b - a))
+            self.assertEqual(bitmap_a.intersection_len(bitmap_b),
+                             len(a & b))
+            self.assertEqual(list(union([bitmap_a, bitmap_b, bitmap_a])),
+                             sorted(a | b))
+            # The operands are left as they were
+            self.assertEqual(list(bitmap_a), sorted(a))
+            self.assertEqual(list(bitmap_b), sorted(b))
+
+    def test_add_and_discard(self):
+        values = self._sample(2 * ARRAY_MAX, 2**16)
+        bitmap = Bitmap()
+        for value in values:
+            self.assertTrue(bitmap.add(value))
+            self.assertFalse(bitmap.add(value))
+        removed = set(random.sample(sorted(values), 2 * ARRAY_MAX // 3))
+        for value in removed:
+            self.assertTrue(bitmap.discard(value))
+            self.assertFalse(bitmap.discard(value))
+        self.assertEqual(list(bitmap), sorted(values - removed))
+        self.assertEqual(len(bitmap), len(values - removed))
+        for value in values - removed:
+            bitmap.discard(value)
+        self.assertFalse(bitmap)
+
+    def test_iter_after_and_last(self):
+        values = self._sample(3 * ARRAY_MAX, 2**18)
+        bitmap = Bitmap(values)
+        for start in [-1, 0, 2**16 - 1, 2**16, 12345, 2**18]:
+            self.assertEqual(list(bitmap.iter_after(start)),
+                             sorted(value for value in values
+                                    if value > start))
+        self.assertEqual(bitmap.last(), max(values))
+        self.assertIsNone(Bitmap().last())
+
+    def test_dump_and_load(self):
+        bitmap = Bitmap(self._sample(3 * ARRAY_MAX, 2**17)
+                        | self._sample(10, 2**40))
+        loaded = Bitmap.load(bitmap.dump())
+        self.assertEqual(loaded, bitmap)
+        self.assertEqual(len(loaded), len(bitmap))
+
+    def test_costs_at_most_two_bytes_per_value_and_chunk_overhead(self):
+        bitmap = Bitmap.from_sorted(sorted(self._sample(10**5, 2**20)))
+        self.assertLess(bitmap.memory_size(), 2 * len(bitmap) + 100 * 16)
@@ -1,9 +1,12 @@
+import os
 import unittest
 import cStringIO
 from objectcube.exceptions import ObjectCubeException
-from objectcube.utils import md5_from_stream
+from objectcube.utils import digest_from_value, md5_from_stream
 
 from objectcube.factory import get_service
+from objectcube.services.impl.filesystem.compression import ZLIB
+from objectcube import settings
 
 
 class TestBlobService(unittest.TestCase):
@@ -77,3 +80,417 @@ class TestBlobService(unittest.TestCase):
         data = cStringIO.StringIO('some-data')
         digest = self.blob_service.add(data)
         self.assertTrue(self.blob_service.has(digest))
+
+    def test_new_service_keeps_existing_blobs(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        blob_service = get_service('BlobService', shared=False)
+        self.assertTrue(blob_service.has(digest))
+
+    def test_add_stores_blob_in_sharded_directory(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'),
+                                       meta={'a': 1})
+        shard = os.path.join(self.blob_service.blob_disk_location,
+                             digest[0:2], digest[2:4])
+        self.assertEqual(os.listdir(shard), [digest])
+
+    def test_invalid_digest_is_rejected(self):
+        self.assertFalse(self.blob_service.has('../outside'))
+        self.assertFalse(self.blob_service.has(None))
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.add(cStringIO.StringIO('data'),
+                                  digest='../outside')
+
+    def test_migrate_flat_layout_moves_blobs_and_meta(self):
+        data = cStringIO.StringIO('flat data')
+        digest = md5_from_stream(data)
+        location = self.blob_service.blob_disk_location
+        with open(os.path.join(location, digest), 'wb') as fs:
+            fs.write(data.read())
+        with open(os.path.join(location, digest + '.meta'), 'w') as fs:
+            fs.write('{"a": 1}')
+        self.assertFalse(self.blob_service.has(digest))
+
+        self.assertEqual(self.blob_service.migrate_flat_layout(), 2)
+        self.assertEqual(self.blob_service.retrieve_meta(digest), {'a': 1})
+        self.assertEqual(self.blob_service.migrate_meta_files(), 1)
+        self.assertEqual(self.blob_service.retrieve_meta(digest), {'a': 1})
+        self.assertEqual(self.blob_service.migrate_meta_files(), 0)
+        self.assertEqual(md5_from_stream(self.blob_service.get_data(digest)),
+                         digest)
+        self.assertEqual(self.blob_service.migrate_flat_layout(), 0)
+
+    def test_get_data_streaming_returns_open_file(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        with self.blob_service.get_data(digest, streaming=True) as f:
+            self.assertEqual(f.read(), 'some-data')
+
+    def test_get_size_returns_blob_size(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        self.assertEqual(self.blob_service.get_size(digest), 9)
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.get_size('nothing')
+
+    def test_iter_data_returns_chunks(self):
+        digest = self.blob_service.add(cStringIO.StringIO('0123456789'))
+        chunks = list(self.blob_service.iter_data(digest, chunk_size=4))
+        self.assertEqual(chunks, ['0123', '4567', '89'])
+
+    def test_iter_data_returns_byte_range(self):
+        digest = self.blob_service.add(cStringIO.StringIO('0123456789'))
+        self.assertEqual(''.join(self.blob_service.iter_data(
+            digest, offset=3, length=5, chunk_size=2)), '34567')
+        self.assertEqual(''.join(self.blob_service.iter_data(
+            digest, offset=8, length=5)), '89')
+        self.assertEqual(''.join(self.blob_service.iter_data(
+            digest, offset=20)), '')
+
+    def test_iter_data_raises_on_invalid_arguments(self):
+        digest = self.blob_service.add(cStringIO.StringIO('0123456789'))
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.iter_data('nothing')
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.iter_data(digest, offset=-1)
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.iter_data(digest, length='1')
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.iter_data(digest, chunk_size=0)
+
+    def test_map_data_maps_blob(self):
+        digest = self.blob_service.add(cStringIO.StringIO('0123456789'))
+        data = self.blob_service.map_data(digest)
+        self.assertEqual(len(data), 10)
+        self.assertEqual(data[2:5], '234')
+        data.close()
+        empty = self.blob_service.add(cStringIO.StringIO(''))
+        self.assertEqual(len(self.blob_service.map_data(empty)), 0)
+
+    def _temp_files(self):
+        return [name for name in
+                os.listdir(self.blob_service.blob_disk_location)
+                if name.startswith('.')]
+
+    def test_add_reads_non_seekable_stream_once(self):
+        class Pipe(object):
+            def __init__(self, data):
+                self.data = cStringIO.StringIO(data)
+
+            def read(self, size=-1):
+                return self.data.read(size)
+
+        digest = self.blob_service.add(Pipe('some-data' * 1000))
+        self.assertEqual(digest, md5_from_stream(
+            cStringIO.StringIO('some-data' * 1000)))
+        self.assertEqual(self.blob_service.get_size(digest), 9000)
+        self.assertEqual(self._temp_files(), [])
+
+    def test_add_raises_when_digest_does_not_match_data(self):
+        digest = md5_from_stream(cStringIO.StringIO('other-data'))
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.add(cStringIO.StringIO('some-data'),
+                                  digest=digest)
+        self.assertFalse(self.blob_service.has(digest))
+        self.assertEqual(self._temp_files(), [])
+
+    def test_add_uses_configured_digest_algorithm(self):
+        original = settings.DIGEST_ALGORITHM
+        settings.DIGEST_ALGORITHM = 'sha256'
+        try:
+            digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        finally:
+            settings.DIGEST_ALGORITHM = original
+        self.assertEqual(digest, digest_from_value('some-data', 'sha256'))
+        self.assertTrue(self.blob_service.has(digest))
+        self.assertEqual(self.blob_service.get_data(digest).read(),
+                         'some-data')
+        self.assertEqual(
+            os.path.basename(os.path.dirname(os.path.dirname(
+                self.blob_service._get_blob_path(digest)))),
+            digest.split('-')[1][0:2])
+
+    def test_add_checks_given_digest_with_its_own_algorithm(self):
+        digest = md5_from_stream(cStringIO.StringIO('some-data'))
+        original = settings.DIGEST_ALGORITHM
+        settings.DIGEST_ALGORITHM = 'sha256tree'
+        try:
+            self.assertEqual(self.blob_service.add(
+                cStringIO.StringIO('some-data'), digest=digest), digest)
+        finally:
+            settings.DIGEST_ALGORITHM = original
+        self.assertTrue(self.blob_service.has(digest))
+
+    def test_add_existing_blob_keeps_stored_blob(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        self.assertEqual(
+            self.blob_service.add(cStringIO.StringIO('some-data')), digest)
+        self.assertEqual(self.blob_service.get_data(digest).read(),
+                         'some-data')
+        self.assertEqual(self._temp_files(), [])
+
+    def test_retrieve_meta_many_returns_meta_of_found_blobs(self):
+        first = self.blob_service.add(cStringIO.StringIO('first'),
+                                      meta={'a': 1})
+        second = self.blob_service.add(cStringIO.StringIO('second'))
+        metas = self.blob_service.retrieve_meta_many(
+            [first, second, 'nothing', '../outside'])
+        self.assertEqual(metas, {first: {'a': 1}, second: {}})
+
+    def test_update_meta_replaces_meta(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'),
+                                       meta={'a': 1})
+        self.blob_service.update_meta(digest, {'b': 2})
+        self.assertEqual(self.blob_service.retrieve_meta(digest), {'b': 2})
+        self.blob_service.update_meta(digest, None)
+        self.assertEqual(self.blob_service.retrieve_meta(digest), {})
+
+    def test_update_meta_raises_if_blob_not_found(self):
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.update_meta('nothing', {'a': 1})
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.update_meta(digest, 'meta')
+
+    def test_meta_is_shared_by_service_instances(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'),
+                                       meta={'a': 1})
+        blob_service = get_service('BlobService', shared=False)
+        self.assertEqual(blob_service.retrieve_meta(digest), {'a': 1})
+
+    def test_has_many_returns_which_blobs_are_stored(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        self.assertEqual(self.blob_service.has_many([digest, 'nothing']),
+                         {digest: True, 'nothing': False})
+
+    def test_has_finds_blob_added_by_other_service_instance(self):
+        blob_service = get_service('BlobService', shared=False)
+        digest = blob_service.add(cStringIO.StringIO('other'))
+        self.assertTrue(self.blob_service.has(digest))
+
+    def test_new_service_loads_index_from_catalog(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        blob_service = get_service('BlobService', shared=False)
+        if blob_service.index is None:
+            self.skipTest('blob index is disabled')
+        self.assertIn(digest, blob_service.index)
+
+    def test_delete_removes_blob(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'),
+                                       meta={'a': 1})
+        self.blob_service.delete(digest)
+        self.assertFalse(self.blob_service.has(digest))
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.retrieve_meta(digest)
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.delete(digest)
+
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        self.assertEqual(self.blob_service.retrieve_meta(digest), {})
+
+    def _age(self, digest, seconds=3600):
+        path = self.blob_service._get_blob_path(digest)
+        then = os.path.getmtime(path) - seconds
+        os.utime(path, (then, then))
+
+    def test_collect_garbage_dry_run_reports_unreferenced_blobs(self):
+        kept = self.blob_service.add(cStringIO.StringIO('kept'))
+        garbage = self.blob_service.add(cStringIO.StringIO('garbage'))
+        recent = self.blob_service.add(cStringIO.StringIO('recent'))
+        self._age(kept)
+        self._age(garbage)
+
+        ranges = []
+
+        def retrieve_referenced(first, last):
+            ranges.append((first, last))
+            return [kept]
+
+        report = self.blob_service.collect_garbage(
+            retrieve_referenced, grace_period=60, pause=0)
+        self.assertEqual(report['scanned'], 3)
+        self.assertEqual(report['unreferenced'], 1)
+        self.assertEqual(report['recent'], 1)
+        self.assertEqual(report['reclaimable_bytes'], len('garbage'))
+        self.assertEqual(report['removed'], 0)
+        self.assertTrue(report['complete'])
+        self.assertEqual(ranges, [(min(kept, garbage, recent),
+                                   max(kept, garbage, recent))])
+        self.assertTrue(self.blob_service.has(garbage))
+
+    def test_collect_garbage_removes_unreferenced_blobs(self):
+        kept = self.blob_service.add(cStringIO.StringIO('kept'))
+        garbage = self.blob_service.add(cStringIO.StringIO('garbage'),
+                                        meta={'a': 1})
+        self._age(kept)
+        self._age(garbage)
+
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [kept], dry_run=False, grace_period=60,
+            pause=0)
+        self.assertEqual(report['removed'], 1)
+        self.assertEqual(report['removed_bytes'], len('garbage'))
+        self.assertTrue(self.blob_service.has(kept))
+        self.assertFalse(self.blob_service.has(garbage))
+        self.assertEqual(self.blob_service.retrieve_meta_many([garbage]), {})
+
+    def test_collect_garbage_keeps_blob_added_again(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        self._age(digest)
+        self.blob_service.add(cStringIO.StringIO('some-data'))
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [], dry_run=False, grace_period=60, pause=0)
+        self.assertEqual(report['recent'], 1)
+        self.assertTrue(self.blob_service.has(digest))
+
+    def test_collect_garbage_keeps_touched_blob(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        self._age(digest)
+        self.assertTrue(self.blob_service.touch(digest))
+        self.assertEqual(self.blob_service.touch_many([digest, 'nothing']),
+                         {digest: True, 'nothing': False})
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [], dry_run=False, grace_period=60, pause=0)
+        self.assertEqual(report['recent'], 1)
+        self.assertTrue(self.blob_service.has(digest))
+
+    def test_collect_garbage_keeps_blob_added_again_during_run(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        self._age(digest)
+        calls = []
+
+        def retrieve_referenced(first, last):
+            # The second lookup comes after the blob was found to be old
+            calls.append((first, last))
+            if len(calls) == 2:
+                self.blob_service.add(cStringIO.StringIO('some-data'))
+            return []
+
+        report = self.blob_service.collect_garbage(
+            retrieve_referenced, dry_run=False, grace_period=60, pause=0)
+        self.assertEqual(report['unreferenced'], 1)
+        self.assertEqual(report['removed'], 0)
+        self.assertEqual(self.blob_service.get_data(digest).read(),
+                         'some-data')
+        self.assertEqual(self.blob_service.get_size(digest), 9)
+        self.assertEqual(self._temp_files(), [])
+
+    def test_collect_garbage_continues_in_batches(self):
+        digests = sorted(self.blob_service.add(cStringIO.StringIO(str(i)))
+                         for i in range(5))
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [], grace_period=0, batch_size=2, pause=0,
+            time_limit=0)
+        self.assertFalse(report['complete'])
+        self.assertEqual(report['scanned'], 2)
+        self.assertEqual(report['last_digest'], digests[1])
+
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [], grace_period=0, batch_size=2, pause=0,
+            after=report['last_digest'])
+        self.assertTrue(report['complete'])
+        self.assertEqual(report['scanned'], 3)
+
+    def test_collect_garbage_removes_stale_temp_files(self):
+        path = os.path.join(self.blob_service.blob_disk_location,
+                            '.tmp-stale')
+        open(path, 'w').close()
+        os.utime(path, (0, 0))
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [], dry_run=False, grace_period=60, pause=0)
+        self.assertEqual(report['stale_temp_files'], 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_collect_garbage_raises_on_invalid_arguments(self):
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.collect_garbage(None)
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.collect_garbage(lambda first, last: [],
+                                              batch_size=0)
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.collect_garbage(lambda first, last: [],
+                                              grace_period=-1)
+
+    def _add_with_compression(self, data):
+        level = settings.BLOB_COMPRESSION_LEVEL
+        settings.BLOB_COMPRESSION_LEVEL = 6
+        try:
+            return self.blob_service.add(cStringIO.StringIO(data))
+        finally:
+            settings.BLOB_COMPRESSION_LEVEL = level
+
+    def test_add_compresses_compressible_blob(self):
+        data = '<tag>value</tag>' * 10000
+        digest = self._add_with_compression(data)
+        self.assertEqual(digest, md5_from_stream(cStringIO.StringIO(data)))
+        self.assertFalse(os.path.exists(
+            self.blob_service._get_blob_path(digest)))
+        self.assertLess(
+            os.path.getsize(self.blob_service._get_blob_path(digest, ZLIB)),
+            len(data) / 10)
+
+        self.assertEqual(self.blob_service.get_data(digest).read(), data)
+        self.assertEqual(self.blob_service.get_size(digest), len(data))
+        self.assertEqual(self.blob_service.map_data(digest), data)
+        self.assertEqual(''.join(self.blob_service.iter_data(
+            digest, 100000, 50, chunk_size=7)), data[100000:100050])
+        # The file of a compressed blob is not its data
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.retrieve_uri(digest)
+
+    def test_add_stores_incompressible_blob_as_is(self):
+        for data in [os.urandom(2**16), '\xff\xd8\xff' + 'a' * 2**16]:
+            digest = self._add_with_compression(data)
+            self.assertEqual(
+                os.path.getsize(self.blob_service._get_blob_path(digest)),
+                len(data))
+            self.assertEqual(self.blob_service.get_data(digest).read(), data)
+
+    def test_compressed_blob_seeks_backwards(self):
+        data = ''.join(str(i) for i in range(100000))
+        digest = self._add_with_compression(data)
+        with self.blob_service.open_data(digest) as f:
+            f.seek(1000)
+            self.assertEqual(f.read(10), data[1000:1010])
+            f.seek(10)
+            self.assertEqual(f.read(10), data[10:20])
+            self.assertEqual(f.tell(), 20)
+            self.assertEqual(f.read(), data[20:])
+
+    def test_compressed_blob_is_read_without_catalog_row(self):
+        data = '<tag>value</tag>' * 10000
+        digest = self._add_with_compression(data)
+        # As if the process stopped before the catalog row was written
+        self.blob_service.catalog.delete(digest)
+
+        self.assertEqual(self.blob_service.get_data(digest).read(), data)
+        self.assertEqual(self.blob_service.get_size(digest), len(data))
+        self.assertEqual(self.blob_service.migrate_meta_files(), 1)
+        self.assertEqual(self.blob_service.catalog.get_size(digest),
+                         len(data))
+        self.assertEqual(self.blob_service.catalog.get_encoding(digest),
+                         ZLIB)
+
+        self.blob_service.catalog.delete(digest)
+        self.blob_service.update_meta(digest, {'a': 1})
+        self.assertEqual(self.blob_service.catalog.get_size(digest),
+                         len(data))
+        self.assertEqual(self.blob_service.get_data(digest).read(), data)
+
+    def test_collect_garbage_removes_compressed_blobs(self):
+        digest = self._add_with_compression('<tag>value</tag>' * 10000)
+        path = self.blob_service._get_blob_path(digest, ZLIB)
+        os.utime(path, (0, 0))
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [], dry_run=False, grace_period=60, pause=0)
+        self.assertEqual(report['removed'], 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(self.blob_service.has(digest))
+
+    def test_migrate_compressed_names_renames_blobs(self):
+        data = '<tag>value</tag>' * 10000
+        digest = self._add_with_compression(data)
+        # Stored compressed under the bare digest, as earlier versions did
+        os.rename(self.blob_service._get_blob_path(digest, ZLIB),
+                  self.blob_service._get_blob_path(digest))
+
+        self.assertEqual(self.blob_service.migrate_compressed_names(), 1)
+        self.assertEqual(self.blob_service.migrate_compressed_names(), 0)
+        self.assertEqual(self.blob_service.get_data(digest).read(), data)
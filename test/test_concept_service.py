@@ -327,6 +327,27 @@ class TestConceptService(ObjectCubeTestCase):
             offset += max_fetch
         self.assertEquals(expected_id_set, all_retrieved_set)
 
+    def test_concept_retrieve_after_id_pages_in_id_order(self):
+        expected_ids = sorted(self._tags_to_id_set(
+            self._add_test_concepts(range(23))))
+
+        retrieved_ids = []
+        after_id = 0L
+        while True:
+            concepts = self.concept_service.retrieve(limit=10L,
+                                                     after_id=after_id)
+            if not concepts:
+                break
+            retrieved_ids.extend(c.id for c in concepts)
+            after_id = concepts[-1].id
+        self.assertEquals(expected_ids, retrieved_ids)
+
+    def test_concept_retrieve_raises_on_invalid_after_id(self):
+        with self.assertRaises(ObjectCubeException):
+            self.concept_service.retrieve(after_id=None)
+        with self.assertRaises(ObjectCubeException):
+            self.concept_service.retrieve_by_regex(title=u'C', after_id=1)
+
     def test_concept_retrieve_or_create_adds_concept_if_not_data_store(self):
         concept_test_title = u'test-concept'
         concept_test_description = u'hi mom'
@@ -0,0 +1,112 @@
+from base import ObjectCubeTestCase
+from objectcube.data_objects import Concept, CubeAxis, DimensionNode
+from objectcube.exceptions import ObjectCubeException
+from objectcube.factory import get_service
+
+
+class TestCubeService(ObjectCubeTestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestCubeService, self).__init__(*args, **kwargs)
+        self.cube_service = get_service('CubeService')
+        self.concept_service = get_service('ConceptService')
+        self.dimension_service = get_service('DimensionService')
+
+    def _create_concept(self, title):
+        return self.concept_service.add(Concept(title=title,
+                                                description=u'D'))
+
+    def _node(self, root, tag, *children):
+        return DimensionNode(root_tag_id=root.id, node_tag_id=tag.id,
+                             child_nodes=list(children))
+
+    def _cells(self, cells):
+        return [(cell.tag_ids, cell.count, cell.object_ids)
+                for cell in cells]
+
+    def test_counts_cells_of_two_concepts(self):
+        colors = self._create_concept(u'Color')
+        shapes = self._create_concept(u'Shape')
+        red, blue = self._create_tags([u'Red', u'Blue'], colors.id)
+        round_, square = self._create_tags([u'Round', u'Square'], shapes.id)
+        o = self._create_objects(4)
+        self._tag(o[0], red, round_)
+        self._tag(o[1], red, round_)
+        self._tag(o[2], red, square)
+        self._tag(o[3], blue)
+
+        cells = self.cube_service.retrieve_cells(
+            [CubeAxis(concept_id=colors.id), CubeAxis(concept_id=shapes.id)])
+        self.assertEqual(self._cells(cells), [
+            ([red.id, round_.id], 2L, [o[0].id, o[1].id]),
+            ([red.id, square.id], 1L, [o[2].id]),
+        ])
+
+    def test_samples_lowest_object_ids(self):
+        tag, = self._create_tags([u'T'])
+        objects = self._create_objects(5)
+        for object_ in reversed(objects):
+            self._tag(object_, tag)
+
+        cells = self.cube_service.retrieve_cells(
+            [CubeAxis(tag_ids=[tag.id])], sample_size=2L)
+        self.assertEqual(self._cells(cells),
+                         [([tag.id], 5L, [objects[0].id, objects[1].id])])
+
+        cells = self.cube_service.retrieve_cells(
+            [CubeAxis(tag_ids=[tag.id])], sample_size=0L)
+        self.assertEqual(self._cells(cells), [([tag.id], 5L, [])])
+
+    def test_filters_by_tags(self):
+        a, b, keep = self._create_tags([u'A', u'B', u'Keep'])
+        o = self._create_objects(3)
+        self._tag(o[0], a, b, keep)
+        self._tag(o[1], a, b)
+        self._tag(o[2], a, keep)
+
+        cells = self.cube_service.retrieve_cells(
+            [CubeAxis(tag_ids=[a.id]), CubeAxis(tag_ids=[b.id])],
+            filter_tag_ids=[keep.id])
+        self.assertEqual(self._cells(cells),
+                         [([a.id, b.id], 1L, [o[0].id])])
+
+    def test_dimension_level_counts_descendants_once(self):
+        people, friends, family, jack, jill, mom, other = self._create_tags(
+            [u'People', u'Friends', u'Family', u'Jack', u'Jill', u'Mom',
+             u'Other'])
+        self.dimension_service.add(self._node(
+            people, people,
+            self._node(people, friends, self._node(people, jack),
+                       self._node(people, jill)),
+            self._node(people, family, self._node(people, mom))))
+        o = self._create_objects(3)
+        self._tag(o[0], jack, jill)
+        self._tag(o[1], friends, mom)
+        self._tag(o[2], other)
+
+        cells = self.cube_service.retrieve_cells(
+            [CubeAxis(root_tag_id=people.id, level=1L)])
+        self.assertEqual(self._cells(cells), sorted([
+            ([friends.id], 2L, [o[0].id, o[1].id]),
+            ([family.id], 1L, [o[1].id]),
+        ]))
+
+        cells = self.cube_service.retrieve_cells(
+            [CubeAxis(root_tag_id=people.id, level=0L)])
+        self.assertEqual(self._cells(cells),
+                         [([people.id], 2L, [o[0].id, o[1].id])])
+
+    def test_raises_on_invalid_axes(self):
+        for axes in [[], None, [CubeAxis()] * 4, [CubeAxis()],
+                     [CubeAxis(concept_id=1L, tag_ids=[1L])],
+                     [CubeAxis(tag_ids=[])],
+                     [CubeAxis(root_tag_id=1L)],
+                     [CubeAxis(concept_id=1L, level=1L)]]:
+            with self.assertRaises(ObjectCubeException):
+                self.cube_service.retrieve_cells(axes)
+
+    def test_raises_on_invalid_filter_or_sample_size(self):
+        axes = [CubeAxis(concept_id=1L)]
+        with self.assertRaises(ObjectCubeException):
+            self.cube_service.retrieve_cells(axes, filter_tag_ids=[1])
+        with self.assertRaises(ObjectCubeException):
+            self.cube_service.retrieve_cells(axes, sample_size=3)
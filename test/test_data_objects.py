@@ -0,0 +1,60 @@
+import unittest
+
+from objectcube.data_objects import Tag, Tagging, DimensionNode
+from objectcube.exceptions import ObjectCubeException
+
+
+class TestDataObjects(unittest.TestCase):
+
+    def _create_tag(self, **kwargs):
+        data = {'value': u'value', 'description': u'description',
+                'mutable': False, 'type': 1L}
+        data.update(kwargs)
+        return Tag(**data)
+
+    def test_init_raises_on_invalid_type(self):
+        with self.assertRaises(ObjectCubeException):
+            self._create_tag(value='value')
+        with self.assertRaises(ObjectCubeException):
+            self._create_tag(value=u'')
+        with self.assertRaises(ObjectCubeException):
+            Tagging(tag_id=1L)
+
+    def test_set_raises_on_invalid_type(self):
+        tag = self._create_tag()
+        with self.assertRaises(ObjectCubeException):
+            tag.id = 1
+        with self.assertRaises(ObjectCubeException):
+            tag.value = u''
+
+    def test_get_raises_on_unknown_field(self):
+        with self.assertRaises(ObjectCubeException):
+            self._create_tag().unknown
+
+    def test_objects_have_no_instance_dict(self):
+        self.assertEquals(Tag.__dictoffset__, 0)
+        tag = self._create_tag()
+        tag.other = 1
+        self.assertEquals(tag.other, 1)
+        self.assertNotIn('other', tag.to_dict())
+
+    def test_from_row_skips_type_checks(self):
+        tag = Tag.from_row({'id': 1L, 'value': u'', 'extra': 1})
+        self.assertEquals(tag.id, 1L)
+        self.assertEquals(tag.value, u'')
+        self.assertIsNone(tag.type)
+        with self.assertRaises(ObjectCubeException):
+            tag.extra
+
+    def test_row_builder_maps_columns_to_fields(self):
+        build = Tagging.row_builder(['object_id', 'id', 'tag_id', 'other'])
+        tagging = build((3L, 1L, 2L, u'other'))
+        self.assertEquals(tagging, Tagging(id=1L, tag_id=2L, object_id=3L))
+        self.assertIsNone(tagging.plugin_set_id)
+
+    def test_row_builder_builds_independent_objects(self):
+        build = DimensionNode.row_builder(['root_tag_id', 'node_tag_id'])
+        first, second = build((1L, 1L)), build((1L, 2L))
+        self.assertEquals(first.node_tag_id, 1L)
+        self.assertEquals(second.node_tag_id, 2L)
+        self.assertIsNone(second.child_nodes)
@@ -0,0 +1,115 @@
+import threading
+import time
+import unittest
+
+from psycopg2.pool import PoolError
+
+from objectcube.db import ConnectionPool
+
+
+class FakeCursor(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql):
+        pass
+
+
+class FakeConnection(object):
+    def __init__(self, connection_string):
+        self.connection_string = connection_string
+        self.closed = 0
+
+    def cursor(self):
+        return FakeCursor()
+
+    def get_transaction_status(self):
+        return 0
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def _create_pool(self, min_connections=1, max_connections=2, **kwargs):
+        kwargs.setdefault('connection_factory', FakeConnection)
+        return ConnectionPool(min_connections, max_connections, 'dbname=x',
+                              **kwargs)
+
+    def test_pool_opens_min_connections(self):
+        pool = self._create_pool(min_connections=2, max_connections=3)
+        stats = pool.stats()
+        self.assertEquals(stats['idle'], 2)
+        self.assertEquals(stats['in_use'], 0)
+
+    def test_pool_raises_on_invalid_size(self):
+        with self.assertRaises(PoolError):
+            self._create_pool(min_connections=3, max_connections=2)
+        with self.assertRaises(PoolError):
+            self._create_pool(min_connections=0, max_connections=0)
+
+    def test_pool_reuses_returned_connection(self):
+        pool = self._create_pool()
+        connection = pool.getconn()
+        pool.putconn(connection)
+        self.assertIs(pool.getconn(), connection)
+
+    def test_pool_times_out_when_exhausted(self):
+        pool = self._create_pool(max_connections=1)
+        pool.getconn()
+        with self.assertRaises(PoolError):
+            pool.getconn(timeout=0.05)
+        self.assertEquals(pool.stats()['timeouts'], 1)
+
+    def test_pool_waits_for_returned_connection(self):
+        pool = self._create_pool(max_connections=1)
+        connection = pool.getconn()
+
+        def release():
+            time.sleep(0.05)
+            pool.putconn(connection)
+
+        thread = threading.Thread(target=release)
+        thread.start()
+        self.assertIs(pool.getconn(timeout=5), connection)
+        thread.join()
+        self.assertGreater(pool.stats()['checkout_time_max'], 0)
+
+    def test_pool_replaces_closed_connection(self):
+        pool = self._create_pool()
+        connection = pool.getconn()
+        pool.putconn(connection)
+        connection.closed = 1
+        self.assertIsNot(pool.getconn(), connection)
+
+    def test_pool_recycles_connections_past_max_lifetime(self):
+        pool = self._create_pool(max_lifetime=0.01)
+        connection = pool.getconn()
+        time.sleep(0.02)
+        pool.putconn(connection)
+        self.assertTrue(connection.closed)
+        self.assertEquals(pool.stats()['recycled'], 1)
+
+    def test_pool_stats_count_in_use(self):
+        pool = self._create_pool(max_connections=3)
+        connections = [pool.getconn(), pool.getconn()]
+        stats = pool.stats()
+        self.assertEquals(stats['in_use'], 2)
+        self.assertEquals(stats['checkouts'], 2)
+        for connection in connections:
+            pool.putconn(connection)
+        self.assertEquals(pool.stats()['in_use'], 0)
+
+    def test_closeall_closes_idle_connections(self):
+        pool = self._create_pool(min_connections=2, max_connections=2)
+        pool.closeall()
+        self.assertEquals(pool.stats()['idle'], 0)
+        with self.assertRaises(PoolError):
+            pool.getconn()
@@ -1,15 +1,17 @@
-from base import TestDatabaseAwareTest
+from base import ObjectCubeTestCase
+from objectcube.contexts import UnitOfWork
 from objectcube.factory import get_service
 from objectcube.exceptions import ObjectCubeException
-from objectcube.data_objects import Tag, DimensionNode, Concept
+from objectcube.data_objects import Tag, DimensionNode, Concept, Plugin, \
+    Tagging
 
 
-class TestDimensionService(TestDatabaseAwareTest):
+class TestDimensionService(ObjectCubeTestCase):
     def __init__(self, *args, **kwargs):
         super(TestDimensionService, self).__init__(*args, **kwargs)
         self.dimension_service = get_service('DimensionService')
-        self.tag_service = get_service('TagService')
         self.concept_service = get_service('ConceptService')
+        self.plugin_service = get_service('PluginService')
 
     def _create_test_concept(self, title=u'', description=u''):
         """
@@ -496,6 +498,24 @@ class TestDimensionService(TestDatabaseAwareTest):
         after_node = self.dimension_service.retrieve_dimension(roots[0])
         self.assertTrue(self._test_dimension_equal(before_node, after_node))
 
+    def test_dimension_replace_or_create_illegal_tree_in_unit_of_work(self):
+        self._create_test_concepts()
+        self._setup_large_dimension()
+        roots = self.dimension_service.retrieve_roots()
+        before_node = self.dimension_service.retrieve_dimension(roots[0])
+
+        # The failed replacement is undone without failing the outer unit
+        with UnitOfWork():
+            root_node = self.dimension_service.retrieve_dimension(roots[0])
+            root_node.child_nodes[0].node_tag_id += 200L
+            with self.assertRaises(ObjectCubeException):
+                self.dimension_service.update_or_create(root_node)
+            self._setup_small_dimension()
+
+        self.assertEquals(self.dimension_service.count(), 2)
+        after_node = self.dimension_service.retrieve_dimension(roots[0])
+        self.assertTrue(self._test_dimension_equal(before_node, after_node))
+
     def test_dimension_replace_or_create_raises_with_illegal_roots(self):
         self._create_test_concepts()
         self._setup_small_dimension()
@@ -513,3 +533,89 @@ class TestDimensionService(TestDatabaseAwareTest):
             self.dimension_service.update_or_create(True)
         with self.assertRaises(ObjectCubeException):
             self.dimension_service.update_or_create(1)
+
+    # ==== retrieve_dimension_with_counts()
+
+    def _counts(self, root):
+        # {tag id: (direct count, subtree count)} of every node
+        counts = {}
+        nodes = [self.dimension_service.retrieve_dimension_with_counts(root)]
+        while nodes:
+            node = nodes.pop()
+            counts[node.node_tag_id] = (node.direct_count, node.subtree_count)
+            nodes.extend(node.child_nodes)
+        return counts
+
+    def test_dimension_counts_objects_tagged_before_it_is_added(self):
+        self._create_test_concepts()
+        tags = self._create_test_tags([u'People', u'Jack', u'Jill'],
+                                      concept_id=1L)
+        objects = self._create_objects(2)
+        self._tag(objects[0], tags[1])
+        self._tag(objects[0], tags[2])
+        self._tag(objects[1], tags[2])
+        self._tag(objects[1], tags[2])
+
+        root = self.dimension_service.add(DimensionNode(
+            root_tag_id=tags[0].id, node_tag_id=tags[0].id,
+            child_nodes=[DimensionNode(root_tag_id=tags[0].id,
+                                       node_tag_id=tag.id, child_nodes=[])
+                         for tag in tags[1:]]))
+        self.assertEquals(self._counts(root), {tags[0].id: (0, 2),
+                                               tags[1].id: (1, 1),
+                                               tags[2].id: (2, 2)})
+
+    def test_dimension_counts_follow_taggings(self):
+        self._create_test_concepts()
+        root = self._setup_large_dimension()
+        people, classmates, ru, jack, jill = \
+            [self.tag_service.retrieve_by_id(node.node_tag_id)
+             for node in [root, root.child_nodes[0],
+                          root.child_nodes[0].child_nodes[0]]
+             + root.child_nodes[0].child_nodes[0].child_nodes]
+        objects = self._create_objects(3)
+        self.assertEquals(self._counts(root)[people.id], (0, 0))
+
+        jack_tagging, = self._tag(objects[0], jack)
+        self._tag(objects[0], jill)
+        self.tagging_service.add_many([
+            Tagging(tag_id=ru.id, object_id=objects[1].id),
+            Tagging(tag_id=ru.id, object_id=objects[1].id)],
+            returning=False)
+        counts = self._counts(root)
+        self.assertEquals(counts[jack.id], (1, 1))
+        self.assertEquals(counts[ru.id], (1, 2))
+        self.assertEquals(counts[classmates.id], (0, 2))
+        self.assertEquals(counts[people.id], (0, 2))
+
+        self.tagging_service.delete(jack_tagging)
+        counts = self._counts(root)
+        self.assertEquals(counts[jack.id], (0, 0))
+        self.assertEquals(counts[ru.id], (1, 2))
+
+        # Resolving to one tagging of a set removes the others
+        plugin = self.plugin_service.add(Plugin(name=u'P', module=u'M'))
+        keep, = self._tag(objects[2], jack, plugin_id=plugin.id,
+                          plugin_set_id=1L)
+        self._tag(objects[2], people, plugin_id=plugin.id, plugin_set_id=1L)
+        self.assertEquals(self._counts(root)[people.id], (1, 3))
+        self.tagging_service.resolve(keep)
+        counts = self._counts(root)
+        self.assertEquals(counts[people.id], (0, 3))
+        self.assertEquals(counts[jack.id], (1, 1))
+
+        self.tagging_service.delete_by_set_id(1L)
+        self.assertEquals(self._counts(root)[people.id], (0, 2))
+
+    def test_dimension_counts_are_recounted_when_replaced(self):
+        self._create_test_concepts()
+        root = self._setup_small_dimension()
+        ru, bill = root.node_tag_id, root.child_nodes[0].node_tag_id
+        objects = self._create_objects(1)
+        self._tag(objects[0], self.tag_service.retrieve_by_id(bill))
+        self.assertEquals(self._counts(root), {ru: (0, 1), bill: (1, 1)})
+
+        # Bill moves to a dimension of his own
+        root.child_nodes = []
+        root = self.dimension_service.update_or_create(root)
+        self.assertEquals(self._counts(root), {ru: (0, 0)})
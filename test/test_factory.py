@@ -1,5 +1,6 @@
 import unittest
-from objectcube.factory import load_class, get_service
+from objectcube.factory import load_class, get_service, warm_up, \
+    service_instances
 from objectcube.exceptions import ObjectCubeException
 from objectcube.services.base.service import Service
 from objectcube.settings import FACTORY_CONFIG
@@ -54,4 +55,34 @@ class TestFactory(unittest.TestCase):
         FACTORY_CONFIG['TestService'] = '{0}.{1}'\
             .format(self.__module__, TestServiceClass.__name__)
         s = get_service('TestService')
-        self.assertEqual(type(s), TestServiceClass)
\ No newline at end of file
+        self.assertEqual(type(s), TestServiceClass)
+
+    def test_get_service_returns_shared_instance(self):
+        FACTORY_CONFIG['TestService'] = '{0}.{1}'\
+            .format(self.__module__, TestServiceClass.__name__)
+        self.assertIs(get_service('TestService'), get_service('TestService'))
+
+    def test_get_service_returns_new_instance_when_not_shared(self):
+        FACTORY_CONFIG['TestService'] = '{0}.{1}'\
+            .format(self.__module__, TestServiceClass.__name__)
+        s = get_service('TestService', shared=False)
+        self.assertEqual(type(s), TestServiceClass)
+        self.assertIsNot(s, get_service('TestService'))
+        self.assertIsNot(s, get_service('TestService', shared=False))
+
+    def test_get_service_follows_changed_configuration(self):
+        FACTORY_CONFIG['TestService'] = '{0}.{1}'\
+            .format(self.__module__, TestServiceClass.__name__)
+        get_service('TestService')
+        FACTORY_CONFIG['TestService'] = '{0}.{1}'.format(self.__module__,
+                                                         TestClass.__name__)
+        with self.assertRaises(ObjectCubeException):
+            get_service('TestService')
+
+    def test_warm_up_creates_shared_instances(self):
+        FACTORY_CONFIG['TestService'] = '{0}.{1}'\
+            .format(self.__module__, TestServiceClass.__name__)
+        warm_up(['TestService'])
+        self.assertIn(TestServiceClass, service_instances)
+        with self.assertRaises(ObjectCubeException):
+            warm_up(['NotRegisteredService'])
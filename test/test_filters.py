@@ -0,0 +1,62 @@
+import unittest
+
+from objectcube.exceptions import ObjectCubeException
+from objectcube.filters import MAX_DEPTH, MAX_TERMS, filter_terms, \
+    parse_filter
+
+
+class TestFilters(unittest.TestCase):
+    def test_parses_terms(self):
+        self.assertEqual(parse_filter(u'beach'), ('value', u'beach'))
+        self.assertEqual(parse_filter(u'id:42'), ('id', 42L))
+        self.assertEqual(parse_filter(u'"summer \\"14\\""'),
+                         ('value', u'summer "14"'))
+        self.assertEqual(parse_filter(u'"and"'), ('value', u'and'))
+
+    def test_and_binds_tighter_than_or(self):
+        self.assertEqual(parse_filter(u'a OR b and c'),
+                         ('or', [('value', u'a'),
+                                 ('and', [('value', u'b'), ('value', u'c')])]))
+        self.assertEqual(parse_filter(u'(a OR b) AND c'),
+                         ('and', [('or', [('value', u'a'), ('value', u'b')]),
+                                  ('value', u'c')]))
+
+    def test_flattens_operations_of_the_same_kind(self):
+        self.assertEqual(
+            parse_filter(u'beach AND "2014" AND NOT (people OR id:42)'),
+            ('and', [('value', u'beach'), ('value', u'2014'),
+                     ('not', ('or', [('value', u'people'), ('id', 42L)]))]))
+        self.assertEqual(parse_filter(u'a AND (b AND c)'),
+                         ('and', [('value', u'a'), ('value', u'b'),
+                                  ('value', u'c')]))
+
+    def test_raises_on_invalid_filters(self):
+        for text in [None, 42, u'', u'  ', u'(a', u'a)', u'a AND',
+                     u'NOT', u'a b', u'()', u'"a']:
+            with self.assertRaises(ObjectCubeException):
+                parse_filter(text)
+
+    def test_raises_on_too_many_terms(self):
+        parse_filter(u' OR '.join([u'a'] * MAX_TERMS))
+        with self.assertRaises(ObjectCubeException):
+            parse_filter(u' OR '.join([u'a'] * (MAX_TERMS + 1)))
+
+    def test_raises_on_too_deep_nesting(self):
+        self.assertEqual(
+            parse_filter(u'(' * MAX_DEPTH + u'a' + u')' * MAX_DEPTH),
+            ('value', u'a'))
+        for depth in [MAX_DEPTH + 1, 400]:
+            with self.assertRaises(ObjectCubeException):
+                parse_filter(u'(' * depth + u'a' + u')' * depth)
+
+    def test_cancels_out_repeated_nots(self):
+        self.assertEqual(parse_filter(u'NOT ' * 1000 + u'a'), ('value', u'a'))
+        self.assertEqual(parse_filter(u'NOT ' * 1001 + u'a'),
+                         ('not', ('value', u'a')))
+        self.assertEqual(parse_filter(u'NOT NOT NOT (a)'),
+                         ('not', ('value', u'a')))
+
+    def test_collects_terms(self):
+        self.assertEqual(
+            filter_terms(parse_filter(u'a AND NOT (b OR id:1) OR a')),
+            set([('value', u'a'), ('value', u'b'), ('id', 1L)]))
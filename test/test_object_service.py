@@ -1,7 +1,8 @@
 from objectcube.factory import get_service
 from objectcube.exceptions import ObjectCubeException
 from objectcube.utils import md5_from_value
-from objectcube.data_objects import Object, Tag, Tagging
+from objectcube.db import get_pool_stats
+from objectcube.data_objects import Object, Tag, Tagging, DimensionNode
 from base import ObjectCubeTestCase
 from types import IntType, LongType
 
@@ -202,6 +203,77 @@ class TestObjectService(ObjectCubeTestCase):
             offset += max_fetch
         self.assertEquals(expected_id_set, all_retrieved_set)
 
+    def test_object_retrieve_after_id_pages_in_id_order(self):
+        expected_ids = sorted(self._objects_to_id_set(
+            self._create_objects(25)))
+
+        retrieved_ids = []
+        after_id = 0L
+        while True:
+            objects = self.object_service.retrieve(limit=10L,
+                                                   after_id=after_id)
+            if not objects:
+                break
+            retrieved_ids.extend(o.id for o in objects)
+            after_id = objects[-1].id
+        self.assertEquals(expected_ids, retrieved_ids)
+
+    def test_object_retrieve_raises_on_invalid_after_id(self):
+        with self.assertRaises(ObjectCubeException):
+            self.object_service.retrieve(after_id=None)
+        with self.assertRaises(ObjectCubeException):
+            self.object_service.retrieve(after_id='1')
+        with self.assertRaises(ObjectCubeException):
+            self.object_service.retrieve(after_id=1)
+
+    def test_object_retrieve_by_tag_id_after_id(self):
+        tag_service = get_service('TagService')
+        tag = tag_service.add(self._create_test_tag(value=u'test-tag-1'))
+        objects = self._create_objects(num_objects=5)
+        for object_ in objects:
+            self.tagging_service.add(Tagging(tag_id=tag.id,
+                                             object_id=object_.id))
+
+        first = self.object_service.retrieve_by_tag_id(tag.id, limit=2L)
+        rest = self.object_service.retrieve_by_tag_id(
+            tag.id, after_id=first[-1].id)
+        self.assertEquals([o.id for o in objects],
+                          [o.id for o in first + rest])
+
+    def test_object_iter_all_yields_all_objects_in_id_order(self):
+        objects = self._create_objects(num_objects=25)
+        self.assertEquals([o.id for o in objects],
+                          [o.id for o in self.object_service.iter_all()])
+
+    def test_object_iter_all_releases_connection_when_closed_early(self):
+        self._create_objects(num_objects=5)
+        in_use = get_pool_stats()['in_use']
+
+        objects = self.object_service.iter_all()
+        next(objects)
+        self.assertEquals(get_pool_stats()['in_use'], in_use + 1)
+        objects.close()
+        self.assertEquals(get_pool_stats()['in_use'], in_use)
+
+    def test_object_iter_by_tag_id(self):
+        tag_service = get_service('TagService')
+        tag = tag_service.add(self._create_test_tag(value=u'test-tag-1'))
+        objects = self._create_objects(num_objects=5)
+        for object_ in objects[1:]:
+            self.tagging_service.add(Tagging(tag_id=tag.id,
+                                             object_id=object_.id))
+
+        self.assertEquals(
+            [o.id for o in objects[2:]],
+            [o.id for o in self.object_service.iter_by_tag_id(
+                tag.id, after_id=objects[1].id)])
+
+    def test_object_iter_raises_on_invalid_arguments(self):
+        with self.assertRaises(ObjectCubeException):
+            self.object_service.iter_all(after_id=1)
+        with self.assertRaises(ObjectCubeException):
+            self.object_service.iter_by_tag_id(None)
+
     def test_object_fetch_object_outside_offset_return_empty_list(self):
         number_of_object = 20L
         self._create_objects(number_of_object)
@@ -649,3 +721,136 @@ class TestObjectService(ObjectCubeTestCase):
 
         o3 = self.object_service.retrieve_by_id(o1.id)
         self.assertEquals(o3.name, after_change_title)
+
+    def _create_test_dimension(self):
+        # Europe > (Iceland > Reykjavik), France; Asia is another root
+        tag_service = get_service('TagService')
+        tags = [tag_service.add(self._create_test_tag(value=value))
+                for value in [u'Europe', u'Iceland', u'Reykjavik',
+                              u'France', u'Asia']]
+        europe, iceland, reykjavik, france, asia = tags
+
+        def node(tag, *children):
+            return DimensionNode(root_tag_id=europe.id, node_tag_id=tag.id,
+                                 child_nodes=list(children))
+        get_service('DimensionService').add(
+            node(europe, node(iceland, node(reykjavik)), node(france)))
+        return tags
+
+    def test_object_retrieve_by_dimension_node_includes_subtree(self):
+        europe, iceland, reykjavik, france, asia = \
+            self._create_test_dimension()
+        objects = self._create_objects(num_objects=5)
+        for object_, tags in zip(objects, [[reykjavik], [iceland, reykjavik],
+                                           [france], [asia], []]):
+            for tag in tags:
+                self.tagging_service.add(Tagging(tag_id=tag.id,
+                                                 object_id=object_.id))
+
+        def ids(node):
+            return [o.id for o in self.object_service
+                    .retrieve_by_dimension_node(europe.id, node.id)]
+        self.assertEquals(ids(europe), [o.id for o in objects[:3]])
+        self.assertEquals(ids(iceland), [o.id for o in objects[:2]])
+        self.assertEquals(ids(reykjavik), [o.id for o in objects[:2]])
+        self.assertEquals(ids(france), [objects[2].id])
+        self.assertEquals(ids(asia), [])
+
+        self.assertEquals(self.object_service.count_by_dimension_node(
+            europe.id, europe.id), 3)
+        self.assertEquals(self.object_service.count_by_dimension_node(
+            europe.id, iceland.id), 2)
+        self.assertEquals(self.object_service.count_by_dimension_node(
+            europe.id, asia.id), 0)
+
+    def test_object_retrieve_by_dimension_node_after_id(self):
+        europe, iceland, reykjavik, france, asia = \
+            self._create_test_dimension()
+        objects = self._create_objects(num_objects=5)
+        for i, object_ in enumerate(objects):
+            for tag in [reykjavik, france][:i % 2 + 1]:
+                self.tagging_service.add(Tagging(tag_id=tag.id,
+                                                 object_id=object_.id))
+
+        first = self.object_service.retrieve_by_dimension_node(
+            europe.id, europe.id, limit=2L)
+        rest = self.object_service.retrieve_by_dimension_node(
+            europe.id, europe.id, after_id=first[-1].id)
+        self.assertEquals([o.id for o in objects],
+                          [o.id for o in first + rest])
+
+    def test_object_retrieve_by_dimension_node_raises_on_invalid_ids(self):
+        for root_tag_id, node_tag_id in [(None, 1L), (1L, None), (1, 1L),
+                                         (1L, '1')]:
+            with self.assertRaises(ObjectCubeException):
+                self.object_service.retrieve_by_dimension_node(
+                    root_tag_id, node_tag_id)
+            with self.assertRaises(ObjectCubeException):
+                self.object_service.count_by_dimension_node(
+                    root_tag_id, node_tag_id)
+        with self.assertRaises(ObjectCubeException):
+            self.object_service.retrieve_by_dimension_node(1L, 1L, limit=1)
+
+    def _create_filter_test_objects(self):
+        tag_service = get_service('TagService')
+        beach, year, people, other_beach = [
+            tag_service.add(self._create_test_tag(value=value))
+            for value in [u'beach', u'2014', u'people', u'beach']]
+        objects = self._create_objects(num_objects=6)
+        for object_, tags in zip(objects, [[beach, year], [beach, people],
+                                           [other_beach, year], [year],
+                                           [people], []]):
+            for tag in tags:
+                self.tagging_service.add(Tagging(tag_id=tag.id,
+                                                 object_id=object_.id))
+        return objects, (beach, year, people, other_beach)
+
+    def test_object_retrieve_by_filter(self):
+        objects, (beach, year, people, other_beach) = \
+            self._create_filter_test_objects()
+
+        def ids(expression):
+            return [objects.index(o) for o in self.object_service
+                    .retrieve_by_filter(expression, limit=100L)]
+        self.assertEquals(ids(u'beach'), [0, 1, 2])
+        self.assertEquals(ids(u'id:{0}'.format(beach.id)), [0, 1])
+        self.assertEquals(ids(u'beach AND "2014" AND NOT people'), [0, 2])
+        self.assertEquals(ids(u'people OR 2014'), [0, 1, 2, 3, 4])
+        self.assertEquals(ids(u'NOT beach'), [3, 4, 5])
+        self.assertEquals(ids(u'NOT (beach OR people) OR id:{0}'
+                              .format(other_beach.id)), [2, 3, 5])
+        self.assertEquals(ids(u'nothing OR beach AND nothing'), [])
+
+    def test_object_count_by_filter(self):
+        self._create_filter_test_objects()
+        self.assertEquals(self.object_service.count_by_filter(
+            u'beach AND 2014'), 2)
+        self.assertEquals(self.object_service.count_by_filter(
+            u'NOT 2014'), 3)
+
+    def test_object_retrieve_by_filter_after_id(self):
+        objects, _ = self._create_filter_test_objects()
+        first = self.object_service.retrieve_by_filter(u'beach OR 2014',
+                                                       limit=2L)
+        rest = self.object_service.retrieve_by_filter(
+            u'beach OR 2014', after_id=first[-1].id)
+        self.assertEquals([o.id for o in objects[:4]],
+                          [o.id for o in first + rest])
+
+    def test_object_retrieve_by_filter_raises_on_invalid_filter(self):
+        for expression in [None, 'beach', u'', u'beach AND', u'(beach']:
+            with self.assertRaises(ObjectCubeException):
+                self.object_service.retrieve_by_filter(expression)
+            with self.assertRaises(ObjectCubeException):
+                self.object_service.count_by_filter(expression)
+
+    def test_retrieve_digests_returns_distinct_digests_in_range(self):
+        for name, digest in ((u'a', u'aa'), (u'b', u'aa'), (u'c', u'bb'),
+                             (u'd', u'cc')):
+            self.object_service.add(Object(name=name, digest=digest))
+        self.assertEquals(self.object_service.retrieve_digests('aa', 'bb'),
+                          [u'aa', u'bb'])
+        self.assertEquals(self.object_service.retrieve_digests('ab', 'ba'),
+                          [])
+        with self.assertRaises(ObjectCubeException):
+            self.object_service.retrieve_digests(None, 'bb')
@@ -0,0 +1,194 @@
+import os
+import threading
+import unittest
+import cStringIO
+from objectcube.exceptions import ObjectCubeException
+from objectcube.utils import md5_from_value
+from objectcube.services.impl.filesystem.pack_blob_service import \
+    PackBlobService
+from objectcube import settings
+
+
+class TestPackBlobService(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestPackBlobService, self).__init__(*args, **kwargs)
+        self.blob_service = PackBlobService()
+
+    def setUp(self):
+        self.blob_service.flush()
+        self.max_size = settings.PACK_BLOB_MAX_SIZE
+        self.segment_size = settings.PACK_SEGMENT_SIZE
+        settings.PACK_BLOB_MAX_SIZE = 16
+        settings.PACK_SEGMENT_SIZE = 64
+
+    def tearDown(self):
+        settings.PACK_BLOB_MAX_SIZE = self.max_size
+        settings.PACK_SEGMENT_SIZE = self.segment_size
+
+    def _segments(self):
+        return sorted(name for name in
+                      os.listdir(self.blob_service.segment_location)
+                      if name.endswith('.pack'))
+
+    def test_add_appends_small_blob_to_segment(self):
+        digest = self.blob_service.add(cStringIO.StringIO('small'),
+                                       meta={'a': 1})
+        self.assertEqual(digest, md5_from_value('small'))
+        self.assertEqual(self._segments(), ['00000001.pack'])
+        self.assertFalse(os.path.exists(
+            self.blob_service._get_blob_path(digest)))
+
+        self.assertTrue(self.blob_service.has(digest))
+        self.assertEqual(self.blob_service.get_data(digest).read(), 'small')
+        self.assertEqual(self.blob_service.get_size(digest), 5)
+        self.assertEqual(self.blob_service.map_data(digest), 'small')
+        self.assertEqual(list(self.blob_service.iter_data(digest, 1, 3)),
+                         ['mal'])
+        self.assertEqual(self.blob_service.retrieve_meta(digest), {'a': 1})
+
+    def test_retrieve_uri_raises_for_packed_blob(self):
+        digest = self.blob_service.add(cStringIO.StringIO('small'))
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.retrieve_uri(digest)
+        large = self.blob_service.add(cStringIO.StringIO('x' * 17))
+        self.assertEqual(self.blob_service.retrieve_uri(large),
+                         'file://' + self.blob_service._get_blob_path(large))
+
+    def test_add_stores_large_blob_in_own_file(self):
+        data = 'x' * 17
+        digest = self.blob_service.add(cStringIO.StringIO(data))
+        self.assertEqual(digest, md5_from_value(data))
+        self.assertTrue(os.path.exists(
+            self.blob_service._get_blob_path(digest)))
+        self.assertEqual(self.blob_service.get_data(digest).read(), data)
+        self.assertEqual(self._segments(), [])
+
+    def test_add_existing_blob_does_not_append_again(self):
+        digest = self.blob_service.add(cStringIO.StringIO('small'))
+        self.blob_service.add(cStringIO.StringIO('small'))
+        self.blob_service.add(cStringIO.StringIO('other'), digest=digest)
+        self.assertEqual(os.path.getsize(os.path.join(
+            self.blob_service.segment_location, '00000001.pack')), 5)
+
+    def test_add_raises_when_digest_does_not_match_data(self):
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.add(cStringIO.StringIO('small'),
+                                  digest=md5_from_value('other'))
+
+    def test_add_starts_new_segment_when_full(self):
+        digests = [self.blob_service.add(cStringIO.StringIO('%016d' % i))
+                   for i in range(5)]
+        self.assertEqual(self._segments(),
+                         ['00000001.pack', '00000002.pack'])
+        for i, digest in enumerate(digests):
+            self.assertEqual(self.blob_service.get_data(digest).read(),
+                             '%016d' % i)
+
+    def test_blobs_are_read_by_new_service_instance(self):
+        digest = self.blob_service.add(cStringIO.StringIO('small'))
+        blob_service = PackBlobService()
+        self.assertEqual(blob_service.get_data(digest).read(), 'small')
+        other = blob_service.add(cStringIO.StringIO('other'))
+        self.assertEqual(self.blob_service.get_data(other).read(), 'other')
+
+    def test_delete_removes_packed_blob(self):
+        digest = self.blob_service.add(cStringIO.StringIO('small'))
+        self.blob_service.delete(digest)
+        self.assertFalse(self.blob_service.has(digest))
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.get_data(digest)
+
+    def test_compact_rewrites_segments_of_removed_blobs(self):
+        digests = [self.blob_service.add(cStringIO.StringIO('%016d' % i))
+                   for i in range(6)]
+        for digest in digests[:3]:
+            self.blob_service.delete(digest)
+
+        report = self.blob_service.compact()
+        self.assertEqual(report, {'segments': 1, 'reclaimed_bytes': 48})
+        self.assertEqual(self._segments(), ['00000002.pack'])
+        for i, digest in enumerate(digests[3:], 3):
+            self.assertEqual(self.blob_service.get_data(digest).read(),
+                             '%016d' % i)
+
+    def test_compact_keeps_blob_appended_before_catalogued(self):
+        # Another writer fills the segment and a compaction runs between
+        # appending a blob and writing its catalog row
+        other = PackBlobService()
+        put_packed_many = self.blob_service.catalog.put_packed_many
+        errors = []
+
+        def fill_and_compact():
+            try:
+                digests = [other.add(cStringIO.StringIO('%016d' % i))
+                           for i in range(4)]
+                for digest in digests[:3]:
+                    other.delete(digest)
+                other.compact()
+            except Exception as ex:
+                errors.append(ex)
+
+        def interleaved_put_packed_many(rows):
+            thread = threading.Thread(target=fill_and_compact)
+            thread.start()
+            thread.join(0.5)
+            put_packed_many(rows)
+            return thread
+
+        threads = []
+        self.blob_service.catalog.put_packed_many = \
+            lambda rows: threads.append(interleaved_put_packed_many(rows))
+        try:
+            digest = self.blob_service.add(cStringIO.StringIO('x' * 16))
+        finally:
+            del self.blob_service.catalog.put_packed_many
+        threads[0].join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.blob_service.get_data(digest).read(),
+                         'x' * 16)
+
+    def test_compact_keeps_segments_of_live_blobs(self):
+        for i in range(5):
+            self.blob_service.add(cStringIO.StringIO('%016d' % i))
+        self.assertEqual(self.blob_service.compact()['segments'], 0)
+        with self.assertRaises(ObjectCubeException):
+            self.blob_service.compact(max_garbage=1)
+
+    def test_collect_garbage_removes_packed_blobs(self):
+        kept = self.blob_service.add(cStringIO.StringIO('kept'))
+        garbage = self.blob_service.add(cStringIO.StringIO('garbage'))
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [kept], dry_run=False, grace_period=0,
+            pause=0)
+        self.assertEqual(report['removed'], 1)
+        self.assertTrue(self.blob_service.has(kept))
+        self.assertFalse(self.blob_service.has(garbage))
+
+    def test_collect_garbage_keeps_touched_packed_blob(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        self.blob_service.catalog._get_connection().execute(
+            'UPDATE BLOBS SET MODIFIED = 0')
+        self.assertTrue(self.blob_service.touch(digest))
+        report = self.blob_service.collect_garbage(
+            lambda first, last: [], dry_run=False, grace_period=60, pause=0)
+        self.assertEqual(report['recent'], 1)
+        self.assertTrue(self.blob_service.has(digest))
+
+    def test_collect_garbage_keeps_packed_blob_added_again_during_run(self):
+        digest = self.blob_service.add(cStringIO.StringIO('some-data'))
+        calls = []
+
+        def retrieve_referenced(first, last):
+            # The second lookup comes after the blob was found to be old
+            calls.append((first, last))
+            if len(calls) == 2:
+                self.blob_service.add(cStringIO.StringIO('some-data'))
+            return []
+
+        report = self.blob_service.collect_garbage(
+            retrieve_referenced, dry_run=False, grace_period=0, pause=0)
+        self.assertEqual(report['unreferenced'], 1)
+        self.assertEqual(report['removed'], 0)
+        self.assertEqual(self.blob_service.get_data(digest).read(),
+                         'some-data')
@@ -0,0 +1,235 @@
+import os
+import shutil
+import tempfile
+
+from base import ObjectCubeTestCase
+from objectcube import settings
+from objectcube.data_objects import CubeAxis, DimensionNode, Plugin, \
+    Tagging
+from objectcube.exceptions import ObjectCubeException
+from objectcube.factory import get_service
+from objectcube.services.impl.postgresql.utils import \
+    execute_sql_fetch_multiple
+
+
+class TestTagIndexService(ObjectCubeTestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestTagIndexService, self).__init__(*args, **kwargs)
+        self.cube_service = get_service('CubeService')
+        self.dimension_service = get_service('DimensionService')
+        self.plugin_service = get_service('PluginService')
+
+    def setUp(self):
+        super(TestTagIndexService, self).setUp()
+        self.feed = settings.TAGGING_CHANGE_FEED
+        self.snapshot = settings.TAG_INDEX_SNAPSHOT
+        self.interval = settings.TAG_INDEX_REFRESH_INTERVAL
+        self.directory = tempfile.mkdtemp()
+        settings.TAGGING_CHANGE_FEED = True
+        settings.TAG_INDEX_SNAPSHOT = os.path.join(self.directory, 'index')
+        settings.TAG_INDEX_REFRESH_INTERVAL = 0
+        # Each test starts from an index of its own
+        self.tag_index_service = get_service('TagIndexService',
+                                             shared=False)
+
+    def tearDown(self):
+        settings.TAGGING_CHANGE_FEED = self.feed
+        settings.TAG_INDEX_SNAPSHOT = self.snapshot
+        settings.TAG_INDEX_REFRESH_INTERVAL = self.interval
+        shutil.rmtree(self.directory)
+
+    def _changes(self):
+        sql = 'SELECT OBJECT_ID, TAG_ID, PRESENT ' \
+              'FROM TAGGING_CHANGES ' \
+              'ORDER BY ID'
+        return execute_sql_fetch_multiple(
+            lambda object_id, tag_id, present: (object_id, tag_id, present),
+            sql, ())
+
+    def test_tagging_service_records_changes(self):
+        tag, = self._create_tags([u'T'])
+        o, = self._create_objects(1)
+        first, second = self._tag(o, tag, tag)
+        self.tagging_service.delete(first)
+        self.tagging_service.delete_by_id(second.id)
+        self.assertEqual(self._changes(), [
+            (o.id, tag.id, True), (o.id, tag.id, True),
+            (o.id, tag.id, True), (o.id, tag.id, False)])
+
+    def test_tagging_service_records_no_changes_when_off(self):
+        settings.TAGGING_CHANGE_FEED = False
+        tag, = self._create_tags([u'T'])
+        o, = self._create_objects(1)
+        self._tag(o, tag)
+        self.assertEqual(self._changes(), [])
+
+    def test_counts_and_retrieves_by_filter(self):
+        beach, people, dog = self._create_tags([u'beach', u'people',
+                                                u'dog'])
+        o = self._create_objects(5)
+        self._tag(o[0], beach)
+        self._tag(o[1], beach, people)
+        self._tag(o[2], beach, dog)
+        self._tag(o[3], people)
+
+        service = self.tag_index_service
+        self.assertEqual(service.count_by_filter(u'beach'), 3L)
+        self.assertEqual(service.count_by_filter(
+            u'beach AND NOT people'), 2L)
+        self.assertEqual(service.count_by_filter(u'NOT beach'), 2L)
+        self.assertEqual(service.count_by_filter(
+            u'id:{0} OR dog'.format(people.id)), 3L)
+        self.assertEqual(service.count_by_filter(u'cat'), 0L)
+        self.assertEqual(
+            service.retrieve_ids_by_filter(u'beach OR people', limit=2L),
+            [o[0].id, o[1].id])
+        self.assertEqual(
+            service.retrieve_ids_by_filter(u'beach OR people', limit=2L,
+                                           after_id=o[1].id),
+            [o[2].id, o[3].id])
+
+    def test_agrees_with_object_service(self):
+        a, b, c = self._create_tags([u'a', u'b', u'c'])
+        objects = self._create_objects(12)
+        for i, object_ in enumerate(objects):
+            self._tag(object_, *[tag for n, tag in enumerate([a, b, c])
+                                 if i % (n + 2) == 0])
+        for expression in [u'a AND b', u'a OR c', u'NOT (a OR b)',
+                           u'(a OR b) AND NOT c', u'a AND NOT b AND NOT c']:
+            self.assertEqual(
+                self.tag_index_service.count_by_filter(expression),
+                self.object_service.count_by_filter(expression))
+            self.assertEqual(
+                self.tag_index_service.retrieve_ids_by_filter(
+                    expression, limit=100L),
+                [object_.id for object_ in
+                 self.object_service.retrieve_by_filter(expression,
+                                                        limit=100L)])
+
+    def test_follows_the_changes_of_the_taggings(self):
+        tag, = self._create_tags([u'T'])
+        o = self._create_objects(3)
+        taggings = self._tag(o[0], tag)
+        service = self.tag_index_service
+        self.assertEqual(service.count_by_filter(u'T'), 1L)
+
+        taggings += self._tag(o[1], tag) + self._tag(o[2], tag)
+        self.assertEqual(service.count_by_filter(u'T'), 3L)
+        self.tagging_service.delete(taggings[0])
+        self.assertEqual(service.retrieve_ids_by_filter(u'T'),
+                         [o[1].id, o[2].id])
+
+        new, = self._create_objects(1)
+        self.assertEqual(service.count_by_filter(u'NOT T'), 2L)
+        self.assertIn(new.id, service.retrieve_ids_by_filter(u'NOT T'))
+
+    def test_lookups_do_not_wait_for_a_refresh(self):
+        tag, = self._create_tags([u'T'])
+        o = self._create_objects(2)
+        self._tag(o[0], tag)
+        service = self.tag_index_service
+        self.assertEqual(service.count_by_filter(u'T'), 1L)
+
+        self._tag(o[1], tag)
+        # As if another thread were refreshing the index
+        with service._update_lock:
+            self.assertEqual(service.count_by_filter(u'T'), 1L)
+        self.assertEqual(service.count_by_filter(u'T'), 2L)
+
+    def test_follows_resolved_and_deleted_sets(self):
+        plugin = self.plugin_service.add(Plugin(name=u'P', module=u'M'))
+        first, second = self._create_tags([u'First', u'Second'])
+        o, = self._create_objects(1)
+        kept, _ = [self.tagging_service.add(
+            Tagging(tag_id=tag.id, object_id=o.id, plugin_id=plugin.id,
+                    plugin_set_id=1L)) for tag in (first, second)]
+        service = self.tag_index_service
+        self.assertEqual(service.count_by_filter(u'First OR Second'), 1L)
+        self.assertEqual(service.count_by_filter(u'First AND Second'), 1L)
+
+        self.tagging_service.resolve(kept)
+        self.assertEqual(service.count_by_filter(u'Second'), 0L)
+        self.tagging_service.delete_by_set_id(1L)
+        self.assertEqual(service.count_by_filter(u'First'), 0L)
+
+    def test_retrieve_cells_agrees_with_cube_service(self):
+        root, europe, iceland, norway, asia = self._create_tags(
+            [u'Places', u'Europe', u'Iceland', u'Norway', u'Asia'])
+        red, blue, keep = self._create_tags([u'Red', u'Blue', u'Keep'])
+        self.dimension_service.add(DimensionNode(
+            root_tag_id=root.id, node_tag_id=root.id, child_nodes=[
+                DimensionNode(root_tag_id=root.id, node_tag_id=europe.id,
+                              child_nodes=[
+                                  DimensionNode(root_tag_id=root.id,
+                                                node_tag_id=iceland.id),
+                                  DimensionNode(root_tag_id=root.id,
+                                                node_tag_id=norway.id)]),
+                DimensionNode(root_tag_id=root.id, node_tag_id=asia.id)]))
+        o = self._create_objects(5)
+        self._tag(o[0], iceland, red, keep)
+        self._tag(o[1], norway, red, keep)
+        self._tag(o[2], europe, blue)
+        self._tag(o[3], asia, blue, keep)
+        self._tag(o[4], red)
+
+        for axes, filter_tag_ids in [
+                ([CubeAxis(root_tag_id=root.id, level=1L),
+                  CubeAxis(tag_ids=[red.id, blue.id])], None),
+                ([CubeAxis(root_tag_id=root.id, level=2L)], None),
+                ([CubeAxis(tag_ids=[red.id, blue.id])], [keep.id])]:
+            for sample_size in (0L, 1L, 3L):
+                expected = self.cube_service.retrieve_cells(
+                    axes, filter_tag_ids, sample_size)
+                cells = self.tag_index_service.retrieve_cells(
+                    axes, filter_tag_ids, sample_size)
+                self.assertEqual(
+                    [(c.tag_ids, c.count, c.object_ids) for c in cells],
+                    [(c.tag_ids, c.count, c.object_ids) for c in expected])
+
+    def test_loads_from_snapshot(self):
+        tag, = self._create_tags([u'T'])
+        o = self._create_objects(2)
+        self._tag(o[0], tag)
+        self.assertGreater(self.tag_index_service.save_snapshot(), 0)
+        self._tag(o[1], tag)
+
+        service = get_service('TagIndexService', shared=False)
+        service.load()
+        self.assertEqual(service.retrieve_ids_by_filter(u'T'),
+                         [o[0].id, o[1].id])
+
+    def test_ignores_damaged_snapshot(self):
+        tag, = self._create_tags([u'T'])
+        o, = self._create_objects(1)
+        self._tag(o, tag)
+        with open(settings.TAG_INDEX_SNAPSHOT, 'wb') as f:
+            f.write('not a snapshot')
+        self.assertEqual(self.tag_index_service.count_by_filter(u'T'), 1L)
+
+    def test_prunes_old_changes(self):
+        tag, = self._create_tags([u'T'])
+        o, = self._create_objects(1)
+        self._tag(o, tag)
+        self.assertEqual(self.tag_index_service.prune_changes(), 0L)
+        retention = settings.TAG_INDEX_CHANGE_RETENTION
+        settings.TAG_INDEX_CHANGE_RETENTION = 0
+        try:
+            self.assertEqual(self.tag_index_service.prune_changes(), 1L)
+        finally:
+            settings.TAG_INDEX_CHANGE_RETENTION = retention
+        self.assertEqual(self._changes(), [])
+
+    def test_raises_on_invalid_arguments(self):
+        service = self.tag_index_service
+        for expression in [None, 'T', u'', u'(T']:
+            with self.assertRaises(ObjectCubeException):
+                service.count_by_filter(expression)
+        with self.assertRaises(ObjectCubeException):
+            service.retrieve_ids_by_filter(u'T', limit=1)
+        with self.assertRaises(ObjectCubeException):
+            service.retrieve_ids_by_filter(u'T', after_id=None)
+        with self.assertRaises(ObjectCubeException):
+            service.retrieve_cells([])
+        with self.assertRaises(ObjectCubeException):
+            service.retrieve_cells([CubeAxis(tag_ids=[1L])],
+                                   sample_size=-1L)
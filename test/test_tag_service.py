@@ -2,6 +2,8 @@ from base import ObjectCubeTestCase
 from objectcube.exceptions import ObjectCubeException
 from objectcube.data_objects import Tag, Concept, Plugin
 from objectcube.factory import get_service
+from objectcube.services.impl.postgresql.utils import \
+    execute_sql_fetch_single
 from random import shuffle
 
 
@@ -413,6 +415,26 @@ class TestTagService(ObjectCubeTestCase):
         self.assertNotIn(db_tag.id, ids)
         self.assertNotEqual(db_tag, db_tags[1])
 
+    def _row_version(self, tag):
+        sql = 'SELECT XMIN::TEXT AS XMIN FROM TAGS WHERE ID = %s'
+        return execute_sql_fetch_single(lambda xmin: xmin, sql, (tag.id,))
+
+    def test_tag_retrieve_or_create_does_not_write_existing_tags(self):
+        db_concept = self.concept_service.add(
+            Concept(title=u'test_concept', description=u'test concept'))
+        db_plugin = self.plugin_service.add(Plugin(name=u'Plugin',
+                                                   module=u'Module'))
+        db_tag, = self._add_test_tags(values=[u'a'], concept=db_concept,
+                                      plugin=db_plugin)
+        version = self._row_version(db_tag)
+
+        tag = self._create_test_tag(value=db_tag.value, concept=db_concept,
+                                    plugin=db_plugin)
+        self.assertEquals(self.tag_service.retrieve_or_create(tag), db_tag)
+        self.assertEquals(self.tag_service.retrieve_or_create_many([tag]),
+                          [db_tag])
+        self.assertEquals(self._row_version(db_tag), version)
+
     def test_tag_retrieve_or_create_raises_on_invalid_arguments(self):
         # Create a database with three tags: a, b, c
         concept1 = Concept(title=u'test_concept1', description=u'test concept')
@@ -456,18 +478,61 @@ class TestTagService(ObjectCubeTestCase):
             tag.concept_id = None
             self.tag_service.retrieve_or_create(tag)
 
-    def test_tag_retrieve_or_create_ambiguous_retrieval(self):
+    def test_tag_add_raises_on_duplicate_plugin_tag(self):
         db_concept = self.concept_service.add(
             Concept(title=u'test_concept', description=u'test concept'))
         db_plugin = self.plugin_service.add(Plugin(name=u'Plugin',
                                                    module=u'Module'))
-        self._add_test_tags(values=['a', 'b', 'b', 'c'],
+        self._add_test_tags(values=['a', 'b', 'c'],
                             concept=db_concept, plugin=db_plugin)
 
         tag_b = self._create_test_tag(value=u'Tag_b',
                                       concept=db_concept, plugin=db_plugin)
         with self.assertRaises(ObjectCubeException):
-            self.tag_service.retrieve_or_create(tag_b)
+            self.tag_service.add(tag_b)
+        self.assertEquals(self.tag_service.retrieve_or_create(tag_b).value,
+                          u'Tag_b')
+        self.assertEquals(self.tag_service.count(), 3)
+
+    # ==== retrieve_or_create_many()
+
+    def test_tag_retrieve_or_create_many_returns_tags_in_input_order(self):
+        db_concept = self.concept_service.add(
+            Concept(title=u'test_concept', description=u'test concept'))
+        db_plugin = self.plugin_service.add(Plugin(name=u'Plugin',
+                                                   module=u'Module'))
+        db_tags = self._add_test_tags(values=[u'a', u'b'],
+                                      concept=db_concept, plugin=db_plugin)
+        ids = self._tags_to_id_set(db_tags)
+
+        values = [u'Tag_b', u'Tag_x', u'Tag_a', u'Tag_x', u'Tag_y']
+        tags = self.tag_service.retrieve_or_create_many(
+            [self._create_test_tag(value=value, concept=db_concept,
+                                   plugin=db_plugin) for value in values],
+            page_size=2L)
+
+        self.assertEquals(values, [t.value for t in tags])
+        self.assertIn(tags[0].id, ids)
+        self.assertIn(tags[2].id, ids)
+        self.assertNotIn(tags[1].id, ids)
+        self.assertEquals(tags[1].id, tags[3].id)
+        self.assertEquals(self.tag_service.count(), 4)
+
+    def test_tag_retrieve_or_create_many_validates_all_tags_first(self):
+        db_concept = self.concept_service.add(
+            Concept(title=u'test_concept', description=u'test concept'))
+        db_plugin = self.plugin_service.add(Plugin(name=u'Plugin',
+                                                   module=u'Module'))
+        tags = [self._create_test_tag(value=u'a', concept=db_concept,
+                                      plugin=db_plugin),
+                self._create_test_tag(value=u'b', concept=db_concept)]
+
+        with self.assertRaises(ObjectCubeException):
+            self.tag_service.retrieve_or_create_many(tags)
+        with self.assertRaises(ObjectCubeException):
+            self.tag_service.retrieve_or_create_many(tags[:1], page_size=0L)
+        self.assertEquals(self.tag_service.count(), 0)
+        self.assertEquals(self.tag_service.retrieve_or_create_many([]), [])
 
     # ==== update()
 
@@ -756,6 +821,40 @@ class TestTagService(ObjectCubeTestCase):
             offset += max_fetch
         self.assertEquals(expected_id_set, all_retrieved_set)
 
+    def test_tag_retrieve_after_id_pages_in_id_order(self):
+        expected_ids = sorted(self._tags_to_id_set(
+            self._add_test_tags(range(23))))
+
+        retrieved_ids = []
+        after_id = 0L
+        while True:
+            tags = self.tag_service.retrieve(limit=10L, after_id=after_id)
+            if not tags:
+                break
+            retrieved_ids.extend(t.id for t in tags)
+            after_id = tags[-1].id
+        self.assertEquals(expected_ids, retrieved_ids)
+
+    def test_tag_retrieve_by_concept_id_after_id(self):
+        db_concept = self.concept_service.add(
+            Concept(title=u'test_concept', description=u'test concept'))
+        expected_ids = sorted(self._tags_to_id_set(
+            self._add_test_tags(range(7), concept=db_concept)))
+
+        first = self.tag_service.retrieve_by_concept_id(db_concept.id,
+                                                        limit=3L)
+        rest = self.tag_service.retrieve_by_concept_id(
+            db_concept.id, after_id=first[-1].id)
+        self.assertEquals(expected_ids, [t.id for t in first + rest])
+
+    def test_tag_retrieve_raises_on_invalid_after_id(self):
+        with self.assertRaises(ObjectCubeException):
+            self.tag_service.retrieve(after_id=None)
+        with self.assertRaises(ObjectCubeException):
+            self.tag_service.retrieve_by_value(u'V', after_id='1')
+        with self.assertRaises(ObjectCubeException):
+            self.tag_service.retrieve_by_regex(value=u'V', after_id=1)
+
     def test_tag_fetch_tag_outside_offset_return_empty_list(self):
         number_of_tags = 20
         for i in range(number_of_tags):
@@ -360,6 +360,99 @@ class TestTaggingService(ObjectCubeTestCase):
         self.assertEqual(count, self.tagging_service.count(),
                          msg='Illegal taggings added')
 
+    # ==== add_many()
+
+    def _create_batch(self, db_tags, db_objects, plugin_id=None,
+                      plugin_set_id=None):
+        return [Tagging(tag_id=tag.id, object_id=object_.id,
+                        meta=u'Meta_' + unicode(tag.id),
+                        plugin_id=plugin_id, plugin_set_id=plugin_set_id)
+                for tag in db_tags for object_ in db_objects]
+
+    def test_tagging_add_many_returns_taggings_in_order(self):
+        (db_plugin, db_tags, db_objects, db_taggings) = \
+            self._set_up_db(5, 4, 0)
+        batch = self._create_batch(db_tags, db_objects, db_plugin.id, 1L)
+
+        added = self.tagging_service.add_many(batch)
+
+        self.assertEquals(len(added), len(batch))
+        self.assertEquals(self.tagging_service.count(), len(batch))
+        for tagging, db_tagging in zip(batch, added):
+            self.assertTrue(db_tagging.id)
+            self.assertEquals(tagging.tag_id, db_tagging.tag_id)
+            self.assertEquals(tagging.object_id, db_tagging.object_id)
+            self.assertEquals(tagging.meta, db_tagging.meta)
+            self.assertEquals(db_plugin.id, db_tagging.plugin_id)
+            self.assertEquals(1L, db_tagging.plugin_set_id)
+        self.assertEquals(len(set(t.id for t in added)), len(batch))
+
+    def test_tagging_add_many_returns_equal_taggings_once_each(self):
+        (db_plugin, db_tags, db_objects, db_taggings) = \
+            self._set_up_db(2, 1, 0)
+        batch = self._create_batch(db_tags, db_objects) * 2
+
+        added = self.tagging_service.add_many(batch, page_size=3L)
+
+        self.assertEquals([(t.tag_id, t.object_id) for t in added],
+                          [(t.tag_id, t.object_id) for t in batch])
+        self.assertEquals(len(set(t.id for t in added)), len(batch))
+
+    def test_tagging_add_many_spans_pages(self):
+        (db_plugin, db_tags, db_objects, db_taggings) = \
+            self._set_up_db(7, 3, 0)
+        batch = self._create_batch(db_tags, db_objects)
+
+        added = self.tagging_service.add_many(iter(batch), page_size=4L)
+        self.assertEquals(len(added), len(batch))
+        self.assertEquals(self.tagging_service.count(), len(batch))
+
+    def test_tagging_add_many_without_returning_gives_count(self):
+        (db_plugin, db_tags, db_objects, db_taggings) = \
+            self._set_up_db(3, 2, 0)
+        batch = self._create_batch(db_tags, db_objects)
+
+        added = self.tagging_service.add_many(batch, returning=False)
+        self.assertEquals(added, len(batch))
+        self.assertEquals(self.tagging_service.count(), len(batch))
+
+    def test_tagging_add_many_empty_batch(self):
+        self.assertEquals(self.tagging_service.add_many([]), [])
+        self.assertEquals(self.tagging_service.count(), 0)
+
+    def test_tagging_add_many_illegal_tagging_adds_nothing(self):
+        (db_plugin, db_tags, db_objects, db_taggings) = \
+            self._set_up_db(3, 2, 0)
+        batch = self._create_batch(db_tags, db_objects)
+
+        with self.assertRaises(ObjectCubeException):
+            self.tagging_service.add_many(batch + [db_tags[0]],
+                                          page_size=2L)
+        with self.assertRaises(ObjectCubeException):
+            self.tagging_service.add_many(batch + [None], page_size=2L)
+        with self.assertRaises(ObjectCubeException):
+            self.tagging_service.add_many(
+                batch + self._create_batch(db_tags, db_objects,
+                                           plugin_set_id=1L))
+        with self.assertRaises(ObjectCubeException):
+            self.tagging_service.add_many(
+                [Tagging(tag_id=db_tags[0].id, object_id=-1L)])
+        self.assertEquals(self.tagging_service.count(), 0)
+
+    def test_tagging_add_many_with_id_fails(self):
+        (db_plugin, db_tags, db_objects, db_taggings) = \
+            self._set_up_db(1, 1, 1)
+
+        with self.assertRaises(ObjectCubeException):
+            self.tagging_service.add_many(db_taggings)
+        self.assertEquals(self.tagging_service.count(), 1)
+
+    def test_tagging_add_many_raises_on_invalid_page_size(self):
+        with self.assertRaises(ObjectCubeException):
+            self.tagging_service.add_many([], page_size=0L)
+        with self.assertRaises(ObjectCubeException):
+            self.tagging_service.add_many([], page_size=10)
+
     # ==== update()
 
     def test_tagging_update_works(self):
@@ -1304,6 +1397,41 @@ class TestTaggingService(ObjectCubeTestCase):
             self.tagging_service.retrieve_by_tag_id(
                 tag_id=db_taggings[0].tag_id, limit=[])
 
+    def test_tagging_retrieve_by_tag_id_after_id(self):
+        (db_plugin, db_tags, db_objects, db_taggings) = \
+            self._set_up_db(1, 1, 17)
+        expected_ids = sorted(self._tags_to_id_set(db_taggings))
+
+        first = self.tagging_service.retrieve_by_tag_id(
+            tag_id=db_tags[0].id, limit=10L)
+        rest = self.tagging_service.retrieve_by_tag_id(
+            tag_id=db_tags[0].id, after_id=first[-1].id)
+        self.assertEquals(expected_ids, [t.id for t in first + rest])
+
+    def test_tagging_retrieve_by_tag_id_raises_on_invalid_after_id(self):
+        with self.assertRaises(ObjectCubeException):
+            self.tagging_service.retrieve_by_tag_id(tag_id=1L, after_id=None)
+        with self.assertRaises(ObjectCubeException):
+            self.tagging_service.retrieve_by_tag_id(tag_id=1L, after_id=1)
+
+    def test_tagging_iter_by_tag_id_yields_all_taggings(self):
+        (db_plugin, db_tags, db_objects, db_taggings) = \
+            self._set_up_db(1, 1, 43)
+        expected_ids = sorted(self._tags_to_id_set(db_taggings))
+
+        taggings = self.tagging_service.iter_by_tag_id(db_tags[0].id)
+        self.assertEquals(expected_ids, [t.id for t in taggings])
+
+    def test_tagging_iter_by_object_id_stops_early(self):
+        (db_plugin, db_tags, db_objects, db_taggings) = \
+            self._set_up_db(1, 1, 10)
+        taggings = self.tagging_service.iter_by_object_id(db_objects[0].id)
+        first = next(taggings)
+        taggings.close()
+        self.assertEquals(min(self._tags_to_id_set(db_taggings)), first.id)
+        self.assertEquals(10, len(self.tagging_service.retrieve_by_object_id(
+            db_objects[0].id, limit=20L)))
+
     # ==== retrieve_by_object_id()
 
     def test_tagging_retrieve_by_object_id_offset_limit(self):
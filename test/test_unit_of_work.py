@@ -0,0 +1,82 @@
+from base import ObjectCubeTestCase
+from objectcube.contexts import Connection, UnitOfWork, get_unit_of_work
+from objectcube.data_objects import Object
+from objectcube.db import get_pool_stats
+from objectcube.exceptions import ObjectCubeException
+from objectcube.factory import get_service
+
+
+class TestUnitOfWork(ObjectCubeTestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestUnitOfWork, self).__init__(*args, **kwargs)
+        self.object_service = get_service('ObjectService')
+
+    def test_unit_of_work_is_only_active_inside_block(self):
+        self.assertIsNone(get_unit_of_work())
+        with UnitOfWork() as unit_of_work:
+            self.assertIs(get_unit_of_work(), unit_of_work)
+        self.assertIsNone(get_unit_of_work())
+
+    def test_statements_share_one_connection(self):
+        with UnitOfWork():
+            with Connection() as first:
+                pass
+            with Connection() as second:
+                pass
+            self.assertIs(first, second)
+
+    def test_service_calls_use_one_checkout(self):
+        checkouts = get_pool_stats()['checkouts']
+        with UnitOfWork():
+            self.object_service.add(Object(name=u'N1', digest=u'D1'))
+            self.object_service.add(Object(name=u'N2', digest=u'D2'))
+            self.object_service.count()
+        self.assertEquals(get_pool_stats()['checkouts'], checkouts + 1)
+
+    def test_commits_when_block_ends(self):
+        with UnitOfWork():
+            self.object_service.add(Object(name=u'N1', digest=u'D1'))
+            self.object_service.add(Object(name=u'N2', digest=u'D2'))
+        self.assertEquals(self.object_service.count(), 2)
+
+    def test_rolls_back_when_block_raises(self):
+        with self.assertRaises(ValueError):
+            with UnitOfWork():
+                self.object_service.add(Object(name=u'N1', digest=u'D1'))
+                raise ValueError()
+        self.assertEquals(self.object_service.count(), 0)
+
+    def test_rolls_back_when_statement_fails(self):
+        with UnitOfWork():
+            self.object_service.add(Object(name=u'N1', digest=u'D1'))
+            with self.assertRaises(ObjectCubeException):
+                self.object_service.add(Object(name=u'N1', digest=u'D1'))
+        self.assertEquals(self.object_service.count(), 0)
+
+    def test_nested_unit_of_work_joins_outer(self):
+        with self.assertRaises(ValueError):
+            with UnitOfWork():
+                with UnitOfWork():
+                    self.object_service.add(Object(name=u'N1', digest=u'D1'))
+                self.assertEquals(self.object_service.count(), 1)
+                raise ValueError()
+        self.assertEquals(self.object_service.count(), 0)
+
+    def test_nested_unit_of_work_rolls_back_alone(self):
+        with UnitOfWork():
+            self.object_service.add(Object(name=u'N1', digest=u'D1'))
+            with self.assertRaises(ObjectCubeException):
+                with UnitOfWork():
+                    self.object_service.add(Object(name=u'N2', digest=u'D2'))
+                    self.object_service.add(Object(name=u'N1', digest=u'D1'))
+            self.object_service.add(Object(name=u'N3', digest=u'D3'))
+        self.assertEquals(
+            sorted(o.name for o in self.object_service.retrieve()),
+            [u'N1', u'N3'])
+
+    def test_nested_unit_of_work_is_active_inside_block(self):
+        with UnitOfWork() as outer:
+            with UnitOfWork() as inner:
+                self.assertIs(get_unit_of_work(), inner)
+            self.assertIs(get_unit_of_work(), outer)
@@ -0,0 +1,65 @@
+import hashlib
+import unittest
+import cStringIO
+
+from objectcube.exceptions import ObjectCubeException
+from objectcube.utils import TREE_CHUNK_SIZE, digest_algorithm, \
+    digest_from_stream, digest_from_value, hash_and_copy, md5_from_value
+from objectcube import settings
+
+
+class TestUtils(unittest.TestCase):
+    def test_md5_digests_have_no_prefix(self):
+        self.assertEqual(digest_from_value('data', 'md5'),
+                         hashlib.md5('data').hexdigest())
+        self.assertEqual(md5_from_value('data'),
+                         hashlib.md5('data').hexdigest())
+
+    def test_other_digests_are_prefixed_with_the_algorithm(self):
+        self.assertEqual(digest_from_value('data', 'sha256'),
+                         'sha256-' + hashlib.sha256('data').hexdigest())
+
+    def test_default_algorithm_comes_from_settings(self):
+        original = settings.DIGEST_ALGORITHM
+        settings.DIGEST_ALGORITHM = 'sha1'
+        try:
+            self.assertEqual(digest_from_value('data'),
+                             'sha1-' + hashlib.sha1('data').hexdigest())
+        finally:
+            settings.DIGEST_ALGORITHM = original
+
+    def test_unknown_algorithm_raises(self):
+        with self.assertRaises(ObjectCubeException):
+            digest_from_value('data', 'crc32')
+        with self.assertRaises(ObjectCubeException):
+            digest_algorithm('crc32-1234')
+
+    def test_digest_algorithm(self):
+        self.assertEqual(digest_algorithm(md5_from_value('data')), 'md5')
+        self.assertEqual(
+            digest_algorithm(digest_from_value('data', 'sha256tree')),
+            'sha256tree')
+
+    def test_tree_digest_hashes_the_chunk_digests(self):
+        data = 'a' * TREE_CHUNK_SIZE + 'b' * TREE_CHUNK_SIZE + 'c'
+        leaves = [hashlib.sha256(data[i:i + TREE_CHUNK_SIZE]).digest()
+                  for i in range(0, len(data), TREE_CHUNK_SIZE)]
+        expected = 'sha256tree-' + hashlib.sha256(''.join(leaves)).hexdigest()
+        self.assertEqual(digest_from_value(data, 'sha256tree'), expected)
+
+    def test_tree_digest_does_not_depend_on_block_size(self):
+        data = 'abc' * (TREE_CHUNK_SIZE / 2)
+        digest = digest_from_value(data, 'sha256tree')
+        for block_size in [1000, TREE_CHUNK_SIZE - 1, TREE_CHUNK_SIZE,
+                           TREE_CHUNK_SIZE + 1, 3 * TREE_CHUNK_SIZE]:
+            self.assertEqual(digest_from_stream(cStringIO.StringIO(data),
+                                                'sha256tree', block_size),
+                             digest)
+
+    def test_hash_and_copy_returns_digest_and_size(self):
+        dst = cStringIO.StringIO()
+        digest, size = hash_and_copy(cStringIO.StringIO('data'), dst,
+                                     algorithm='sha256tree')
+        self.assertEqual(digest, digest_from_value('data', 'sha256tree'))
+        self.assertEqual(size, 4)
+        self.assertEqual(dst.getvalue(), 'data')